@@ -1,8 +1,345 @@
-from langchain_community.chat_message_histories import ChatMessageHistory
+# app/agent/history.py
+# ─────────────────────────────────────────────────────────────────────────────
+# Per-session conversation memory with a flat prompt footprint.
+#
+# A session keeps its most recent turns verbatim up to `token_budget` tokens;
+# turns that fall out of that window are folded into a rolling summary by a
+# background LLM call (never on the reply path), and `messages` is the summary
+# (one SystemMessage) followed by the window. So however long a conversation
+# runs, what a turn sends stays around budget + summary tokens.
+#
+# Sessions live in an LRU of `max_sessions`; one idle longer than `ttl` (or
+# pushed out of the LRU) is written to `spill_dir` as JSON and loaded back on
+# its next message. Without a spill dir it is simply forgotten. A session a
+# turn is still using (`HistoryStore.session`) is never evicted, and one that
+# is being written out is handed back as is rather than re-read half-written.
+# Disk work never runs on the event loop: `session()` restores a cold session
+# in a worker thread, and expiry plus spilling run on a background sweeper.
+from __future__ import annotations
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import AsyncIterator, Deque, Dict, List, Optional, Sequence, Tuple
 
-_histories = {}
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import (
+    BaseMessage, HumanMessage, SystemMessage, messages_from_dict, messages_to_dict,
+)
 
-def get_history(session_id: str) -> ChatMessageHistory:
-    if session_id not in _histories:
-        _histories[session_id] = ChatMessageHistory()
-    return _histories[session_id]
\ No newline at end of file
+from app import metrics
+from app.config import settings
+import logging
+log = logging.getLogger(__name__)
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+MAX_PENDING = 64   # unsummarised messages kept while the summariser keeps failing
+
+_SUMMARIZE = (
+    "You maintain a running summary of a conversation between a student and a "
+    "study assistant. Update the summary with the new messages below. Keep the "
+    "topics, facts and open questions the student may refer back to; drop "
+    "pleasantries. Answer with the updated summary only, at most {words} words."
+    "\n\nCURRENT SUMMARY:\n{summary}\n\nNEW MESSAGES:\n{turns}"
+)
+
+_summarizer = ThreadPoolExecutor(2, thread_name_prefix="history-summary")
+
+
+def _tokens(message: BaseMessage) -> int:
+    from app.rag.context_packer import count_tokens
+    return count_tokens(str(message.content), settings.history_summary_model) + 4
+
+
+class SummarizingHistory(BaseChatMessageHistory):
+    """Recent turns verbatim within `token_budget`, older ones as a rolling summary."""
+
+    def __init__(self, session_id: str, token_budget: int, summary_tokens: int, model: str):
+        self.session_id = session_id
+        self.token_budget = token_budget
+        self.summary_tokens = summary_tokens
+        self.model = model
+        self.summary = ""
+        self.touched = time.monotonic()
+        self.users = 0                          # turns in flight (HistoryStore.session)
+        self.evictions = 0                      # which spill of this session is current
+        self._window: Deque[Tuple[BaseMessage, int]] = deque()
+        self._window_tokens = 0
+        self._pending: List[BaseMessage] = []    # left the window, not summarised yet
+        self._folding = False
+        self._lock = threading.Lock()
+        self._spill_lock = threading.Lock()     # one writer of this session's spill file
+
+    # ── BaseChatMessageHistory ───────────────────────────────────────────────
+    @property
+    def messages(self) -> List[BaseMessage]:
+        with self._lock:
+            head = [SystemMessage(content=SUMMARY_PREFIX + self.summary)] if self.summary else []
+            return head + [m for m, _ in self._window]
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        sized = [(m, _tokens(m)) for m in messages]
+        with self._lock:
+            for m, n in sized:
+                self._window.append((m, n))
+                self._window_tokens += n
+            self._trim()
+            fold = bool(self._pending) and not self._folding
+            self._folding = self._folding or fold
+        if fold:
+            _summarizer.submit(self._fold)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.summary = ""
+            self._window.clear()
+            self._window_tokens = 0
+            self._pending.clear()
+
+    # ── window / summary ─────────────────────────────────────────────────────
+    def _trim(self) -> None:
+        # caller holds self._lock; whole turns leave, the latest one always stays
+        while self._window_tokens > self.token_budget and len(self._window) > 2:
+            self._evict_one()
+            while self._window and not isinstance(self._window[0][0], HumanMessage):
+                self._evict_one()
+        del self._pending[:-MAX_PENDING]
+
+    def _evict_one(self) -> None:
+        m, n = self._window.popleft()
+        self._window_tokens -= n
+        self._pending.append(m)
+
+    def _fold(self) -> None:
+        """Fold pending messages into the summary (summariser thread)."""
+        from app.agent.runtime import get_llm
+        while True:
+            with self._lock:
+                batch, summary = list(self._pending), self.summary
+                if not batch:
+                    self._folding = False
+                    return
+            turns = "\n".join(f"{m.type}: {m.content}" for m in batch)
+            prompt = _SUMMARIZE.format(words=int(self.summary_tokens * 0.75),
+                                       summary=summary or "(none)", turns=turns)
+            try:
+                with metrics.span(metrics.history_summary_seconds):
+                    response = get_llm(self.model, 0.0).invoke(prompt)
+                metrics.record_usage(self.model, response)
+            except Exception as e:
+                log.warning("[HISTORY] session=%s summary failed: %r", self.session_id, e)
+                with self._lock:
+                    self._folding = False     # the next message retries
+                return
+            with self._lock:
+                self.summary = str(response.content).strip()[: self.summary_tokens * 6]
+                folded = {id(m) for m in batch}
+                self._pending = [m for m in self._pending if id(m) not in folded]
+            log.debug("[HISTORY] session=%s folded=%s", self.session_id, len(batch))
+
+    # ── spill ────────────────────────────────────────────────────────────────
+    def dump(self) -> dict:
+        with self._lock:
+            return {
+                "summary": self.summary,
+                "window": messages_to_dict([m for m, _ in self._window]),
+                "pending": messages_to_dict(self._pending),
+            }
+
+    def load(self, data: dict) -> None:
+        with self._lock:
+            self.summary = data.get("summary", "")
+            self._pending = messages_from_dict(data.get("pending", []))
+            for m in messages_from_dict(data.get("window", [])):
+                n = _tokens(m)
+                self._window.append((m, n))
+                self._window_tokens += n
+
+
+class HistoryStore:
+    """
+    LRU + idle-TTL map of sessions; evicted ones spill to `spill_dir` if set.
+
+    Sessions are restored outside the store lock (one restore per session at a
+    time) and evicted by a sweeper thread every `SWEEP_INTERVAL` seconds, or
+    sooner once the LRU is over `max_sessions`.
+    """
+
+    SWEEP_INTERVAL = 30.0
+    _RESTORE_LOCKS = 64
+
+    def __init__(self, max_sessions: int, ttl: float, spill_dir: str = "", spill_ttl: float = 0.0):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.spill_dir = Path(spill_dir) if spill_dir else None
+        self.spill_ttl = spill_ttl
+        self._sessions: "OrderedDict[str, SummarizingHistory]" = OrderedDict()
+        self._spilling: Dict[str, SummarizingHistory] = {}   # evicted, file not written yet
+        self._lock = threading.Lock()
+        self._restoring = [threading.Lock() for _ in range(self._RESTORE_LOCKS)]
+        self._wake = threading.Event()
+        self._sweeper: Optional[threading.Thread] = None
+
+    def _path(self, session_id: str) -> Path:
+        return self.spill_dir / (hashlib.blake2b(session_id.encode(), digest_size=12).hexdigest() + ".json")
+
+    def _new(self, session_id: str) -> SummarizingHistory:
+        return SummarizingHistory(
+            session_id,
+            token_budget=settings.history_token_budget,
+            summary_tokens=settings.history_summary_tokens,
+            model=settings.history_summary_model,
+        )
+
+    def _cached(self, session_id: str, hold: bool) -> Optional[SummarizingHistory]:
+        """The in-memory session (taken back if it is being spilled), or None."""
+        with self._lock:
+            hist = self._sessions.get(session_id)
+            if hist is None:
+                hist = self._spilling.pop(session_id, None)
+                if hist is None:
+                    return None
+                self._sessions[session_id] = hist
+            self._sessions.move_to_end(session_id)
+            hist.touched = time.monotonic()
+            hist.users += hold
+            return hist
+
+    def get(self, session_id: str, hold: bool = False) -> SummarizingHistory:
+        """The session, restored from disk if needed (blocking: not on the event loop)."""
+        hist = self._cached(session_id, hold)
+        if hist is not None:
+            return hist
+        self._start_sweeper()
+        with self._restoring[hash(session_id) % self._RESTORE_LOCKS]:
+            hist = self._cached(session_id, hold)      # restored by a concurrent get()
+            if hist is not None:
+                return hist
+            # not in memory nor being spilled: its file, if any, is complete
+            hist = self._restore(session_id)
+            with self._lock:
+                self._sessions[session_id] = hist
+                hist.users += hold
+                if len(self._sessions) > self.max_sessions:
+                    self._wake.set()
+        return hist
+
+    @asynccontextmanager
+    async def session(self, session_id: str) -> AsyncIterator[SummarizingHistory]:
+        """The session, kept in memory until the block (one turn) ends."""
+        hist = self._cached(session_id, hold=True)
+        if hist is None:
+            hist = await asyncio.to_thread(self.get, session_id, True)
+        try:
+            yield hist
+        finally:
+            with self._lock:
+                hist.users -= 1
+                hist.touched = time.monotonic()
+
+    # ── eviction ─────────────────────────────────────────────────────────────
+    def _start_sweeper(self) -> None:
+        if self._sweeper is None:
+            with self._lock:
+                if self._sweeper is None:
+                    self._sweeper = threading.Thread(target=self._sweep_loop, name="history-sweeper", daemon=True)
+                    self._sweeper.start()
+
+    def _sweep_loop(self) -> None:
+        while True:
+            self._wake.wait(self.SWEEP_INTERVAL)
+            self._wake.clear()
+            try:
+                self.sweep()
+            except Exception as e:
+                log.warning("[HISTORY] sweep failed: %r", e)
+
+    def sweep(self) -> int:
+        """Evict idle sessions and the LRU overflow, spilling them to disk."""
+        with self._lock:
+            evicted = self._expired(time.monotonic())
+        for hist, gen in evicted:
+            self._spill(hist, gen)
+        return len(evicted)
+
+    def _expired(self, now: float) -> List[Tuple[SummarizingHistory, int]]:
+        # caller holds self._lock; oldest first, so stop at the first live one
+        out = []
+        for sid, hist in list(self._sessions.items()):
+            if len(self._sessions) <= self.max_sessions and now - hist.touched <= self.ttl:
+                break
+            if hist.users:
+                continue        # a turn still appends to it
+            out.append(self._evict(sid))
+        return out
+
+    def _evict(self, sid: str) -> Tuple[SummarizingHistory, int]:
+        # caller holds self._lock
+        hist = self._sessions.pop(sid)
+        hist.evictions += 1
+        self._spilling[sid] = hist
+        return hist, hist.evictions
+
+    def _restore(self, session_id: str) -> SummarizingHistory:
+        hist = self._new(session_id)
+        if self.spill_dir is None:
+            return hist
+        path = self._path(session_id)
+        try:
+            if self.spill_ttl and time.time() - path.stat().st_mtime > self.spill_ttl:
+                path.unlink(missing_ok=True)
+                return hist
+            hist.load(json.loads(path.read_text()))
+            path.unlink(missing_ok=True)
+            log.debug("[HISTORY] session=%s restored", session_id)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            log.warning("[HISTORY] session=%s unreadable spill: %r", session_id, e)
+        return hist
+
+    def _spill(self, hist: SummarizingHistory, gen: int) -> None:
+        sid = hist.session_id
+        with hist._spill_lock:
+            with self._lock:
+                # taken back by get() (live again) or evicted anew (a later spill writes it)
+                current = self._spilling.get(sid) is hist and hist.evictions == gen
+            if current and self.spill_dir is not None:
+                try:
+                    self.spill_dir.mkdir(parents=True, exist_ok=True)
+                    path = self._path(sid)
+                    tmp = path.with_suffix(".tmp")
+                    tmp.write_text(json.dumps(hist.dump()))
+                    os.replace(tmp, path)
+                except Exception as e:
+                    log.warning("[HISTORY] session=%s spill failed: %r", sid, e)
+            with self._lock:
+                if self._spilling.get(sid) is hist and hist.evictions == gen:
+                    del self._spilling[sid]   # restored from the file from now on
+
+    def flush(self) -> None:
+        """Spill every session in memory (shutdown)."""
+        with self._lock:
+            evicted = [self._evict(sid) for sid in list(self._sessions)]
+        for hist, gen in evicted:
+            self._spill(hist, gen)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+histories = HistoryStore(
+    settings.history_max_sessions,
+    settings.history_ttl,
+    settings.history_spill_dir,
+    settings.history_spill_ttl,
+)
+
+def get_history(session_id: str) -> SummarizingHistory:
+    return histories.get(session_id)
@@ -0,0 +1,101 @@
+# app/agent/runtime.py
+# ──────────────────────────────────────────────────────────────
+# Long-lived LLM runtime shared by every chat.
+#
+# Building ChatOpenAI (and its httpx client) per message costs a TLS handshake
+# and a pile of object construction on the hot path. Everything here is built
+# once per process; per-chat data (chat_id, session_id) travels in the
+# RunnableConfig instead of being closed over.
+#
+# Nothing is built at import time: langchain_openai alone takes over a second
+# to import, so it is pulled in by the first accessor call (normally the
+# warm-up in app.warmup) rather than by `import app.main`.
+from __future__ import annotations
+import asyncio
+from functools import lru_cache
+from typing import TYPE_CHECKING
+
+import httpx
+
+from app.config import settings
+
+if TYPE_CHECKING:
+    from langchain_openai import ChatOpenAI
+    from app.vector_store.embed_batcher import BatchingEmbeddings
+
+OPENAI_BASE = "https://api.openai.com/v1"
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=settings.llm_max_connections,
+        max_keepalive_connections=settings.llm_max_keepalive,
+    )
+
+@lru_cache(maxsize=1)
+def http_client() -> httpx.Client:
+    return httpx.Client(limits=_limits(), timeout=settings.llm_timeout)
+
+@lru_cache(maxsize=1)
+def http_async_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(limits=_limits(), timeout=settings.llm_timeout)
+
+@lru_cache(maxsize=None)
+def get_llm(model: str, temperature: float = 0.2) -> ChatOpenAI:
+    """One ChatOpenAI per (model, temperature), all on the pooled transports."""
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(
+        model=model,
+        temperature=temperature,
+        openai_api_key=settings.openai_key,
+        http_client=http_client(),
+        http_async_client=http_async_client(),
+        stream_usage=True,   # token counts for /metrics also when replies stream
+    )
+
+@lru_cache(maxsize=1)
+def get_embeddings() -> "BatchingEmbeddings":
+    """The process-wide embedder: every query/ingest embedding goes through one batcher."""
+    from langchain_openai import OpenAIEmbeddings
+    from app.vector_store.embed_batcher import BatchingEmbeddings
+    return BatchingEmbeddings(
+        OpenAIEmbeddings(
+            model=settings.embed_model,
+            openai_api_key=settings.openai_key,
+            http_client=http_client(),
+            http_async_client=http_async_client(),
+        ),
+        window_ms=settings.embed_batch_window_ms,
+        max_inputs=settings.embed_batch_max_inputs,
+        max_tokens=settings.embed_batch_max_tokens,
+        max_in_flight=settings.embed_max_in_flight,
+    )
+
+@lru_cache(maxsize=1)
+def get_ingest_embeddings() -> "BatchingEmbeddings":
+    """
+    Embedder for background PDF ingestion: same upstream client, its own batcher.
+
+    An upload sends hundreds of chunks; through the shared batcher they would
+    hold its in-flight slots and a student's one-line query would queue behind
+    them. Here they only ever use `ingest_embed_max_in_flight` requests.
+    """
+    from app.vector_store.embed_batcher import BatchingEmbeddings
+    return BatchingEmbeddings(
+        get_embeddings().inner,
+        window_ms=settings.embed_batch_window_ms,
+        max_inputs=settings.embed_batch_max_inputs,
+        max_tokens=settings.embed_batch_max_tokens,
+        max_in_flight=settings.ingest_embed_max_in_flight,
+    )
+
+async def open_connections() -> None:
+    """Put a live TLS connection to the API in both pools before the first turn."""
+    url = f"{OPENAI_BASE}/models"
+    kw  = {"headers": {"Authorization": f"Bearer {settings.openai_key}"}, "timeout": settings.warmup_timeout}
+    # async pool: chat completions; sync pool: the embedding batcher's threads
+    for r in await asyncio.gather(
+        http_async_client().get(url, **kw),
+        asyncio.to_thread(http_client().get, url, **kw),
+    ):
+        r.raise_for_status()
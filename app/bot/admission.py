@@ -0,0 +1,87 @@
+# app/bot/admission.py
+# ──────────────────────────────────────────────────────────────
+from __future__ import annotations
+import asyncio
+from collections import Counter
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict
+
+from app.config import settings
+import logging
+log = logging.getLogger(__name__)
+
+
+class Busy(Exception):
+    """Raised when a turn cannot be queued; the caller should ask to retry."""
+
+
+class AdmissionController:
+    """
+    Gatekeeper for question turns (event-loop only, no threads).
+
+    * at most `max_concurrent` turns run at once across all chats
+    * a chat runs one turn at a time; up to `max_per_chat_queue` more wait behind it
+    * at most `max_queued` turns wait globally; beyond that → `Busy` immediately
+    """
+
+    def __init__(self, max_concurrent: int, max_queued: int, max_per_chat_queue: int):
+        self.max_concurrent     = max_concurrent
+        self.max_queued         = max_queued
+        self.max_per_chat_queue = max_per_chat_queue
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self._chat_locks: Dict[int, asyncio.Lock] = {}
+        self._per_chat: Counter = Counter()   # admitted turns (running + waiting)
+        self._waiting = 0                      # admitted but not yet running
+        self._running = 0
+
+    @property
+    def waiting(self) -> int:
+        return self._waiting
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    @asynccontextmanager
+    async def turn(self, chat_id: int) -> AsyncIterator[None]:
+        if self._per_chat[chat_id] > self.max_per_chat_queue or self._waiting >= self.max_queued:
+            log.warning("[ADMIT] busy chat=%s waiting=%s", chat_id, self._waiting)
+            raise Busy()
+
+        lock = self._chat_locks.setdefault(chat_id, asyncio.Lock())
+        self._per_chat[chat_id] += 1
+        self._waiting += 1
+        acquired = 0
+        try:
+            await lock.acquire()
+            acquired = 1
+            await self._slots.acquire()
+            acquired = 2
+        finally:
+            self._waiting -= 1
+            if acquired < 2:
+                if acquired:
+                    lock.release()
+                self._release_chat(chat_id)
+
+        self._running += 1
+        try:
+            yield
+        finally:
+            self._running -= 1
+            self._slots.release()
+            lock.release()
+            self._release_chat(chat_id)
+
+    def _release_chat(self, chat_id: int) -> None:
+        self._per_chat[chat_id] -= 1
+        if self._per_chat[chat_id] <= 0:
+            del self._per_chat[chat_id]
+            self._chat_locks.pop(chat_id, None)
+
+
+admission = AdmissionController(
+    max_concurrent=settings.max_concurrent_turns,
+    max_queued=settings.max_queued_turns,
+    max_per_chat_queue=settings.max_per_chat_queue,
+)
@@ -1,8 +1,8 @@
 # app/bot/handlers.py
 # ──────────────────────────────────────────────────────────────
 from __future__ import annotations
-import asyncio, os, tempfile
-from pathlib import Path
+import asyncio, time
+from typing import Optional
 
 from telegram import Update
 
@@ -10,80 +10,127 @@ from telegram.ext import (
     Application, ContextTypes,
     CommandHandler, MessageHandler, filters,
 )
-from langchain_core.messages import HumanMessage
 
-from app.vector_store.chroma_client import get_user_collection
-from app.rag.pdf_loader import extract_chunks
-from app.graph.graph_builder import graph   # imports the compiled LangGraph
+# The graph, ingest pipeline and history store (langchain, langgraph, pypdf,
+# the vector backend) are imported by the handlers that use them, so building
+# the Application stays cheap; app.warmup loads them right after startup.
+from app import metrics
+from app.bot.ingest_jobs import ingest_jobs
+from app.bot.ingress import TrackingUpdateProcessor
+from app.config import settings
 import logging
 logger = logging.getLogger(__name__)
 
 # ─── helper: /start ───────────────────────────────────────────
 async def start(update: Update, _: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(
-        "Hi! Send me a PDF, then ask me questions about it. 🤖📚"
+        "Hi! Send me a PDF, then ask me questions about it. 🤖📚\n"
+        "/status shows how your uploads are doing."
     )
 
-# … imports unchanged …
-from app.rag.ingest import store_pdf_async
-from app.rag.retrieve_tool import retrieve      # for typing only
-
-async def on_document(update: Update, ctx: ContextTypes.DEFAULT_TYPE):
+async def on_document(update: Update, _: ContextTypes.DEFAULT_TYPE):
+    # indexing runs on the background job queue; the reply becomes its status message
     doc = update.message.document
-    user_id = update.effective_chat.id
-    tg_file = await ctx.bot.get_file(doc.file_id)
-
-    wrote = await store_pdf_async(tg_file, user_id, doc.file_name)
-
-    if wrote <= 0:
-        return await update.message.reply_text(
-            "I couldn’t index that PDF (maybe it’s scanned or empty). "
-            "Try a text-based PDF."
-        )
-
-    await update.message.reply_text(
-        f"Indexed {wrote} chunks from “{doc.file_name}”. Ask away!"
+    ahead = ingest_jobs.ahead()
+    msg = await update.message.reply_text(
+        f"Got “{doc.file_name}”, queued for indexing"
+        + (f" behind {ahead} other upload{'s' if ahead > 1 else ''}." if ahead else ".")
     )
+    ingest_jobs.submit(update.effective_chat.id, doc.file_id, doc.file_name, doc.file_size or 0,
+                       message_id=msg.message_id)
+
+async def status(update: Update, _: ContextTypes.DEFAULT_TYPE):
+    await update.message.reply_text(ingest_jobs.status_text(update.effective_chat.id))
 
 
 # ─── helper: user question ────────────────────────────────────
-from langchain_core.runnables.history import RunnableWithMessageHistory
-from app.agent.react_agent import build_agent_for_chat
-from app.agent.history import get_history
+from app.bot.admission import admission, Busy
+from app.bot.streaming import ReplyStreamer
+
+_STREAMED_NODES = {"answer", "decide", "generate"}
+
+async def _stream_graph(state: dict, cfg: dict, streamer: ReplyStreamer) -> dict:
+    """Run the graph, forwarding answer tokens to the streamer; returns the final state."""
+    from app.graph.graph_builder import get_graph
+    result: dict = {}
+    node = None
+    async for mode, payload in get_graph().astream(state, cfg, stream_mode=["messages", "values"]):
+        if mode == "values":
+            result = payload
+            continue
+        chunk, meta = payload
+        step = meta.get("langgraph_node")
+        if step not in _STREAMED_NODES or not isinstance(chunk.content, str) or not chunk.content:
+            continue
+        if step != node:          # decide's preamble is replaced by generate's answer
+            node = step
+            streamer.reset()
+        await streamer.push(chunk.content)
+    return result
+
+async def _run_turn(chat_id: int, question: str, streamer: Optional[ReplyStreamer] = None) -> str:
+    """One question → compiled graph (async end to end), history in/out."""
+    from langchain_core.messages import HumanMessage
+    from app.agent.history import histories
+    from app.graph.graph_builder import get_graph
+    from app.rag.answer_cache import answer_cache
+    t0 = time.perf_counter()
+    async with histories.session(f"tg:{chat_id}") as hist:   # not spilled mid-turn
+        cached, qvec, gen = None, None, 0
+        if settings.answer_cache_enabled:
+            cached, qvec, gen = await answer_cache.lookup(chat_id, question)
+            metrics.answer_cache.inc(1, "miss" if cached is None else "hit")
+        if cached is not None:
+            hist.add_user_message(question)
+            hist.add_ai_message(cached)
+            metrics.turn_seconds.observe(time.perf_counter() - t0, "cached")
+            return cached
+
+        # recent turns (plus a summary of older ones) give the decide step context
+        prior = hist.messages
+
+        state = {
+            "messages": [*prior, HumanMessage(content=question)],
+            "chat_id":  chat_id,
+            "question": question,
+        }
+        cfg = {"configurable": {"thread_id": f"tg:{chat_id}"}}
+        if streamer is None:
+            result = await get_graph().ainvoke(state, cfg)
+        else:
+            result = await _stream_graph(state, cfg, streamer)
+
+        reply = str(result["messages"][-1].content) if result.get("messages") else ""
+        hist.add_user_message(question)
+        hist.add_ai_message(reply)
+        answer_cache.store(chat_id, question, qvec, reply, gen)
+        metrics.turn_seconds.observe(time.perf_counter() - t0, "graph")
+        return reply
 
 async def on_text(update: Update, _: ContextTypes.DEFAULT_TYPE):
     user_id  = update.effective_chat.id
     question = update.message.text
 
-    agent = build_agent_for_chat(chat_id=user_id)
-
-    agent_with_history = RunnableWithMessageHistory(
-        agent,
-        get_history,
-        input_messages_key="input",
-        history_messages_key="chat_history",
-    )
-
-    # Seed a system message once per chat (optional but nice)
-    hist = get_history(f"tg:{user_id}")
-    if not hist.messages:
-        hist.add_message(SystemMessage(content=SYSTEM_TEXT))
-
-    cfg = {"configurable": {"session_id": f"tg:{user_id}"}}
-
-    result = await asyncio.to_thread(
-        agent_with_history.invoke,
-        {"input": question},
-        cfg
-    )
-    reply = result["output"] if isinstance(result, dict) and "output" in result else str(result)
+    streamer = None
+    try:
+        async with admission.turn(user_id):
+            if settings.stream_replies:
+                streamer = ReplyStreamer(update.message)
+                await streamer.start()
+            reply = await _run_turn(user_id, question, streamer)
+    except Busy:
+        return await update.message.reply_text(
+            "I’m handling a lot of questions right now — please retry in a moment."
+        )
+    except Exception:
+        if streamer is not None:
+            await streamer.abort()
+        raise
+    reply = reply or "Sorry, I couldn’t come up with an answer."
+    if streamer is not None:
+        return await streamer.finish(reply)
     await update.message.reply_text(reply)
 
-from langchain_core.runnables.history import RunnableWithMessageHistory
-from app.agent.react_agent import build_agent_for_chat, SYSTEM_TEXT
-from app.agent.history import get_history
-from langchain_core.messages import SystemMessage
-    
 async def on_error(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
     logger.exception("Update caused error", exc_info=context.error)
     try:
@@ -94,8 +141,16 @@ async def on_error(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
 
 # ─── factory: return a ready PTB Application ──────────────────
 def build_application(token: str) -> Application:
-    app = Application.builder().token(token).build()
+    app = (
+        Application.builder()
+        .token(token)
+        .update_queue(asyncio.Queue(maxsize=settings.update_queue_size))
+        # admission caps turns; the ingress bounds queued + running updates
+        .concurrent_updates(TrackingUpdateProcessor(settings.max_concurrent_updates))
+        .build()
+    )
     app.add_handler(CommandHandler("start", start))
+    app.add_handler(CommandHandler("status", status))
     app.add_handler(MessageHandler(filters.Document.PDF, on_document))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, on_text))
     app.add_error_handler(on_error) 
@@ -0,0 +1,360 @@
+# app/bot/ingest_jobs.py
+# ─────────────────────────────────────────────────────────────────────────────
+# Background PDF ingestion.
+#
+# `on_document` only records a job (Telegram file_id, size) in SQLite and
+# replies "queued"; a small pool of workers downloads and indexes it off the
+# update handlers. Scheduling:
+#   * round-robin across chats: the chat served longest ago goes next, its
+#     smallest file first, and a chat never has two uploads indexing at once;
+#   * with more than one worker, one only takes small files, so a quick
+#     upload never waits behind several large ones;
+#   * failures (download, embedding API, vector store) retry with
+#     exponential backoff up to `max_attempts`.
+# Jobs interrupted by a restart are queued again on start. Each job's status
+# message is edited with page progress and then the result.
+from __future__ import annotations
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from telegram.error import BadRequest
+
+from app import metrics
+from app.config import settings
+import logging
+log = logging.getLogger(__name__)
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    owner TEXT NOT NULL DEFAULT '',
+    chat_id INTEGER NOT NULL, file_id TEXT NOT NULL, file_name TEXT NOT NULL,
+    size INTEGER NOT NULL DEFAULT 0, message_id INTEGER,
+    status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, next_at REAL NOT NULL DEFAULT 0,
+    pages_done INTEGER NOT NULL DEFAULT 0, pages INTEGER NOT NULL DEFAULT 0,
+    error TEXT, result TEXT, created REAL NOT NULL, updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (owner, status, next_at);
+CREATE INDEX IF NOT EXISTS jobs_chat ON jobs (chat_id, created);
+"""
+_COLUMNS = "id, chat_id, file_id, file_name, size, message_id, status, attempts, pages_done, pages, error, result"
+
+
+@dataclass
+class Job:
+    id: int
+    chat_id: int
+    file_id: str
+    file_name: str
+    size: int
+    message_id: Optional[int]
+    status: str
+    attempts: int
+    pages_done: int
+    pages: int
+    error: Optional[str]
+    result: Optional[str]
+
+
+def describe(res, file_name: str) -> str:
+    """The user-facing outcome of one upload (an IngestResult)."""
+    if res.unchanged:
+        return f"“{file_name}” is already indexed ({res.kept} chunks). Ask away!"
+    if res.chunks <= 0:
+        return ("I couldn’t index that PDF (maybe it’s scanned or empty). "
+                "Try a text-based PDF.")
+    if res.kept or res.removed:
+        return (f"Updated “{file_name}”: {res.added} new, {res.removed} removed, "
+                f"{res.kept} unchanged chunks. Ask away!")
+    return f"Indexed {res.added + res.linked} chunks from “{file_name}”. Ask away!"
+
+
+class IngestJobs:
+    """Persistent upload queue drained by `workers` asyncio workers (ingest runs on threads)."""
+
+    def __init__(
+        self,
+        path: str,
+        spool_dir: str,
+        workers: int = 2,
+        small_bytes: int = 2 << 20,
+        max_attempts: int = 4,
+        backoff: float = 5.0,
+        progress_interval: float = 3.0,
+        keep_done: float = 7 * 24 * 3600,
+        owner: str = "",
+    ):
+        self.path = Path(path)
+        self.spool = Path(spool_dir)
+        self.workers = max(1, workers)
+        self.small_bytes = small_bytes
+        self.max_attempts = max(1, max_attempts)
+        self.backoff = backoff
+        self.progress_interval = progress_interval
+        self.keep_done = keep_done
+        self.owner = owner
+
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
+        self._served: Dict[int, float] = {}     # chat → when it last got a worker
+        self._busy_chats: set = set()
+        self._tasks: List[asyncio.Task] = []
+        self._wake: Optional[asyncio.Event] = None
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self.bot = None
+
+    # ── storage ──────────────────────────────────────────────────────────────
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            with self._lock:
+                if self._conn is None:
+                    self.path.parent.mkdir(parents=True, exist_ok=True)
+                    conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.execute("PRAGMA busy_timeout=5000")
+                    conn.executescript(_SCHEMA)
+                    self._conn = conn
+        return self._conn
+
+    def _q(self, sql: str, *args) -> sqlite3.Cursor:
+        with self._lock:
+            return self._db().execute(sql, args)
+
+    def _update(self, job_id: int, **fields: Any) -> None:
+        cols = ", ".join(f"{k} = ?" for k in fields)
+        self._q(f"UPDATE jobs SET {cols}, updated = ? WHERE id = ?", *fields.values(), time.time(), job_id)
+
+    def get(self, job_id: int) -> Optional[Job]:
+        row = self._q(f"SELECT {_COLUMNS} FROM jobs WHERE id = ?", job_id).fetchone()
+        return Job(*row) if row else None
+
+    # ── submission / status ──────────────────────────────────────────────────
+    def submit(self, chat_id: int, file_id: str, file_name: str, size: int,
+               message_id: Optional[int] = None) -> Job:
+        now = time.time()
+        cur = self._q(
+            "INSERT INTO jobs (owner, chat_id, file_id, file_name, size, message_id, status, created, updated)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            self.owner, chat_id, file_id, file_name, size or 0, message_id, QUEUED, now, now,
+        )
+        log.info("[JOBS] chat=%s queued job=%s file=%s size=%s", chat_id, cur.lastrowid, file_name, size)
+        if self._wake is not None:
+            self._wake.set()
+        return self.get(cur.lastrowid)
+
+    def ahead(self) -> int:
+        """Uploads waiting or indexing right now (for the "queued" reply)."""
+        return self._q("SELECT COUNT(*) FROM jobs WHERE owner = ? AND status IN (?, ?)",
+                       self.owner, QUEUED, RUNNING).fetchone()[0]
+
+    def for_chat(self, chat_id: int, limit: int = 10) -> List[Job]:
+        rows = self._q(f"SELECT {_COLUMNS} FROM jobs WHERE chat_id = ? ORDER BY id DESC LIMIT ?",
+                       chat_id, limit).fetchall()
+        return [Job(*r) for r in rows]
+
+    def counts(self) -> Dict[str, int]:
+        rows = self._q("SELECT status, COUNT(*) FROM jobs WHERE owner = ? GROUP BY status", self.owner)
+        return {**dict.fromkeys((QUEUED, RUNNING, DONE, FAILED), 0), **dict(rows.fetchall())}
+
+    def status_text(self, chat_id: int) -> str:
+        jobs = self.for_chat(chat_id)
+        if not jobs:
+            return "No uploads yet. Send me a PDF!"
+        lines = ["Your recent uploads:"]
+        for j in jobs:
+            if j.status == RUNNING:
+                state = f"indexing, page {j.pages_done}/{j.pages}" if j.pages else "indexing"
+            elif j.status == QUEUED:
+                state = f"retrying ({j.attempts}/{self.max_attempts} attempts)" if j.attempts else "queued"
+            elif j.status == DONE:
+                res = json.loads(j.result or "{}")
+                state = f"done, {res.get('chunks', 0)} chunks"
+            else:
+                state = f"failed: {j.error}"
+            lines.append(f"• {j.file_name} — {state}")
+        return "\n".join(lines)
+
+    # ── scheduling ───────────────────────────────────────────────────────────
+    def claim(self, large_ok: bool = True) -> Optional[Job]:
+        """Next job by chat round-robin (smallest file of the chat first), marked running."""
+        with self._lock:
+            rows = self._q(
+                "SELECT id, chat_id, size FROM jobs WHERE owner = ? AND status = ? AND next_at <= ?"
+                " ORDER BY size, id", self.owner, QUEUED, time.time(),
+            ).fetchall()
+            firsts: Dict[int, tuple] = {}
+            for job_id, chat_id, size in rows:
+                if chat_id in self._busy_chats or chat_id in firsts:
+                    continue
+                if large_ok or size <= self.small_bytes:
+                    firsts[chat_id] = (job_id, size)
+            if not firsts:
+                return None
+            chat_id = min(firsts, key=lambda c: (self._served.get(c, 0.0), firsts[c][0]))
+            job_id = firsts[chat_id][0]
+            self._update(job_id, status=RUNNING, attempts=self.get(job_id).attempts + 1)
+            self._served[chat_id] = time.monotonic()
+            self._busy_chats.add(chat_id)
+            return self.get(job_id)
+
+    def _release(self, job: Job) -> None:
+        with self._lock:
+            self._busy_chats.discard(job.chat_id)
+            # only chats still waiting need their turn remembered; an idle chat
+            # that uploads again simply counts as served longest ago
+            waiting = {r[0] for r in self._q(
+                "SELECT DISTINCT chat_id FROM jobs WHERE owner = ? AND status = ?", self.owner, QUEUED)}
+            self._served = {c: t for c, t in self._served.items() if c in waiting or c in self._busy_chats}
+        if self._wake is not None:
+            self._wake.set()
+
+    def _next_due(self) -> Optional[float]:
+        row = self._q("SELECT MIN(next_at) FROM jobs WHERE owner = ? AND status = ?",
+                      self.owner, QUEUED).fetchone()
+        return row[0] if row else None
+
+    def recover(self) -> int:
+        """Requeue jobs a previous process left running; drop old finished ones."""
+        n = self._q("UPDATE jobs SET status = ?, next_at = 0 WHERE owner = ? AND status = ?",
+                    QUEUED, self.owner, RUNNING).rowcount
+        self._q("DELETE FROM jobs WHERE owner = ? AND status IN (?, ?) AND updated < ?",
+                self.owner, DONE, FAILED, time.time() - self.keep_done)
+        return n
+
+    # ── workers ──────────────────────────────────────────────────────────────
+    def start(self, bot) -> None:
+        self.bot = bot
+        self.spool.mkdir(parents=True, exist_ok=True)
+        self._wake = asyncio.Event()
+        self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix="ingest-job")
+        recovered = self.recover()
+        # with several workers the first one is kept for small files
+        self._tasks = [
+            asyncio.ensure_future(self._worker(large_ok=self.workers == 1 or i > 0))
+            for i in range(self.workers)
+        ]
+        log.info("[JOBS] started workers=%s recovered=%s", self.workers, recovered)
+
+    async def stop(self) -> None:
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._pool is not None:
+            # a running ingest finishes on its thread; its job is requeued
+            # (ingest is idempotent) and resumes on the next start
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def _worker(self, large_ok: bool) -> None:
+        while True:
+            job = self.claim(large_ok)
+            if job is None:
+                due = self._next_due()
+                timeout = 5.0 if due is None else min(5.0, max(0.05, due - time.time()))
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self._run(job)
+            finally:
+                self._release(job)
+
+    async def _run(self, job: Job) -> None:
+        from app.rag.ingest import store_pdf_path
+        from app.rag.pdf_loader import page_count
+
+        loop = asyncio.get_running_loop()
+        path = self.spool / f"{job.id}.pdf"
+        log.info("[JOBS] chat=%s job=%s attempt=%s file=%s", job.chat_id, job.id, job.attempts, job.file_name)
+        try:
+            await self._notify(job, f"Indexing “{job.file_name}”…")
+            if not path.exists():
+                part = path.with_suffix(".part")
+                with metrics.span(metrics.ingest_seconds, "download"):
+                    tg_file = await self.bot.get_file(job.file_id)
+                    await tg_file.download_to_drive(custom_path=str(part))
+                os.replace(part, path)
+            pages = await loop.run_in_executor(self._pool, page_count, path)
+            self._update(job.id, pages=pages)
+
+            last = [0.0]
+            def progress(done: int) -> None:       # called on the ingest thread
+                now = time.monotonic()
+                if now - last[0] < self.progress_interval or done >= pages:
+                    return
+                last[0] = now
+                self._update(job.id, pages_done=done)
+                asyncio.run_coroutine_threadsafe(
+                    self._notify(job, f"Indexing “{job.file_name}”… page {done}/{pages}"), loop)
+
+            res = await loop.run_in_executor(
+                self._pool, partial(store_pdf_path, path, job.chat_id, job.file_name, progress))
+            if res.error:
+                raise RuntimeError(res.error)
+        except asyncio.CancelledError:
+            self._update(job.id, status=QUEUED, next_at=0)
+            raise
+        except Exception as e:
+            await self._failed(job, e, path)
+            return
+
+        self._update(job.id, status=DONE, pages_done=pages, error=None,
+                     result=json.dumps({"chunks": res.chunks, "added": res.added, "linked": res.linked,
+                                        "kept": res.kept, "removed": res.removed}))
+        path.unlink(missing_ok=True)
+        await self._notify(job, describe(res, job.file_name))
+
+    async def _failed(self, job: Job, error: Exception, path: Path) -> None:
+        if job.attempts < self.max_attempts:
+            delay = self.backoff * 2 ** (job.attempts - 1)
+            log.warning("[JOBS] chat=%s job=%s attempt=%s failed, retry in %.0fs: %r",
+                        job.chat_id, job.id, job.attempts, delay, error)
+            self._update(job.id, status=QUEUED, next_at=time.time() + delay, error=repr(error))
+            await self._notify(job, f"Indexing “{job.file_name}” hit a problem; retrying in {delay:.0f}s.")
+            return
+        log.error("[JOBS] chat=%s job=%s gave up after %s attempts: %r", job.chat_id, job.id, job.attempts, error)
+        self._update(job.id, status=FAILED, error=f"{type(error).__name__}: {error}"[:300])
+        path.unlink(missing_ok=True)
+        await self._notify(job, f"Sorry, I couldn’t index “{job.file_name}”. Please try uploading it again later.")
+
+    async def _notify(self, job: Job, text: str) -> None:
+        """Edit the job's status message (or send one); never fails the job."""
+        try:
+            if job.message_id is None:
+                msg = await self.bot.send_message(job.chat_id, text)
+                job.message_id = msg.message_id
+                self._update(job.id, message_id=msg.message_id)
+            else:
+                await self.bot.edit_message_text(text, chat_id=job.chat_id, message_id=job.message_id)
+        except BadRequest as e:
+            if "not modified" not in str(e).lower():
+                log.debug("[JOBS] chat=%s job=%s notify failed: %s", job.chat_id, job.id, e)
+        except Exception as e:
+            log.debug("[JOBS] chat=%s job=%s notify failed: %r", job.chat_id, job.id, e)
+
+
+ingest_jobs = IngestJobs(
+    settings.ingest_jobs_path,
+    settings.ingest_spool_dir,
+    workers=settings.ingest_workers,
+    small_bytes=int(settings.ingest_small_file_mb * (1 << 20)),
+    max_attempts=settings.ingest_max_attempts,
+    backoff=settings.ingest_retry_backoff,
+    progress_interval=settings.ingest_progress_interval,
+    owner=settings.shard_node,
+)
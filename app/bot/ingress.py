@@ -0,0 +1,168 @@
+# app/bot/ingress.py
+# ──────────────────────────────────────────────────────────────
+# Webhook ingress: decode → dedup → bounded admission, then ack.
+#
+# Telegram redelivers an update when our 200 is late, and after an outage it
+# replays the whole backlog at once. Duplicates are dropped by update_id and
+# the number of accepted-but-unfinished updates is bounded, so a burst costs
+# neither memory nor LLM calls twice.
+#
+# Bounding PTB's update queue alone does not work: with concurrent updates its
+# fetcher turns every queued update into a task right away, so the queue never
+# fills. The ingress counts an update from `accept` until
+# `TrackingUpdateProcessor` reports its handler finished.
+from __future__ import annotations
+import asyncio
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from telegram import Update
+from telegram.ext import SimpleUpdateProcessor
+
+import logging
+log = logging.getLogger(__name__)
+
+try:                                   # ~5-10x faster than the stdlib on update bodies
+    import orjson
+    loads: Callable[[bytes], Any] = orjson.loads
+except ImportError:
+    import json
+    loads = json.loads
+
+QUEUED, DUPLICATE, DROPPED, REJECTED, INVALID = "queued", "duplicate", "dropped", "rejected", "invalid"
+POLICIES = ("reject", "drop_new", "drop_oldest")
+
+
+class RecentIds:
+    """Insertion-ordered set of the last `maxlen` update_ids."""
+
+    def __init__(self, maxlen: int):
+        self.maxlen = maxlen
+        self._ids: "OrderedDict[int, None]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, update_id: int) -> bool:
+        return update_id in self._ids
+
+    def add(self, update_id: int) -> bool:
+        """Remember `update_id`; False if it was already there."""
+        if update_id in self._ids:
+            return False
+        self._ids[update_id] = None
+        if len(self._ids) > self.maxlen:
+            self._ids.popitem(last=False)
+        return True
+
+    def discard(self, update_id: int) -> None:
+        self._ids.pop(update_id, None)
+
+
+class TrackingUpdateProcessor(SimpleUpdateProcessor):
+    """PTB's default processor, plus a callback once each update's handlers finished."""
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self.on_done: Optional[Callable[[object], None]] = None
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        try:
+            await coroutine
+        finally:
+            if self.on_done is not None:
+                self.on_done(update)
+
+
+class WebhookIngress:
+    """
+    Hands webhook bodies to the PTB update queue without blocking.
+
+    At most `max_pending` updates may be queued or running at once. Beyond
+    that the overflow policy decides:
+      reject      → answer 503 so Telegram retries later (nothing is lost)
+      drop_new    → ack and discard the incoming update
+      drop_oldest → evict the oldest update not yet started to make room
+                    (503 like `reject` if every pending one is running)
+    Pass the Application's `TrackingUpdateProcessor` so finished updates free
+    their slot; without one (tests) nothing is ever released.
+    """
+
+    def __init__(
+        self,
+        queue: "asyncio.Queue[object]",
+        bot,
+        policy: str,
+        dedup_size: int,
+        max_pending: int,
+        processor: Optional[TrackingUpdateProcessor] = None,
+    ):
+        if policy not in POLICIES:
+            raise ValueError(f"unknown overflow policy {policy!r}; expected one of {POLICIES}")
+        self.queue  = queue
+        self.bot    = bot
+        self.policy = policy
+        self.max_pending = max_pending
+        self.pending = 0                       # accepted, handlers not finished yet
+        self.recent = RecentIds(dedup_size)
+        self.counts: Dict[str, int] = dict.fromkeys((QUEUED, DUPLICATE, DROPPED, REJECTED, INVALID), 0)
+        if processor is not None:
+            processor.on_done = self._done
+
+    def accept(self, body: bytes) -> str:
+        """Decode one webhook body and enqueue it; returns the outcome."""
+        try:
+            data = loads(body)
+            update_id = int(data["update_id"])
+        except (ValueError, TypeError, KeyError) as e:
+            log.warning("[INGRESS] invalid body bytes=%s err=%r", len(body), e)
+            return self._count(INVALID)
+
+        if update_id in self.recent:
+            log.info("[INGRESS] duplicate update_id=%s", update_id)
+            return self._count(DUPLICATE)
+
+        try:
+            update = Update.de_json(data, self.bot)
+        except Exception as e:                 # well-formed JSON, not an Update
+            log.warning("[INGRESS] undecodable update_id=%s err=%r", update_id, e)
+            return self._count(INVALID)
+
+        if self.pending >= self.max_pending:
+            if self.policy == "drop_new":
+                self.recent.add(update_id)
+                log.warning("[INGRESS] full, dropping update_id=%s", update_id)
+                return self._count(DROPPED)
+            if self.policy == "drop_oldest" and self._evict_oldest():
+                pass
+            else:
+                # the retry must get through, so update_id is not remembered
+                log.warning("[INGRESS] full, rejecting update_id=%s pending=%s", update_id, self.pending)
+                return self._count(REJECTED)
+
+        self.recent.add(update_id)
+        self.queue.put_nowait(update)
+        self.pending += 1
+        log.debug("[INGRESS] queued update_id=%s pending=%s", update_id, self.pending)
+        return self._count(QUEUED)
+
+    def _evict_oldest(self) -> bool:
+        try:
+            old = self.queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return False                       # everything pending is already running
+        self.queue.task_done()
+        self.pending -= 1
+        self._count(DROPPED)
+        log.warning("[INGRESS] full, evicted update_id=%s", getattr(old, "update_id", None))
+        return True
+
+    def _done(self, update: object) -> None:
+        self.pending = max(0, self.pending - 1)
+
+    def _count(self, outcome: str) -> str:
+        self.counts[outcome] += 1
+        return outcome
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.counts, "pending": self.pending, "depth": self.queue.qsize(), "recent": len(self.recent)}
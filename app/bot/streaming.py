@@ -0,0 +1,114 @@
+# app/bot/streaming.py
+# ──────────────────────────────────────────────────────────────
+from __future__ import annotations
+import asyncio
+import datetime as dtm
+import time
+from typing import Optional
+
+from telegram import Message
+from telegram.error import BadRequest, RetryAfter, TelegramError
+
+from app.config import settings
+import logging
+log = logging.getLogger(__name__)
+
+TG_MAX_CHARS = 4096
+PLACEHOLDER  = "…"
+CURSOR       = " ▍"
+
+
+def _seconds(value) -> float:
+    return value.total_seconds() if isinstance(value, dtm.timedelta) else float(value)
+
+
+class ReplyStreamer:
+    """
+    Shows an answer while it is being generated.
+
+    A placeholder reply is sent right away, then edited in place as tokens
+    arrive. Edits are coalesced: at most one per `interval` seconds and only
+    once `min_chars` new characters have accumulated, which keeps a chat well
+    inside Telegram's edit rate limits. Text beyond one message's 4096-char
+    limit continues in a follow-up message.
+    """
+
+    def __init__(self, reply_to: Message, interval: Optional[float] = None, min_chars: Optional[int] = None):
+        self.reply_to  = reply_to
+        self.interval  = settings.stream_edit_interval if interval is None else interval
+        self.min_chars = settings.stream_min_chars if min_chars is None else min_chars
+        self._msg: Optional[Message] = None
+        self._done    = ""    # text already frozen in earlier messages
+        self._buf     = ""    # full text of the current answer
+        self._shown   = ""    # what the current message displays
+        self._stale   = False # `_shown` is discarded text: any new text replaces it
+        self._next_at = 0.0   # earliest time for the next edit
+
+    @property
+    def text(self) -> str:
+        return self._buf
+
+    async def start(self) -> None:
+        self._msg = await self.reply_to.reply_text(PLACEHOLDER)
+        self._next_at = time.monotonic()   # first tokens show up immediately
+
+    def reset(self) -> None:
+        """Discard streamed text (e.g. a preamble before the real answer starts)."""
+        self._buf = self._done        # messages already frozen can't be taken back
+        self._stale = True
+
+    async def push(self, delta: str) -> None:
+        self._buf += delta
+        current = self._buf[len(self._done):]
+        fresh = len(current) if self._stale else len(current) - len(self._shown)
+        if time.monotonic() < self._next_at or fresh < self.min_chars:
+            return
+        await self._render(current + CURSOR)
+
+    async def finish(self, final: Optional[str] = None) -> None:
+        if final is not None:
+            self._buf = final
+        if self._msg is None:
+            await self.start()
+        await self._render(self._buf[len(self._done):] or "…", final=True)
+
+    async def abort(self) -> None:
+        """Remove the placeholder; the error handler will reply instead."""
+        if self._msg is not None:
+            try:
+                await self._msg.delete()
+            except TelegramError:
+                pass
+
+    # ── internals ────────────────────────────────────────────────────────────
+    async def _render(self, text: str, final: bool = False) -> None:
+        # roll over into a fresh message once the current one is full
+        while len(text) > TG_MAX_CHARS:
+            head = self._buf[len(self._done):][:TG_MAX_CHARS]
+            await self._edit(head, force=True)
+            self._done += head
+            self._msg   = await self.reply_to.reply_text(PLACEHOLDER)
+            self._shown = ""
+            text = self._buf[len(self._done):] + ("" if final else CURSOR)
+        await self._edit(text, force=final)
+
+    async def _edit(self, text: str, force: bool) -> None:
+        if self._msg is None or text == self._shown:
+            return
+        if not force and time.monotonic() < self._next_at:
+            return
+        try:
+            await self._msg.edit_text(text)
+            self._shown = text
+            self._stale = False
+            self._next_at = time.monotonic() + self.interval
+        except RetryAfter as e:
+            wait = _seconds(e.retry_after)
+            log.warning("[STREAM] rate limited, backing off %.1fs", wait)
+            self._next_at = time.monotonic() + wait
+            if force:
+                await asyncio.sleep(wait)
+                await self._edit(text, force=True)
+        except BadRequest as e:
+            if "not modified" not in str(e).lower():
+                raise
@@ -2,6 +2,7 @@ from pydantic_settings import BaseSettings
 from pydantic import Field
 
 from pathlib import Path
+from typing import Dict
 from dotenv import load_dotenv
 
 env_path = Path(__file__).resolve().parent.parent / ".env"
@@ -14,6 +15,118 @@ class Settings(BaseSettings):
     chroma_port: int        = 8000
     embed_model: str        = "text-embedding-3-small"
 
+    # Chroma connection / handle cache
+    chroma_cache_size: int  = 512      # max per-chat Chroma handles kept warm
+    chroma_idle_ttl: float  = 1800.0   # seconds before an idle handle is dropped
+
+    # Vector backend: "chroma" (server) or "mmap" (in-process, data/vectors)
+    vector_backend: str        = "chroma"
+    vector_dir: str            = "data/vectors"
+    vector_dtype: str          = "float16"   # float16 | int8
+    vector_cache_size: int     = 256         # tenants kept mapped
+    vector_hot_mb: int         = 512         # float32 search copies of mapped tenants
+    vector_compact_ratio: float = 0.3        # rewrite once this share of rows is retired
+
+    # Embedding batcher
+    embed_batch_window_ms: float = 5.0       # wait this long to coalesce calls
+    embed_batch_max_inputs: int  = 256       # texts per upstream request
+    embed_batch_max_tokens: int  = 250_000   # approx tokens per upstream request
+    embed_max_in_flight: int     = 4         # concurrent upstream requests
+
+    # Streaming ingest pipeline
+    ingest_batch_size: int    = 64   # chunks per embed/write batch
+    ingest_queue_depth: int   = 2    # batches buffered between stages
+    ingest_embed_workers: int = 4    # embedding batches in flight per upload
+
+    # Background ingestion jobs (uploads are queued, a worker pool indexes them)
+    ingest_jobs_path: str            = "data/ingest_jobs.sqlite"
+    ingest_spool_dir: str            = "data/uploads"   # downloaded PDFs until their job finishes
+    ingest_workers: int              = 2        # uploads indexed at once (one kept for small files)
+    ingest_small_file_mb: float      = 2.0      # ≤ this jumps ahead of larger uploads
+    ingest_max_attempts: int         = 4
+    ingest_retry_backoff: float      = 5.0      # s, doubled per failed attempt
+    ingest_progress_interval: float  = 3.0      # s between "page x/y" edits
+    ingest_embed_max_in_flight: int  = 2        # ingest's own embedding requests (queries keep theirs)
+
+    # Shared LLM HTTP transport
+    llm_max_connections: int = 100
+    llm_max_keepalive: int   = 20
+    llm_timeout: float       = 60.0
+
+    # Admission control for question turns
+    max_concurrent_updates: int = 1024  # PTB updates processed concurrently
+    max_concurrent_turns: int   = 256   # graph runs in flight across all chats
+    max_queued_turns: int       = 1024  # waiting turns before "busy, retry"
+    max_per_chat_queue: int     = 2     # turns queued behind a chat's running one
+
+    # Conversation memory: recent turns verbatim, older ones as a rolling summary
+    history_token_budget: int      = 1200      # tokens of recent turns sent with each question
+    history_summary_tokens: int    = 300       # cap on the rolling summary
+    history_summary_model: str     = "gpt-4.1-nano"
+    history_max_sessions: int      = 10_000    # sessions kept in memory (LRU)
+    history_ttl: float             = 1800.0    # idle seconds before a session leaves memory
+    history_spill_dir: str         = "data/history"   # evicted sessions, reloaded on return ("" → forget)
+    history_spill_ttl: float       = 7 * 24 * 3600    # spilled sessions older than this are dropped
+
+    # Per-chat semantic answer cache
+    answer_cache_enabled: bool    = True
+    answer_cache_threshold: float = 0.92     # cosine similarity for a hit
+    answer_cache_ttl: float       = 3600.0   # seconds
+    answer_cache_per_chat: int    = 64
+    answer_cache_max_chats: int   = 10_000
+
+    # Content-addressed corpus: identical PDFs are embedded once, chats hold references
+    shared_corpus: bool            = True    # forced off for sharded workers on the mmap backend
+    shared_corpus_path: str        = "data/corpus.sqlite"   # docs + per-chat references
+
+    # Hybrid (BM25 + vector) retrieval
+    hybrid_retrieval: bool         = True
+    lexical_dir: str               = "data/lexical"   # per-tenant BM25 indexes
+    lexical_cache_size: int        = 256              # indexes kept in memory
+    rrf_k: int                     = 60               # reciprocal rank fusion constant
+    retrieve_vector_timeout: float = 3.0              # then answer from BM25 alone
+
+    # Context packing for `generate` (tokens of retrieved text per prompt)
+    context_token_budget: int             = 2000
+    context_token_budgets: Dict[str, int] = {"gpt-4.1-nano": 2000, "gpt-4o-mini": 3000}
+
+    # Local router in front of the `decide` LLM call
+    fast_router: bool              = True
+    router_lexical_match: float    = 0.8    # best chunk's BM25 vs. one holding every query term
+    router_vector_probe: bool      = True   # top-1 similarity probe for unclear turns
+    router_sim_high: float         = 0.45   # ≥ → retrieve
+    router_sim_low: float          = 0.20   # ≤ (and no lexical overlap) → answer directly
+    router_probe_timeout: float    = 1.0
+    speculative_retrieval: bool    = False  # retrieve while `decide` runs; reuse if args match
+
+    # streamed replies (placeholder message edited in place)
+    stream_replies: bool           = True
+    stream_edit_interval: float    = 0.8    # s between edits; Telegram throttles ~1 edit/s per chat
+    stream_min_chars: int          = 24     # don't spend an edit on a couple of tokens
+
+    # Webhook ingress
+    update_queue_size: int         = 1000     # updates queued or running before the overflow policy applies
+    update_overflow_policy: str    = "reject" # reject (503, Telegram retries) | drop_new | drop_oldest
+    update_dedup_size: int         = 10_000   # recent update_ids remembered for redeliveries
+    log_level: str                 = "INFO"
+
+    # Graph checkpoints (SQLite, WAL)
+    checkpoint_path: str              = "data/checkpoints.sqlite"
+    checkpoint_keep_last: int         = 2          # checkpoints kept per thread
+    checkpoint_ttl: float             = 7 * 24 * 3600   # idle threads are dropped after this (s)
+    checkpoint_compact_interval: float = 60.0
+    checkpoint_cache_threads: int     = 1024       # latest checkpoints held in memory
+
+    # Startup warm-up (runs in the background; /ready flips once it finishes)
+    warmup_connect: bool           = True     # open pooled connections to OpenAI / Chroma
+    warmup_timeout: float          = 10.0     # per network step
+
+    # Sharded mode (python -m app.shard)
+    shard_workers: int             = 0        # 0 → one per CPU core
+    shard_socket_dir: str          = "/tmp/learnbot-shards"
+    shard_vnodes: int              = 128      # virtual nodes per worker on the hash ring
+    shard_node: str                = ""       # set by the supervisor for each worker process
+
     class Config:
         env_file = ".env"   # ← this line makes Pydantic load .env for you
         extra = "ignore"
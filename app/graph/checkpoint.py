@@ -0,0 +1,439 @@
+# app/graph/checkpoint.py
+# ─────────────────────────────────────────────────────────────────────────────
+# Disk-backed LangGraph checkpointer (SQLite, WAL).
+#
+# Unlike MemorySaver this keeps only the last few checkpoints of each thread,
+# drops threads that have been idle longer than a TTL, and survives restarts.
+# The latest checkpoint of recently used threads is cached (serialized, LRU),
+# so a turn normally never reads the database; other threads load lazily.
+#
+# Shard workers share the file: each thread row records the worker (`owner`)
+# that last wrote it, and a worker only expires its own threads.
+from __future__ import annotations
+import asyncio
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+
+import logging
+log = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL, ns TEXT NOT NULL, checkpoint_id TEXT NOT NULL,
+    parent_id TEXT, type TEXT, checkpoint BLOB, meta_type TEXT, metadata BLOB,
+    PRIMARY KEY (thread_id, ns, checkpoint_id)
+);
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id TEXT NOT NULL, ns TEXT NOT NULL, checkpoint_id TEXT NOT NULL,
+    task_id TEXT NOT NULL, idx INTEGER NOT NULL, channel TEXT NOT NULL,
+    type TEXT, value BLOB, task_path TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (thread_id, ns, checkpoint_id, task_id, idx)
+);
+CREATE TABLE IF NOT EXISTS threads (
+    thread_id TEXT PRIMARY KEY, last_seen REAL NOT NULL, owner TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS threads_last_seen ON threads (last_seen);
+"""
+
+# (thread_id, ns) → latest checkpoint, still serialized
+_Key   = Tuple[str, str]
+_Typed = Tuple[str, bytes]
+
+
+class _Latest:
+    __slots__ = ("checkpoint_id", "parent_id", "checkpoint", "metadata", "writes")
+
+    def __init__(self, checkpoint_id: str, parent_id: Optional[str], checkpoint: _Typed, metadata: _Typed):
+        self.checkpoint_id = checkpoint_id
+        self.parent_id     = parent_id
+        self.checkpoint    = checkpoint
+        self.metadata      = metadata
+        self.writes: Dict[Tuple[str, int], Tuple[str, str, _Typed]] = {}
+
+
+class SqliteCheckpointSaver(BaseCheckpointSaver[str]):
+    """
+    LangGraph checkpointer on a single SQLite file.
+
+    Writes go through one writer thread (FIFO, so a checkpoint always lands
+    before its pending writes); a background thread prunes every thread to
+    `keep_last` checkpoints and expires this `owner`'s threads idle for `ttl`
+    seconds. `_lock` guards the database, `_cache_lock` only the in-memory
+    cache, so a cache hit never waits for a disk commit.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        keep_last: int = 2,
+        ttl: float = 7 * 24 * 3600,
+        compact_interval: float = 60.0,
+        cache_threads: int = 1024,
+        owner: str = "",
+        **kwargs: Any,
+    ):
+        super().__init__(**kwargs)
+        self.path = Path(path)
+        self.keep_last = max(1, keep_last)
+        self.ttl = ttl
+        self.compact_interval = compact_interval
+        self.cache_threads = cache_threads
+        self.owner = owner
+
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
+        self._cache_lock = threading.Lock()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="checkpoint-writer")
+        self._cache: "OrderedDict[_Key, _Latest]" = OrderedDict()
+        self._dirty: set = set()              # threads written since the last compaction
+        self._stop = threading.Event()
+        self._compactor: Optional[threading.Thread] = None
+
+    # ── connection ───────────────────────────────────────────────────────────
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            with self._lock:
+                if self._conn is None:
+                    self.path.parent.mkdir(parents=True, exist_ok=True)
+                    conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.execute("PRAGMA synchronous=NORMAL")   # durable across process crashes
+                    conn.execute("PRAGMA busy_timeout=5000")
+                    conn.executescript(_SCHEMA)
+                    try:        # files created before `owner` existed
+                        conn.execute("ALTER TABLE threads ADD COLUMN owner TEXT NOT NULL DEFAULT ''")
+                    except sqlite3.OperationalError:
+                        pass
+                    self._conn = conn
+        return self._conn
+
+    @contextmanager
+    def _tx(self) -> Iterator[sqlite3.Connection]:
+        """BEGIN … COMMIT; rolled back on any error so the connection stays usable."""
+        db = self._db()
+        db.execute("BEGIN")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def _start_compactor(self) -> None:
+        if self._compactor is None and self.compact_interval > 0:
+            self._compactor = threading.Thread(target=self._compact_loop, name="checkpoint-compactor", daemon=True)
+            self._compactor.start()
+
+    def close(self) -> None:
+        self._stop.set()
+        self._writer.shutdown(wait=True)
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    # ── cache ────────────────────────────────────────────────────────────────
+    def _remember(self, key: _Key, latest: _Latest) -> None:
+        with self._cache_lock:
+            self._cache[key] = latest
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_threads:
+                self._cache.popitem(last=False)
+
+    def _cached(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = get_checkpoint_id(config)
+        with self._cache_lock:
+            latest = self._cache.get((thread_id, ns))
+            if latest is None or checkpoint_id not in (None, latest.checkpoint_id):
+                return None
+            self._cache.move_to_end((thread_id, ns))
+            return self._tuple(thread_id, ns, latest)
+
+    def _tuple(self, thread_id: str, ns: str, latest: _Latest) -> CheckpointTuple:
+        return CheckpointTuple(
+            config=_config(thread_id, ns, latest.checkpoint_id),
+            checkpoint=self.serde.loads_typed(latest.checkpoint),
+            metadata=self.serde.loads_typed(latest.metadata),
+            parent_config=_config(thread_id, ns, latest.parent_id) if latest.parent_id else None,
+            pending_writes=[
+                (task_id, channel, self.serde.loads_typed(value))
+                for task_id, channel, value in latest.writes.values()
+            ],
+        )
+
+    def _load(self, thread_id: str, ns: str, checkpoint_id: Optional[str]) -> Optional[_Latest]:
+        db = self._db()
+        if checkpoint_id:
+            row = db.execute(
+                "SELECT checkpoint_id, parent_id, type, checkpoint, meta_type, metadata FROM checkpoints "
+                "WHERE thread_id=? AND ns=? AND checkpoint_id=?", (thread_id, ns, checkpoint_id),
+            ).fetchone()
+        else:
+            row = db.execute(
+                "SELECT checkpoint_id, parent_id, type, checkpoint, meta_type, metadata FROM checkpoints "
+                "WHERE thread_id=? AND ns=? ORDER BY checkpoint_id DESC LIMIT 1", (thread_id, ns),
+            ).fetchone()
+        if row is None:
+            return None
+        latest = _Latest(row[0], row[1], (row[2], row[3]), (row[4], row[5]))
+        for task_id, idx, channel, typ, value in db.execute(
+            "SELECT task_id, idx, channel, type, value FROM writes "
+            "WHERE thread_id=? AND ns=? AND checkpoint_id=? ORDER BY task_id, idx",
+            (thread_id, ns, latest.checkpoint_id),
+        ):
+            latest.writes[(task_id, idx)] = (task_id, channel, (typ, value))
+        return latest
+
+    # ── BaseCheckpointSaver (sync) ───────────────────────────────────────────
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = get_checkpoint_id(config)
+        hit = self._cached(config)
+        if hit is not None:
+            return hit
+        with self._lock:
+            latest = self._load(thread_id, ns, checkpoint_id)
+            if latest is None:
+                return None
+            if checkpoint_id is None:
+                self._remember((thread_id, ns), latest)
+            return self._tuple(thread_id, ns, latest)
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        sql, args = "SELECT thread_id, ns, checkpoint_id FROM checkpoints WHERE 1=1", []
+        if config:
+            sql += " AND thread_id=?"; args.append(config["configurable"]["thread_id"])
+            ns = config["configurable"].get("checkpoint_ns")
+            if ns is not None:
+                sql += " AND ns=?"; args.append(ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                sql += " AND checkpoint_id=?"; args.append(checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            sql += " AND checkpoint_id<?"; args.append(before_id)
+        sql += " ORDER BY thread_id, ns, checkpoint_id DESC"
+
+        with self._lock:
+            keys = self._db().execute(sql, args).fetchall()
+        for thread_id, ns, checkpoint_id in keys:
+            if limit is not None and limit <= 0:
+                break
+            with self._lock:
+                latest = self._load(thread_id, ns, checkpoint_id)
+            if latest is None:            # compacted away meanwhile
+                continue
+            item = self._tuple(thread_id, ns, latest)
+            if filter and not all(item.metadata.get(k) == v for k, v in filter.items()):
+                continue
+            if limit is not None:
+                limit -= 1
+            yield item
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        ns = config["configurable"].get("checkpoint_ns", "")
+        parent_id = config["configurable"].get("checkpoint_id")
+        latest = _Latest(
+            checkpoint["id"], parent_id,
+            self.serde.dumps_typed(checkpoint),
+            self.serde.dumps_typed(get_checkpoint_metadata(config, metadata)),
+        )
+        with self._lock:
+            with self._tx() as db:
+                db.execute(
+                    "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (thread_id, ns, latest.checkpoint_id, parent_id, *latest.checkpoint, *latest.metadata),
+                )
+                db.execute("INSERT OR REPLACE INTO threads (thread_id, last_seen, owner) VALUES (?, ?, ?)",
+                           (thread_id, time.time(), self.owner))
+            self._remember((thread_id, ns), latest)
+            self._dirty.add(thread_id)
+            self._start_compactor()
+        return _config(thread_id, ns, latest.checkpoint_id)
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        # special channels (errors, interrupts…) are replaced; regular writes are idempotent
+        replace = all(channel in WRITES_IDX_MAP for channel, _ in writes)
+        rows = [
+            (thread_id, ns, checkpoint_id, task_id, WRITES_IDX_MAP.get(channel, idx), channel,
+             *self.serde.dumps_typed(value), task_path)
+            for idx, (channel, value) in enumerate(writes)
+        ]
+        with self._lock:
+            with self._tx() as db:
+                db.executemany(
+                    f"INSERT OR {'REPLACE' if replace else 'IGNORE'} INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+        with self._cache_lock:
+            latest = self._cache.get((thread_id, ns))
+            if latest is None:
+                return
+            if latest.checkpoint_id != checkpoint_id:
+                self._cache.pop((thread_id, ns), None)
+                return
+            for row in rows:
+                key = (task_id, row[4])
+                if replace or key not in latest.writes:
+                    latest.writes[key] = (task_id, row[5], (row[6], row[7]))
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            self._delete_threads([thread_id])
+
+    def _delete_threads(self, thread_ids: List[str]) -> None:
+        with self._tx() as db:
+            for table in ("checkpoints", "writes", "threads"):
+                db.executemany(f"DELETE FROM {table} WHERE thread_id=?", [(t,) for t in thread_ids])
+        gone = set(thread_ids)
+        with self._cache_lock:
+            for key in [k for k in self._cache if k[0] in gone]:
+                del self._cache[key]
+        self._dirty -= gone
+
+    # ── BaseCheckpointSaver (async) ──────────────────────────────────────────
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        hit = self._cached(config)                 # hot path: no disk I/O, no DB lock
+        if hit is not None:
+            return hit
+        return await asyncio.get_running_loop().run_in_executor(self._writer, self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        items = await asyncio.to_thread(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for item in items:
+            yield item
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return await asyncio.get_running_loop().run_in_executor(
+            self._writer, self.put, config, checkpoint, metadata, new_versions
+        )
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        await asyncio.get_running_loop().run_in_executor(
+            self._writer, self.put_writes, config, writes, task_id, task_path
+        )
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.get_running_loop().run_in_executor(self._writer, self.delete_thread, thread_id)
+
+    def get_next_version(self, current: Optional[str], channel: None) -> str:
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+    # ── compaction ───────────────────────────────────────────────────────────
+    def compact(self) -> Dict[str, int]:
+        """Prune dirty threads to `keep_last` checkpoints and expire idle threads."""
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            pruned = 0
+            try:
+                with self._tx() as db:
+                    for thread_id in dirty:
+                        cur = db.execute(
+                            "DELETE FROM checkpoints WHERE thread_id=? AND checkpoint_id NOT IN ("
+                            " SELECT checkpoint_id FROM checkpoints c2 WHERE c2.thread_id=checkpoints.thread_id"
+                            " AND c2.ns=checkpoints.ns ORDER BY checkpoint_id DESC LIMIT ?)",
+                            (thread_id, self.keep_last),
+                        )
+                        pruned += cur.rowcount
+                        db.execute(
+                            "DELETE FROM writes WHERE thread_id=? AND NOT EXISTS ("
+                            " SELECT 1 FROM checkpoints c WHERE c.thread_id=writes.thread_id"
+                            " AND c.ns=writes.ns AND c.checkpoint_id=writes.checkpoint_id)",
+                            (thread_id,),
+                        )
+            except BaseException:
+                self._dirty |= dirty               # retried next round
+                raise
+
+            # other shard workers' threads are theirs to expire
+            expired = [t for (t,) in db.execute(
+                "SELECT thread_id FROM threads WHERE last_seen < ? AND owner = ?",
+                (time.time() - self.ttl, self.owner),
+            )] if self.ttl > 0 else []
+            if expired:
+                self._delete_threads(expired)
+            db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        if pruned or expired:
+            log.info("[CHECKPOINT] compacted threads=%s pruned=%s expired=%s", len(dirty), pruned, len(expired))
+        return {"threads": len(dirty), "pruned": pruned, "expired": len(expired)}
+
+    def _compact_loop(self) -> None:
+        while not self._stop.wait(self.compact_interval):
+            try:
+                self.compact()
+            except Exception as e:
+                log.warning("[CHECKPOINT] compaction failed: %r", e)
+
+
+def _config(thread_id: str, ns: str, checkpoint_id: str) -> RunnableConfig:
+    return {"configurable": {"thread_id": thread_id, "checkpoint_ns": ns, "checkpoint_id": checkpoint_id}}
@@ -1,33 +1,60 @@
 # app/graph/graph_builder.py
 # ─────────────────────────────────────────────────────────────────────────────
 from __future__ import annotations
+import asyncio
+import uuid
+from functools import lru_cache
 from typing import Dict, Any, List, TypedDict
 
 from langgraph.graph import StateGraph, END
-from langgraph.checkpoint.memory import MemorySaver
 from langgraph.prebuilt import tools_condition
 
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import (
     SystemMessage, AIMessage, ToolMessage, BaseMessage, HumanMessage
 )
 
+from app import metrics
+from app.agent.runtime import get_llm
 from app.config import settings
+from app.graph import router
+from app.graph.checkpoint import SqliteCheckpointSaver
+from app.graph.speculation import speculation
+from app.rag.context_packer import pack_context
 from app.rag.retrieve_tool import retrieve  # @tool(response_format="content_and_artifact")
+import logging
+log = logging.getLogger(__name__)
 
 # ─── 0) State schema: keep chat_id and the user question explicitly ──────────
 class AgentState(TypedDict):
     messages: List[BaseMessage]
     chat_id: int
     question: str  # <-- new
+    context_tokens: int  # tokens of retrieved context sent to `generate`
+    route: str           # router verdict: tools | direct | decide
 
-# ─── 1) LLM & memory ─────────────────────────────────────────────────────────
-llm = ChatOpenAI(
-    model="gpt-4.1-nano",
-    temperature=0.2,
-    openai_api_key=settings.openai_key,
-)
-memory = MemorySaver()
+# ─── 1) LLM & memory (built on first use; see app.warmup) ───────────────────
+MODEL = "gpt-4.1-nano"
+DEFAULT_K = 4   # retrieve's default chunk count
+
+@lru_cache(maxsize=1)
+def _llm_with_tools():
+    return get_llm(MODEL).bind_tools([retrieve])   # bound once, reused every turn
+
+@lru_cache(maxsize=1)
+def get_memory() -> SqliteCheckpointSaver:
+    return SqliteCheckpointSaver(
+        settings.checkpoint_path,
+        keep_last=settings.checkpoint_keep_last,
+        ttl=settings.checkpoint_ttl,
+        compact_interval=settings.checkpoint_compact_interval,
+        cache_threads=settings.checkpoint_cache_threads,
+        owner=settings.shard_node,
+    )
+
+def close_memory() -> None:
+    """Close the checkpointer if it was ever opened."""
+    if get_memory.cache_info().currsize:
+        get_memory().close()
 
 # ─── helpers ─────────────────────────────────────────────────────────────────
 def _latest_human(msgs: List[BaseMessage]) -> str:
@@ -38,14 +65,51 @@ def _latest_human(msgs: List[BaseMessage]) -> str:
                 return txt.strip()
     return ""
 
+# ─── 1b) Node: local fast-path router ───────────────────────────────────────
+async def route_question(state: AgentState) -> Dict[str, Any]:
+    """
+    Settle obvious turns without the `decide` LLM round trip: emit the
+    retrieve tool-call ourselves, or go straight to a plain answer.
+    """
+    question = state.get("question") or _latest_human(state["messages"])
+    if not settings.fast_router:
+        return {"route": router.DECIDE, "question": question}
+
+    verdict = await router.route(state["chat_id"], question)
+    metrics.routes.inc(1, verdict.target)
+    log.info(
+        "[ROUTER] chat=%s route=%s reason=%s sim=%s",
+        state["chat_id"], verdict.target, verdict.reason, verdict.similarity,
+    )
+    out: Dict[str, Any] = {"route": verdict.target, "question": question}
+    if verdict.target == router.TOOLS:
+        out["messages"] = [AIMessage(content="", tool_calls=[{
+            "name": "retrieve",
+            "args": {"question": question, "k": DEFAULT_K},
+            "id":   f"route_{uuid.uuid4().hex[:12]}",
+        }])]
+    return out
+
+def _after_route(state: AgentState) -> str:
+    return state.get("route") or router.DECIDE
+
+# ─── 2a) Node: direct answer (router already ruled out retrieval) ───────────
+async def answer_directly(state: AgentState) -> Dict[str, Any]:
+    sys_msg = SystemMessage(content=(
+        "You are a study assistant. Answer directly, briefly and accurately "
+        "from general knowledge. Keep the answer concise and structured."
+    ))
+    response = await get_llm(MODEL).ainvoke([sys_msg, *state["messages"]])
+    metrics.record_usage(MODEL, response)
+    return {"messages": [response]}
+
 # ─── 2) Node: decide or answer ───────────────────────────────────────────────
-def query_or_respond(state: AgentState) -> Dict[str, Any]:
+async def query_or_respond(state: AgentState) -> Dict[str, Any]:
     """
     If general-knowledge → answer directly.
     Else → emit a tool-call to `retrieve`.
     Also ensure state['question'] is set.
     """
-    llm_with_tools = llm.bind_tools([retrieve])
     chat_id = state.get("chat_id", "unknown")
 
     # ensure we carry the question explicitly
@@ -68,85 +132,102 @@ def query_or_respond(state: AgentState) -> Dict[str, Any]:
     ]
     msgs = fewshots + state["messages"]
 
-    response = llm_with_tools.invoke(msgs)
+    # retrieval for the question overlaps the LLM call; run_tools picks it up
+    speculate = settings.speculative_retrieval and isinstance(chat_id, int) and bool(question)
+    if speculate:
+        speculation.start(chat_id, question, DEFAULT_K, retrieve.coroutine)
+    try:
+        response = await _llm_with_tools().ainvoke(msgs)
+    except BaseException:
+        if speculate:
+            speculation.cancel(chat_id)
+        raise
+    metrics.record_usage(MODEL, response)
+    if speculate and not response.tool_calls:
+        speculation.cancel(chat_id)   # answered directly
     # return the AIMessage *and* the stabilized question back into state
     return {"messages": [response], "question": question}
 
 # ─── 3) Node: run tools (force the real chat_id) ─────────────────────────────
-def run_tools(state: AgentState) -> Dict[str, Any]:
-    msgs = state["messages"]
-    if not msgs or not isinstance(msgs[-1], AIMessage) or not msgs[-1].tool_calls:
-        return {"messages": []}
+async def _retrieve_or_reuse(args: Dict[str, Any], chat_id: int):
+    spec = speculation.take(chat_id, args.get("question", ""), args.get("k", DEFAULT_K))
+    if spec is not None:
+        try:
+            return await spec
+        except Exception as e:
+            log.warning("[SPECULATE] chat=%s speculative retrieve failed, retrying: %r", chat_id, e)
+    return await retrieve.coroutine(**args)
 
-    chat_id = state["chat_id"]
-    outs: List[ToolMessage] = []
+async def _run_retrieve(call: Dict[str, Any], chat_id: int) -> ToolMessage:
+    args = dict(call.get("args", {}) or {})
+    args["chat_id"] = chat_id  # hard override to the correct user
 
-    for call in msgs[-1].tool_calls:
-        if call.get("name") != "retrieve":
-            continue
+    # retrieve must return (content_for_llm, chunks_list)
+    try:
+        with metrics.span(metrics.tool_seconds, "retrieve"):
+            content_for_llm, chunks_list = await _retrieve_or_reuse(args, chat_id)
+    except Exception as e:
+        return ToolMessage(
+            tool_call_id=call["id"],
+            name="retrieve",
+            content=f"[retrieve error] {type(e).__name__}: {e}",
+        )
 
-        args = dict(call.get("args", {}) or {})
-        args["chat_id"] = chat_id  # hard override to the correct user
+    # Make the retrieved text visible to the LLM
+    if isinstance(chunks_list, list) and chunks_list:
+        tool_text = "\n\n".join(str(x) for x in chunks_list)
+    else:
+        tool_text = (content_for_llm or "").strip()
 
-        # retrieve must return (content_for_llm, chunks_list)
-        try:
-            content_for_llm, chunks_list = retrieve.func(**args)
-        except Exception as e:
-            outs.append(
-                ToolMessage(
-                    tool_call_id=call["id"],
-                    name="retrieve",
-                    content=f"[retrieve error] {type(e).__name__}: {e}",
-                )
-            )
-            continue
-
-        # Make the retrieved text visible to the LLM
-        if isinstance(chunks_list, list) and chunks_list:
-            tool_text = "\n\n".join(str(x) for x in chunks_list)
-        else:
-            tool_text = (content_for_llm or "").strip()
-
-        outs.append(
-            ToolMessage(
-                tool_call_id=call["id"],
-                name="retrieve",
-                content=tool_text,
-                artifact=chunks_list,  # raw payload (for inspection/tracing)
-            )
-        )
+    return ToolMessage(
+        tool_call_id=call["id"],
+        name="retrieve",
+        content=tool_text,
+        artifact=chunks_list,  # raw payload (for inspection/tracing)
+    )
+
+async def run_tools(state: AgentState) -> Dict[str, Any]:
+    msgs = state["messages"]
+    if not msgs or not isinstance(msgs[-1], AIMessage) or not msgs[-1].tool_calls:
+        return {"messages": []}
 
+    chat_id = state["chat_id"]
+    calls = [c for c in msgs[-1].tool_calls if c.get("name") == "retrieve"]
+    outs: List[ToolMessage] = list(
+        await asyncio.gather(*(_run_retrieve(call, chat_id) for call in calls))
+    )
     return {"messages": outs}
 
 # ─── 4) Node: final generation ───────────────────────────────────────────────
-MAX_CTX_CHARS = 8000
-
-def _gather_context_since_last_toolcall(msgs: List[BaseMessage]) -> str:
-    parts: List[str] = []
+def _chunks_since_last_toolcall(msgs: List[BaseMessage]) -> List[str]:
+    """Retrieved chunks of the current turn, best-ranked first per tool call."""
+    groups: List[List[str]] = []
     for m in reversed(msgs):
         t = getattr(m, "type", None)
         if t == "tool":
-            c = getattr(m, "content", "")
-            if isinstance(c, str) and c.strip():
-                parts.append(c.strip())
+            art = getattr(m, "artifact", None)
+            if isinstance(art, list) and art:
+                groups.append([str(x) for x in art])
+            elif isinstance(art, str) and art.strip():
+                groups.append([art.strip()])
             else:
-                art = getattr(m, "artifact", None)
-                if isinstance(art, list) and art:
-                    parts.append("\n\n".join(str(x) for x in art))
-                elif isinstance(art, str) and art.strip():
-                    parts.append(art.strip())
+                c = getattr(m, "content", "")
+                if isinstance(c, str) and c.strip():
+                    groups.append([c.strip()])
         elif t == "ai" and getattr(m, "tool_calls", None):
             break
-    parts.reverse()
-    ctx = "\n\n---\n\n".join(parts)
-    if len(ctx) > MAX_CTX_CHARS:
-        ctx = ctx[:MAX_CTX_CHARS] + "\n\n[Context truncated]"
-    return ctx
+    groups.reverse()
+    return [chunk for group in groups for chunk in group]
 
-def generate(state: AgentState) -> Dict[str, Any]:
+async def generate(state: AgentState) -> Dict[str, Any]:
     # guaranteed by query_or_respond / handler
     question = (state.get("question") or "").strip()
-    context_text = _gather_context_since_last_toolcall(state["messages"])
+    packed = pack_context(_chunks_since_last_toolcall(state["messages"]), MODEL)
+    context_text = packed.text
+    log.info(
+        "[GENERATE] chat=%s context_tokens=%s segments=%s dropped=%s",
+        state.get("chat_id"), packed.tokens, packed.used, packed.dropped,
+    )
 
     sys = (
         "You are a study assistant. Answer ONLY using the CONTEXT below. "
@@ -167,20 +248,35 @@ def generate(state: AgentState) -> Dict[str, Any]:
             break
 
     prompt = [sys_msg, *last_human]
-    response = llm.invoke(prompt)
-    return {"messages": [response]}
+    response = await get_llm(MODEL).ainvoke(prompt)
+    metrics.record_usage(MODEL, response)
+    return {"messages": [response], "context_tokens": packed.tokens}
 
 # ─── 5) Build & compile ─────────────────────────────────────────────────────
+def _timed(name: str, node):
+    return metrics.timed(metrics.node_seconds, name)(node)
+
 def build_graph():
+    memory = get_memory()
     sg = StateGraph(AgentState, config={"memory": memory})
-    sg.add_node("decide",   query_or_respond)
-    sg.add_node("tools",    run_tools)
-    sg.add_node("generate", generate)
+    sg.add_node("route",    _timed("route", route_question))
+    sg.add_node("answer",   _timed("answer", answer_directly))
+    sg.add_node("decide",   _timed("decide", query_or_respond))
+    sg.add_node("tools",    _timed("tools", run_tools))
+    sg.add_node("generate", _timed("generate", generate))
 
-    sg.set_entry_point("decide")
+    sg.set_entry_point("route")
+    sg.add_conditional_edges(
+        "route", _after_route,
+        {router.TOOLS: "tools", router.DIRECT: "answer", router.DECIDE: "decide"},
+    )
+    sg.add_edge("answer", END)
     sg.add_conditional_edges("decide", tools_condition, {END: END, "tools": "tools"})
     sg.add_edge("tools", "generate")
     sg.add_edge("generate", END)
     return sg.compile(checkpointer=memory)
 
-graph = build_graph()
+@lru_cache(maxsize=1)
+def get_graph():
+    """The compiled graph, shared by every chat."""
+    return build_graph()
@@ -0,0 +1,99 @@
+# app/graph/router.py
+# ─────────────────────────────────────────────────────────────────────────────
+# Cheap local routing in front of the `decide` LLM call.
+#
+# Most turns are obviously one of: small talk / general knowledge (answer
+# directly) or a question about the user's own material (retrieve). Those are
+# settled here from local signals; only unclear turns pay for `decide`.
+from __future__ import annotations
+import asyncio
+import re
+from dataclasses import dataclass
+from typing import Optional
+
+from app.agent.runtime import get_embeddings
+from app.config import settings
+from app.rag.corpus import asearch, has_documents
+from app.rag.lexical import lexical
+import logging
+log = logging.getLogger(__name__)
+
+TOOLS, DIRECT, DECIDE = "tools", "direct", "decide"
+
+_SMALLTALK = re.compile(
+    r"^\s*(hi|hello|hey|yo|thanks|thank you|thx|ok|okay|cool|great|bye|good (morning|evening|night))\b[\s!.?]*$",
+    re.I,
+)
+# only unmistakable references to the user's own material: "the book" or
+# "according to" alone also open plenty of general-knowledge questions
+_DOC_HINTS = re.compile(
+    r"\b(my|our|this|these|uploaded)\s+(notes?|lectures?|slides?|pdfs?|documents?|files?|"
+    r"textbook|materials?|handouts?|syllabus|assignments?|homework)\b"
+    r"|\b(theorem|lemma|definition|corollary|proposition|equation|eq\.|figure|fig\.|table|"
+    r"section|chapter|page|example|exercise|problem)\s*\d"
+    r"|\bin the (pdf|notes|slides|handout)\b",
+    re.I,
+)
+
+@dataclass
+class Route:
+    target: str                        # TOOLS | DIRECT | DECIDE
+    reason: str
+    similarity: Optional[float] = None
+
+
+async def _best_similarity(chat_id: int, question: str) -> Optional[float]:
+    """Cosine similarity of the closest chunk."""
+    try:
+        vec  = await get_embeddings().aembed_query(question)
+        hits = await asyncio.wait_for(
+            asearch(chat_id, vec, 1), timeout=settings.router_probe_timeout,
+        )
+    except Exception as e:
+        log.warning("[ROUTER] chat=%s similarity probe failed: %r", chat_id, e)
+        return None
+    return hits[0].score if hits else None
+
+
+async def _has_vectors(chat_id: int) -> bool:
+    try:
+        return await has_documents(chat_id)
+    except Exception as e:
+        log.warning("[ROUTER] chat=%s count failed: %r", chat_id, e)
+        return True   # unknown → let `decide` handle it
+
+
+async def route(chat_id: int, question: str) -> Route:
+    q = question.strip()
+    if not q or _SMALLTALK.match(q):
+        return Route(DIRECT, "smalltalk")
+
+    # explicit references to "my notes", "theorem 2.3", … → retrieve (even with
+    # nothing uploaded, `generate` then tells the user what to upload)
+    if _DOC_HINTS.search(q):
+        return Route(TOOLS, "keyword")
+
+    index = lexical.get(chat_id) if lexical.is_loaded(chat_id) else \
+        await asyncio.to_thread(lexical.get, chat_id)
+    if not len(index):
+        # chats indexed before the lexical index existed: ask Chroma once
+        if await _has_vectors(chat_id):
+            return Route(DECIDE, "no_lexical_index")
+        return Route(DIRECT, "no_documents")
+
+    # one chunk matching the query's (rare) terms together is evidence; terms
+    # merely present somewhere in a textbook-sized vocabulary are not
+    match = index.best_match(q)
+    if match >= settings.router_lexical_match:
+        return Route(TOOLS, f"lexical:{match:.2f}")
+
+    if settings.router_vector_probe:
+        sim = await _best_similarity(chat_id, q)
+        if sim is not None:
+            if sim >= settings.router_sim_high:
+                return Route(TOOLS, "similarity", sim)
+            if sim <= settings.router_sim_low and match == 0:
+                return Route(DIRECT, "similarity", sim)
+        return Route(DECIDE, "unclear", sim)
+
+    return Route(DECIDE, "unclear")
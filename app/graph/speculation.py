@@ -0,0 +1,74 @@
+# app/graph/speculation.py
+# ─────────────────────────────────────────────────────────────────────────────
+# Speculative retrieval: while `decide` waits on the LLM, retrieval for the
+# latest question already runs. If decide then calls `retrieve` with the same
+# arguments, `run_tools` takes the finished (or nearly finished) result;
+# otherwise the speculative task is cancelled and discarded.
+from __future__ import annotations
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import logging
+log = logging.getLogger(__name__)
+
+Retrieval = Tuple[str, Any]   # retrieve.coroutine's (content, chunks)
+
+
+def _norm(question: str) -> str:
+    return " ".join((question or "").split()).casefold()
+
+
+class SpeculativeRetrievals:
+    """At most one in-flight speculative retrieval per chat, plus outcome counters."""
+
+    def __init__(self):
+        self._tasks: Dict[int, Tuple[str, int, "asyncio.Task[Retrieval]"]] = {}
+        self.counts: Dict[str, int] = {"started": 0, "hit": 0, "miss": 0, "cancelled": 0}
+
+    def start(self, chat_id: int, question: str, k: int,
+              fn: Callable[..., Awaitable[Retrieval]]) -> None:
+        self.cancel(chat_id, count=False)
+        task = asyncio.ensure_future(fn(question=question, chat_id=chat_id, k=k))
+        task.add_done_callback(_swallow)
+        self._tasks[chat_id] = (_norm(question), k, task)
+        self.counts["started"] += 1
+
+    def take(self, chat_id: int, question: str, k: int) -> Optional["asyncio.Task[Retrieval]"]:
+        """The speculative task if it matches the real tool call; else cancel it."""
+        entry = self._tasks.pop(chat_id, None)
+        if entry is None:
+            return None
+        q, spec_k, task = entry
+        if q == _norm(question) and spec_k == k:
+            self.counts["hit"] += 1
+            log.info("[SPECULATE] chat=%s hit done=%s", chat_id, task.done())
+            return task
+        task.cancel()
+        self.counts["miss"] += 1
+        log.info("[SPECULATE] chat=%s miss (tool args differ)", chat_id)
+        return None
+
+    def cancel(self, chat_id: int, count: bool = True) -> None:
+        entry = self._tasks.pop(chat_id, None)
+        if entry is not None:
+            entry[2].cancel()
+            if count:
+                self.counts["cancelled"] += 1
+
+    @property
+    def hit_rate(self) -> float:
+        decided = self.counts["hit"] + self.counts["miss"] + self.counts["cancelled"]
+        return self.counts["hit"] / decided if decided else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.counts, "in_flight": len(self._tasks), "hit_rate": round(self.hit_rate, 3)}
+
+
+def _swallow(task: "asyncio.Task") -> None:
+    # an unused speculative task may fail; mark its error as seen so asyncio
+    # doesn't log "Task exception was never retrieved"
+    if not task.cancelled():
+        task.exception()
+
+
+speculation = SpeculativeRetrievals()
@@ -1,28 +1,105 @@
 # app/main.py
 from __future__ import annotations
-from fastapi import FastAPI, Request
-from telegram import Update
+import asyncio
+import logging
+import sys
+from functools import lru_cache
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse
 from contextlib import asynccontextmanager
 
+from telegram.ext import Application
+
+from app import metrics
+from app.bot.admission import admission
+from app.bot.ingest_jobs import ingest_jobs
 from app.bot.handlers import build_application
+from app.bot.ingress import WebhookIngress, QUEUED, DUPLICATE, DROPPED, REJECTED
 from app.config import settings
+from app.graph.speculation import speculation
+from app.warmup import warmup
+
+logging.basicConfig(
+    level=settings.log_level,
+    format="%(asctime)s %(levelname)s %(name)s %(message)s",
+)
+log = logging.getLogger(__name__)
+
+# Both built on first use (the lifespan); the graph, LLM and vector clients
+# are loaded by app.warmup after the server is already listening
+@lru_cache(maxsize=1)
+def get_telegram_app() -> Application:
+    return build_application(settings.telegram_token)
+
+@lru_cache(maxsize=1)
+def get_ingress() -> WebhookIngress:
+    tg = get_telegram_app()
+    return WebhookIngress(
+        tg.update_queue, tg.bot,
+        policy=settings.update_overflow_policy,
+        dedup_size=settings.update_dedup_size,
+        max_pending=settings.update_queue_size,
+        processor=tg.update_processor,
+    )
+
+def _embed_pending() -> dict:
+    from app.agent.runtime import get_embeddings
+    return {(): get_embeddings().pending} if get_embeddings.cache_info().currsize else {}
 
-# Build both apps
-telegram_app = build_application(settings.telegram_token)
+def _history_sessions() -> dict:
+    history = sys.modules.get("app.agent.history")
+    return {(): len(history.histories)} if history is not None else {}
+
+# queue depths and component-owned counters, read at scrape time
+metrics.gauge("learnbot_ready", "1 once startup warm-up has finished successfully.",
+              fn=lambda: {(): int(warmup.ready)})
+metrics.gauge("learnbot_updates_pending", "Webhook updates accepted and not finished (queued or running).",
+              fn=lambda: {(): get_ingress().pending})
+metrics.gauge("learnbot_turns", "Question turns admitted, by state.", ["state"],
+              fn=lambda: {("waiting",): admission.waiting, ("running",): admission.running})
+metrics.gauge("learnbot_history_sessions", "Conversation histories held in memory.",
+              fn=_history_sessions)
+metrics.gauge("learnbot_embed_queue_depth", "Embedding requests waiting for a batch.",
+              fn=_embed_pending)
+metrics.gauge("learnbot_ingest_jobs", "Background ingest jobs, by status.", ["status"],
+              fn=lambda: {(k,): v for k, v in ingest_jobs.counts().items()})
+metrics.counter_fn("learnbot_webhook_updates_total", "Webhook updates by ingress outcome.", ["outcome"],
+                   fn=lambda: {(k,): v for k, v in get_ingress().counts.items()})
+metrics.counter_fn("learnbot_speculation_total", "Speculative retrievals by outcome.", ["outcome"],
+                   fn=lambda: {(k,): v for k, v in speculation.counts.items()})
+
+async def _init_telegram() -> None:
+    await get_telegram_app().initialize()
+
+async def _start_telegram() -> None:
+    tg = get_telegram_app()
+    await tg.start()
+    ingest_jobs.start(tg.bot)       # resumes uploads a previous run left unfinished
+    log.info("[PTB] started running=%s", tg.running)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # --- START PTB ---
-    await telegram_app.initialize()
-    await telegram_app.start()
-    print("PTB started:", telegram_app.running)   # should print True
+    # updates are accepted (queued) right away; PTB starts once the warm-up has
+    # loaded the graph, so no handler builds it concurrently
+    get_ingress()
+    warmup.start(_init_telegram, _start_telegram)
     try:
         yield
     finally:
+        await warmup.stop()
+        await ingest_jobs.stop()
         # --- STOP PTB ---
-        await telegram_app.stop()
-        await telegram_app.shutdown()
-        print("PTB stopped")
+        tg = get_telegram_app()
+        if tg.running:
+            await tg.stop()
+        await tg.shutdown()
+        graph_builder = sys.modules.get("app.graph.graph_builder")
+        if graph_builder is not None:
+            graph_builder.close_memory()
+        history = sys.modules.get("app.agent.history")
+        if history is not None:
+            await asyncio.to_thread(history.histories.flush)   # conversations survive the restart
+        log.info("[PTB] stopped ingress=%s", get_ingress().stats())
 
 app = FastAPI(lifespan=lifespan)
 
@@ -32,8 +109,19 @@ async def root():
 
 @app.post("/webhook")
 async def telegram_webhook(req: Request):
-    data = await req.json()
-    update = Update.de_json(data, telegram_app.bot)
-    print("Webhook hit:", data.get("update_id"))
-    await telegram_app.update_queue.put(update)
-    return {"ok": True}
+    # ack as soon as the update is queued; handlers run on PTB's workers
+    outcome = get_ingress().accept(await req.body())
+    if outcome in (QUEUED, DUPLICATE, DROPPED):
+        return {"ok": True}
+    if outcome == REJECTED:
+        return Response(status_code=503, headers={"Retry-After": "5"})
+    return Response(status_code=400)
+
+@app.get("/ready")
+async def ready():
+    # readiness probe: 503 until warm-up has loaded everything and PTB runs
+    return JSONResponse(warmup.status(), status_code=200 if warmup.ready else 503)
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
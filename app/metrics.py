@@ -0,0 +1,223 @@
+# app/metrics.py
+# ─────────────────────────────────────────────────────────────────────────────
+# Minimal in-process metrics with Prometheus text exposition (no dependency).
+#
+# Recording is a dict lookup, a bisect and a few adds under an uncontended
+# lock (~1 µs), so instrumentation stays on in production. Label values are
+# passed positionally in the order of `labels`.
+from __future__ import annotations
+import bisect
+import functools
+import inspect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+
+LabelValues = Tuple[str, ...]
+
+# seconds: covers in-process calls (sub-ms) up to slow LLM calls
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _fmt(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+def _esc(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    parts = [f'{n}="{_esc(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return self._header() + [f"{self.name}{_labels(self.labelnames, k)} {_fmt(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    """Set directly, or computed at scrape time from `fn` → {label values: value}."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (),
+                 fn: Callable[[], Dict[LabelValues, float]] = None):
+        super().__init__(name, help, labels)
+        self._values: Dict[LabelValues, float] = {}
+        self.fn = fn
+
+    def set(self, value: float, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+    def render(self) -> List[str]:
+        if self.fn is not None:
+            try:
+                items = list(self.fn().items())
+            except Exception:
+                items = []
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        return self._header() + [f"{self.name}{_labels(self.labelnames, k)} {_fmt(v)}" for k, v in items]
+
+
+class CounterFn(Gauge):
+    """A counter owned by another component (its own counts dict), read at scrape time."""
+
+    kind = "counter"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[LabelValues, List[float]] = {}   # [count per bucket..., +Inf, sum]
+
+    def observe(self, value: float, *labels: str) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0.0] * (len(self.buckets) + 2)
+            series[i] += 1
+            series[-1] += value
+
+    def count(self, *labels: str) -> int:
+        series = self._series.get(labels)
+        return int(sum(series[:-1])) if series else 0
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._series.items()]
+        out = self._header()
+        for key, series in items:
+            cumulative = 0.0
+            for bound, n in zip(self.buckets + (math.inf,), series[:-1]):
+                cumulative += n
+                le = 'le="%s"' % _fmt(bound)
+                out.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {_fmt(cumulative)}")
+            out.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_fmt(series[-1])}")
+            out.append(f"{self.name}_count{_labels(self.labelnames, key)} {_fmt(cumulative)}")
+        return out
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        # re-registering a name (module reload, tests) replaces the old one
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+def counter(name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+    return registry.register(Counter(name, help, labels))
+
+def gauge(name: str, help: str, labels: Sequence[str] = (), fn=None) -> Gauge:
+    return registry.register(Gauge(name, help, labels, fn))
+
+def counter_fn(name: str, help: str, labels: Sequence[str], fn) -> CounterFn:
+    return registry.register(CounterFn(name, help, labels, fn))
+
+def histogram(name: str, help: str, labels: Sequence[str] = (), buckets=LATENCY_BUCKETS) -> Histogram:
+    return registry.register(Histogram(name, help, labels, buckets))
+
+
+@contextmanager
+def span(hist: Histogram, *labels: str) -> Iterator[None]:
+    """Time the block into `hist` (errors included)."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        hist.observe(time.perf_counter() - t0, *labels)
+
+def timed(hist: Histogram, *labels: str):
+    """Decorator form of `span` for sync and async functions."""
+    def wrap(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def awrapper(*args, **kwargs):
+                with span(hist, *labels):
+                    return await fn(*args, **kwargs)
+            return awrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(hist, *labels):
+                return fn(*args, **kwargs)
+        return wrapper
+    return wrap
+
+
+# ─── the bot's metrics ───────────────────────────────────────────────────────
+node_seconds   = histogram("learnbot_graph_node_seconds", "Time spent in each graph node.", ["node"])
+tool_seconds   = histogram("learnbot_tool_seconds", "Tool call latency.", ["tool"])
+turn_seconds   = histogram("learnbot_turn_seconds", "Question turn latency end to end.", ["path"])
+embed_seconds  = histogram("learnbot_embed_request_seconds", "Embedding API request latency (one batch).")
+embed_inputs   = counter("learnbot_embed_inputs_total", "Texts sent to the embedding API.")
+embed_batches  = histogram("learnbot_embed_batch_inputs", "Inputs per embedding API request.",
+                           buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512))
+vector_seconds = histogram("learnbot_vector_op_seconds", "Vector store operation latency.", ["backend", "op"])
+ingest_seconds = histogram("learnbot_ingest_stage_seconds", "Ingest stage time: extract/embed/write per batch, download/total per upload.", ["stage"])
+ingest_chunks  = counter("learnbot_ingest_chunks_total", "Chunks seen by ingest.", ["result"])
+ingest_pages   = counter("learnbot_ingest_pages_total", "PDF pages ingested.")
+corpus_uploads = counter("learnbot_corpus_uploads_total", "Uploads by shared-corpus outcome.", ["result"])
+llm_tokens     = counter("learnbot_llm_tokens_total", "LLM tokens used.", ["model", "kind"])
+routes         = counter("learnbot_route_total", "Local router verdicts.", ["route"])
+answer_cache   = counter("learnbot_answer_cache_total", "Semantic answer cache lookups.", ["result"])
+history_summary_seconds = histogram("learnbot_history_summary_seconds", "Background conversation summary refresh latency.")
+
+
+def record_usage(model: str, message) -> None:
+    usage = getattr(message, "usage_metadata", None) or {}
+    if usage:
+        llm_tokens.inc(usage.get("input_tokens", 0), model, "prompt")
+        llm_tokens.inc(usage.get("output_tokens", 0), model, "completion")
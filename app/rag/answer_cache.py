@@ -0,0 +1,144 @@
+# app/rag/answer_cache.py
+from __future__ import annotations
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.agent.runtime import get_embeddings
+from app.config import settings
+import logging
+log = logging.getLogger(__name__)
+
+
+def _normalize(question: str) -> str:
+    return re.sub(r"\s+", " ", question).strip().lower().rstrip("?!. ")
+
+# follow-ups lean on the previous turns ("why?", "explain it more", "and for
+# gases?"); the same words in another conversation mean something else
+_FOLLOW_UP = re.compile(
+    r"\b(it|its|this|that|these|those|they|them|their|he|she|him|her|above|previous|earlier|"
+    r"again|more|else|another|example|elaborate|continue|same|instead)\b"
+    r"|^\W*(and|but|so|then|why|what about|how about)\b",
+    re.I,
+)
+MIN_WORDS = 4
+
+def standalone(question: str) -> bool:
+    """True if the question can be answered without the conversation before it."""
+    return len(re.findall(r"\w+", question)) >= MIN_WORDS and not _FOLLOW_UP.search(question)
+
+@dataclass
+class _Entry:
+    key: str           # normalized question text
+    vec: np.ndarray    # unit-length float32 embedding
+    answer: str
+    created: float
+
+
+class SemanticAnswerCache:
+    """
+    Per-chat cache of answered questions, matched by embedding similarity.
+
+    A lookup first tries the normalized text (no embedding call), then embeds
+    the question and compares it with the chat's earlier questions; cosine
+    similarity ≥ `threshold` returns the stored answer. Entries expire after
+    `ttl` seconds; each chat keeps at most `max_per_chat` entries and at most
+    `max_chats` chats are kept (both LRU). `invalidate(chat_id)` drops a chat's
+    entries, e.g. after new material was ingested, and bumps the chat's
+    generation: an answer whose lookup saw an older generation was computed
+    without that material and is not stored. Questions that depend on
+    earlier turns (short or anaphoric ones) bypass the cache.
+    """
+
+    def __init__(self, threshold: float, ttl: float, max_per_chat: int, max_chats: int):
+        self.threshold    = threshold
+        self.ttl          = ttl
+        self.max_per_chat = max_per_chat
+        self.max_chats    = max_chats
+        self._chats: "OrderedDict[int, List[_Entry]]" = OrderedDict()
+        self._gens: Dict[int, int] = {}         # chat → invalidations so far
+        self._lock = threading.Lock()   # ingest invalidates from worker threads
+
+    def _live(self, chat_id: int, now: float) -> List[_Entry]:
+        # caller holds self._lock
+        entries = [e for e in self._chats.get(chat_id, []) if now - e.created <= self.ttl]
+        if entries:
+            self._chats[chat_id] = entries
+            self._chats.move_to_end(chat_id)
+        else:
+            self._chats.pop(chat_id, None)
+        return entries
+
+    def _touch(self, chat_id: int, entry: _Entry) -> None:
+        entries = self._chats.get(chat_id)
+        if entries and entry in entries:
+            entries.remove(entry)
+            entries.append(entry)
+
+    async def lookup(self, chat_id: int, question: str) -> Tuple[Optional[str], Optional[np.ndarray], int]:
+        """Return (answer or None, question vector, generation), the last two for `store` on a miss."""
+        with self._lock:
+            gen = self._gens.get(chat_id, 0)
+        if not standalone(question):
+            return None, None, gen             # not cached either: `store` skips vec=None
+        key = _normalize(question)
+        now = time.monotonic()
+        with self._lock:
+            entries = self._live(chat_id, now)
+            for e in entries:
+                if e.key == key:
+                    self._touch(chat_id, e)
+                    log.info("[CACHE] exact hit chat=%s", chat_id)
+                    return e.answer, e.vec, gen
+
+        vec = np.asarray(await get_embeddings().aembed_query(question), dtype=np.float32)
+        vec /= (np.linalg.norm(vec) or 1.0)
+        if not entries:
+            return None, vec, gen
+
+        with self._lock:
+            entries = self._live(chat_id, now)
+            if not entries:
+                return None, vec, gen
+            sims = np.stack([e.vec for e in entries]) @ vec
+            best = int(np.argmax(sims))
+            if sims[best] >= self.threshold:
+                self._touch(chat_id, entries[best])
+                log.info("[CACHE] hit chat=%s sim=%.3f", chat_id, sims[best])
+                return entries[best].answer, vec, gen
+        return None, vec, gen
+
+    def store(self, chat_id: int, question: str, vec: Optional[np.ndarray], answer: str, gen: int) -> None:
+        """`gen` is what `lookup` returned; an invalidation since then drops the answer."""
+        if vec is None or not answer.strip():
+            return
+        key = _normalize(question)
+        with self._lock:
+            if self._gens.get(chat_id, 0) != gen:
+                log.info("[CACHE] stale answer not stored chat=%s", chat_id)
+                return
+            entries = [e for e in self._chats.get(chat_id, []) if e.key != key]
+            entries.append(_Entry(key, vec, answer, time.monotonic()))
+            self._chats[chat_id] = entries[-self.max_per_chat:]
+            self._chats.move_to_end(chat_id)
+            while len(self._chats) > self.max_chats:
+                self._chats.popitem(last=False)
+
+    def invalidate(self, chat_id: int) -> None:
+        with self._lock:
+            self._gens[chat_id] = self._gens.get(chat_id, 0) + 1
+            if self._chats.pop(chat_id, None):
+                log.info("[CACHE] invalidated chat=%s", chat_id)
+
+
+answer_cache = SemanticAnswerCache(
+    threshold=settings.answer_cache_threshold,
+    ttl=settings.answer_cache_ttl,
+    max_per_chat=settings.answer_cache_per_chat,
+    max_chats=settings.answer_cache_max_chats,
+)
@@ -0,0 +1,146 @@
+# app/rag/context_packer.py
+from __future__ import annotations
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable, List, Optional, Tuple
+
+from app.config import settings
+from app.rag.pdf_loader import OVERLAP
+import logging
+log = logging.getLogger(__name__)
+
+SEPARATOR   = "\n\n---\n\n"
+MIN_OVERLAP = 20   # shorter shared edges are treated as coincidence
+
+@lru_cache(maxsize=None)
+def _encoding(model: str):
+    import tiktoken
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        pass
+    try:
+        return tiktoken.get_encoding("o200k_base")   # gpt-4o / 4.1 family
+    except Exception as e:  # BPE file not cached and no network
+        log.warning("[CONTEXT] no tiktoken encoding for %s (%s); approximating", model, e)
+        return None
+
+def count_tokens(text: str, model: str) -> int:
+    enc = _encoding(model)
+    if enc is None:
+        return len(text) // 4 + 1
+    return len(enc.encode(text, disallowed_special=()))
+
+def budget_for(model: str) -> int:
+    return settings.context_token_budgets.get(model, settings.context_token_budget)
+
+
+def _overlap(a: str, b: str) -> int:
+    """Length of the longest suffix of `a` that is a prefix of `b` (≥ MIN_OVERLAP)."""
+    tail  = a[-(OVERLAP * 2):]
+    probe = b[:MIN_OVERLAP]
+    if len(probe) < MIN_OVERLAP:
+        return 0
+    start = 0
+    while True:
+        i = tail.find(probe, start)
+        if i < 0:
+            return 0
+        if b.startswith(tail[i:]):
+            return len(tail) - i   # first match from the left is the longest
+        start = i + 1
+
+# a merged span and the chunks it was built from, best-ranked first
+_Span = Tuple[str, List[str]]
+
+def _merge_once(spans: List[_Span]) -> List[_Span]:
+    merged: List[_Span] = []
+    for text, parts in spans:
+        if not text:
+            continue
+        for i, (seg, seg_parts) in enumerate(merged):
+            if text in seg:
+                merged[i] = (seg, seg_parts + parts)
+                break
+            if seg in text:
+                merged[i] = (text, seg_parts + parts)
+                break
+            ov = _overlap(seg, text)
+            if ov:
+                merged[i] = (seg + text[ov:], seg_parts + parts)
+                break
+            ov = _overlap(text, seg)
+            if ov:
+                merged[i] = (text + seg[ov:], seg_parts + parts)
+                break
+        else:
+            merged.append((text, parts))
+    return merged
+
+def _merge_spans(chunks: List[str]) -> List[_Span]:
+    merged = _merge_once([(c, [c]) for c in (c.strip() for c in chunks)])
+    while len(merged) > 1:
+        again = _merge_once(merged)   # a stitched span may now touch another one
+        if len(again) == len(merged):
+            break
+        merged = again
+    return merged
+
+def merge_overlapping(chunks: List[str]) -> List[str]:
+    """
+    Collapse duplicates and stitch neighbouring chunks that share the splitter
+    overlap, keeping the rank of the best-ranked piece of each merged span.
+    """
+    return [text for text, _ in _merge_spans(chunks)]
+
+
+@dataclass
+class PackedContext:
+    text: str
+    tokens: int        # tokens used by `text`
+    used: int          # segments included (a merged span, or chunks of one that didn't fit)
+    dropped: int       # chunks or segments that did not fit the budget
+
+
+def pack_context(
+    chunks: List[str],
+    model: str,
+    budget: Optional[int] = None,
+    count: Optional[Callable[[str], int]] = None,
+) -> PackedContext:
+    """
+    Pack whole chunks (ranked best-first) into a token budget.
+
+    Overlapping neighbours are merged first so shared text is paid for once;
+    a merged span that doesn't fit falls back to the chunks it was built
+    from. Nothing is cut mid-chunk: a chunk that doesn't fit is skipped, and
+    smaller lower-ranked segments may still fill the remaining budget.
+    """
+    budget = budget_for(model) if budget is None else budget
+    count  = count or (lambda s: count_tokens(s, model))
+    sep    = count(SEPARATOR)
+
+    parts: List[str] = []
+    used = dropped = 0
+
+    def fits(seg: str) -> bool:
+        nonlocal used
+        cost = count(seg) + (sep if parts else 0)
+        if used + cost > budget:
+            return False
+        parts.append(seg)
+        used += cost
+        return True
+
+    for seg, pieces in _merge_spans(chunks):
+        if fits(seg):
+            continue
+        packed = []
+        for piece in pieces:
+            if any(piece in p for p in packed):    # duplicate of a piece already in
+                continue
+            if fits(piece):
+                packed.append(piece)
+            else:
+                dropped += 1
+    return PackedContext(SEPARATOR.join(parts), used, len(parts), dropped)
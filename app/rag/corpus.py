@@ -0,0 +1,245 @@
+# app/rag/corpus.py
+# ─────────────────────────────────────────────────────────────────────────────
+# Content-addressed corpus shared by every chat.
+#
+# A class uploading the same lecture PDF used to embed and store it once per
+# student. Now a document is stored once in the shared tenant (chunk IDs and
+# the `doc_fp` metadata derive from the file's SHA-256). A chat only holds a
+# reference (chat, file name) → fingerprint in a small SQLite registry.
+# Retrieval searches the chat's own collection (chunks indexed before this
+# existed) plus the shared chunks of the documents it references, so chats
+# still only see what they uploaded themselves. Documents nobody references
+# any more are garbage-collected.
+#
+# Indexing, linking and collecting a document hold its `doc_lock`, a thread
+# lock plus an flock on a lock file next to the registry, so shard workers
+# sharing the Chroma server never index or collect the same document at once.
+from __future__ import annotations
+import asyncio
+import fcntl
+import heapq
+import sqlite3
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from app.config import settings
+from app.rag.answer_cache import answer_cache
+from app.rag.lexical import lexical
+from app.vector_store.base import Hit, drop_user_store, get_shared_store, get_user_store
+import logging
+log = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    fp TEXT PRIMARY KEY, chunks INTEGER NOT NULL, indexed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS refs (
+    chat_id INTEGER NOT NULL, source TEXT NOT NULL, fp TEXT NOT NULL, added_at REAL NOT NULL,
+    PRIMARY KEY (chat_id, source)
+);
+CREATE INDEX IF NOT EXISTS refs_fp ON refs (fp);
+CREATE TABLE IF NOT EXISTS private_docs (
+    chat_id INTEGER NOT NULL, source TEXT NOT NULL, fp TEXT NOT NULL, chunks INTEGER NOT NULL,
+    indexed_at REAL NOT NULL, PRIMARY KEY (chat_id, source)
+);
+"""
+
+
+class CorpusRegistry:
+    """Which documents are fully indexed, and which chats reference them."""
+
+    def __init__(self, path: str, cache_chats: int = 10_000):
+        self.path = Path(path)
+        self.cache_chats = cache_chats
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
+        self._docs_for: "OrderedDict[int, Tuple[str, ...]]" = OrderedDict()
+        self._doc_locks: "weakref.WeakValueDictionary[str, threading.Lock]" = weakref.WeakValueDictionary()
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            with self._lock:
+                if self._conn is None:
+                    self.path.parent.mkdir(parents=True, exist_ok=True)
+                    conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.execute("PRAGMA busy_timeout=5000")
+                    conn.executescript(_SCHEMA)
+                    self._conn = conn
+        return self._conn
+
+    def _query(self, sql: str, *args) -> List[tuple]:
+        with self._lock:
+            return self._db().execute(sql, args).fetchall()
+
+    @contextmanager
+    def doc_lock(self, fp: str) -> Iterator[None]:
+        """Serialises indexing, linking and collecting one document across threads and processes."""
+        with self._lock:
+            lock = self._doc_locks.get(fp)
+            if lock is None:
+                lock = self._doc_locks[fp] = threading.Lock()
+        with lock:
+            # 256 striped lock files rather than one per document ever seen
+            locks = self.path.parent / (self.path.name + ".locks")
+            locks.mkdir(parents=True, exist_ok=True)
+            with open(locks / f"{fp[:2]}.lock", "a") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    # ── documents ────────────────────────────────────────────────────────────
+    def chunks(self, fp: str) -> Optional[int]:
+        """Chunk count of a fully indexed document, else None."""
+        row = self._query("SELECT chunks FROM docs WHERE fp = ?", fp)
+        return row[0][0] if row else None
+
+    def mark_indexed(self, fp: str, chunks: int) -> None:
+        self._query("INSERT OR REPLACE INTO docs (fp, chunks, indexed_at) VALUES (?, ?, ?)",
+                    fp, chunks, time.time())
+
+    def collect(self, fp: str) -> bool:
+        """Forget `fp` if no chat references it; True if the caller should delete its chunks."""
+        with self._lock:
+            cur = self._db().execute(
+                "DELETE FROM docs WHERE fp = ? AND NOT EXISTS (SELECT 1 FROM refs WHERE fp = ?)", (fp, fp),
+            )
+            if cur.rowcount:
+                return True
+            # never finished indexing: nothing in `docs`, but chunks may exist
+            return not self._query("SELECT 1 FROM refs WHERE fp = ? LIMIT 1", fp) and self.chunks(fp) is None
+
+    def orphans(self) -> List[str]:
+        return [r[0] for r in self._query(
+            "SELECT fp FROM docs WHERE NOT EXISTS (SELECT 1 FROM refs WHERE refs.fp = docs.fp)")]
+
+    # ── private documents (shared_corpus off, or indexed before it) ──────────
+    def private_doc(self, chat_id: int, source: str) -> Optional[Tuple[str, int]]:
+        """(fingerprint, chunks) of the last upload of `source` that finished indexing."""
+        row = self._query("SELECT fp, chunks FROM private_docs WHERE chat_id = ? AND source = ?",
+                          chat_id, source)
+        return tuple(row[0]) if row else None
+
+    def mark_private(self, chat_id: int, source: str, fp: str, chunks: int) -> None:
+        self._query("INSERT OR REPLACE INTO private_docs (chat_id, source, fp, chunks, indexed_at)"
+                    " VALUES (?, ?, ?, ?, ?)", chat_id, source, fp, chunks, time.time())
+
+    # ── references ───────────────────────────────────────────────────────────
+    def ref(self, chat_id: int, source: str) -> Optional[str]:
+        row = self._query("SELECT fp FROM refs WHERE chat_id = ? AND source = ?", chat_id, source)
+        return row[0][0] if row else None
+
+    def add_ref(self, chat_id: int, source: str, fp: str) -> None:
+        self._query("INSERT OR REPLACE INTO refs (chat_id, source, fp, added_at) VALUES (?, ?, ?, ?)",
+                    chat_id, source, fp, time.time())
+        self._forget(chat_id)
+
+    def drop_refs(self, chat_id: int) -> List[str]:
+        """Remove every reference of a chat; returns the fingerprints it held."""
+        with self._lock:
+            fps = [r[0] for r in self._query("SELECT DISTINCT fp FROM refs WHERE chat_id = ?", chat_id)]
+            self._query("DELETE FROM refs WHERE chat_id = ?", chat_id)
+            self._query("DELETE FROM private_docs WHERE chat_id = ?", chat_id)
+            self._forget(chat_id)
+        return fps
+
+    def docs_for(self, chat_id: int) -> Tuple[str, ...]:
+        """Fingerprints a chat may search (cached; every turn asks)."""
+        with self._lock:
+            docs = self._docs_for.get(chat_id)
+            if docs is None:
+                docs = tuple(r[0] for r in self._query(
+                    "SELECT DISTINCT fp FROM refs WHERE chat_id = ?", chat_id))
+                self._docs_for[chat_id] = docs
+                while len(self._docs_for) > self.cache_chats:
+                    self._docs_for.popitem(last=False)
+            self._docs_for.move_to_end(chat_id)
+            return docs
+
+    def _forget(self, chat_id: int) -> None:
+        with self._lock:
+            self._docs_for.pop(chat_id, None)
+
+    def stats(self) -> dict:
+        (docs, chunks), = self._query("SELECT COUNT(*), COALESCE(SUM(chunks), 0) FROM docs")
+        (refs,), = self._query("SELECT COUNT(*) FROM refs")
+        return {"docs": docs, "chunks": chunks, "refs": refs}
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+@lru_cache(maxsize=1)
+def get_corpus() -> CorpusRegistry:
+    return CorpusRegistry(settings.shared_corpus_path)
+
+
+def doc_filter(docs: Iterable[str]):
+    return {"doc_fp": {"$in": list(docs)}}
+
+def shared_ids(fp: str) -> List[str]:
+    return get_shared_store().get(where={"doc_fp": fp}, include=[])["ids"]
+
+
+# ─── garbage collection ──────────────────────────────────────────────────────
+def collect(fps: Optional[Iterable[str]] = None) -> int:
+    """Delete the shared chunks of unreferenced documents (all orphans if `fps` is None)."""
+    corpus = get_corpus()
+    removed = 0
+    for fp in (corpus.orphans() if fps is None else fps):
+        with corpus.doc_lock(fp):
+            if not corpus.collect(fp):
+                continue
+            ids = shared_ids(fp)
+            if ids:
+                get_shared_store().delete(ids)
+            removed += len(ids)
+            log.info("[CORPUS] collected fp=%s chunks=%s", fp[:12], len(ids))
+    return removed
+
+def drop_tenant(chat_id: int) -> None:
+    """Delete everything of a chat: its vectors, BM25 index, references and cached answers."""
+    fps = get_corpus().drop_refs(chat_id)
+    drop_user_store(chat_id)
+    lexical.drop(chat_id)
+    answer_cache.invalidate(chat_id)
+    collect(fps)
+
+
+# ─── search: own collection + referenced shared documents ────────────────────
+def _merge(own: List[Hit], shared: List[Hit], n: int) -> List[Hit]:
+    if not shared:
+        return own
+    return heapq.nlargest(n, own + shared, key=lambda h: h.score)
+
+def search(chat_id: int, embedding, n: int) -> List[Hit]:
+    own = get_user_store(chat_id).query(embedding, n)
+    docs = get_corpus().docs_for(chat_id) if settings.shared_corpus else ()
+    shared = get_shared_store().query(embedding, n, where=doc_filter(docs)) if docs else []
+    return _merge(own, shared, n)
+
+async def asearch(chat_id: int, embedding, n: int) -> List[Hit]:
+    docs = get_corpus().docs_for(chat_id) if settings.shared_corpus else ()
+    if not docs:
+        return await get_user_store(chat_id).aquery(embedding, n)
+    own, shared = await asyncio.gather(
+        get_user_store(chat_id).aquery(embedding, n),
+        get_shared_store().aquery(embedding, n, where=doc_filter(docs)),
+    )
+    return _merge(own, shared, n)
+
+async def has_documents(chat_id: int) -> bool:
+    if settings.shared_corpus and get_corpus().docs_for(chat_id):
+        return True
+    return await get_user_store(chat_id).acount() > 0
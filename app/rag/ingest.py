@@ -1,52 +1,327 @@
 # app/rag/ingest.py
 from __future__ import annotations
-import os, asyncio, tempfile
+import hashlib, queue, threading, time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
-from telegram import File as TgFile
-from app.rag.pdf_loader import extract_chunks
-from app.vector_store.chroma_client import get_user_collection
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from app import metrics
+from app.agent.runtime import get_ingest_embeddings
+from app.config import settings
+from app.rag.answer_cache import answer_cache
+from app.rag.corpus import collect, get_corpus, shared_ids
+from app.rag.lexical import lexical
+from app.rag.pdf_loader import iter_chunks
+from app.vector_store.base import get_shared_store, get_user_store
 import logging
 log = logging.getLogger(__name__)
 
-def store_pdf_path(pdf_path: Path, chat_id: int, file_name: str) -> int:
-    """SYNC: chunk → embed → write. Returns the number of vectors ACTUALLY written."""
-    store  = get_user_collection(chat_id)
-    before = store._collection.count()
-    log.info("[INGEST] chat=%s before=%s path=%s", chat_id, before, pdf_path)
+Chunk = Tuple[str, str, Dict[str, Any]]     # (chunk_id, text, metadata)
+Batch = List[Chunk]
+Progress = Optional[Callable[[int], None]]   # called with the last page written
 
-    chunks = extract_chunks(pdf_path)
-    log.info("[INGEST] chat=%s chunks_split=%s", chat_id, len(chunks))
+@dataclass
+class IngestResult:
+    added: int   = 0        # chunks embedded + written this time
+    kept: int    = 0        # chunks already present (no embedding spent)
+    linked: int  = 0        # chunks of a shared document another chat uploaded
+    removed: int = 0        # stale chunks of an older version deleted
+    unchanged: bool = False # identical file was already indexed
+    error: Optional[str] = None  # pipeline failed (embedding API, vector store); worth a retry
 
-    if not any(ch.strip() for ch in chunks):
-        log.warning("[INGEST] chat=%s empty/extract_failed", chat_id)
-        return 0
+    @property
+    def chunks(self) -> int:
+        return self.added + self.kept + self.linked
+
+# ─── fingerprints ────────────────────────────────────────────────────────────
+def file_fingerprint(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def chunk_id(key: str, text: str, occurrence: int = 0) -> str:
+    """Stable ID: same key (file name, or fingerprint when shared) + same text (+ nth repeat) → same ID."""
+    raw = f"{key}\0{occurrence}\0{text}".encode()
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+# ─── pipeline plumbing ───────────────────────────────────────────────────────
+_DONE = object()
 
+class _Failed:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+def _put(q: queue.Queue, item: Any, stop: threading.Event) -> bool:
+    # bounded put → the producer blocks while the next stage is behind
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def _pump(items: Iterable, out: queue.Queue, stop: threading.Event) -> None:
+    """Run one pipeline stage on its own thread, feeding `out`."""
     try:
-        store.add_texts(chunks, metadatas=[{"source": file_name}] * len(chunks))
-    except Exception as e:
-        log.exception("[INGEST] chat=%s add_texts failed: %s", chat_id, e)
-        return 0
+        for item in items:
+            if not _put(out, item, stop):
+                return
+    except BaseException as e:
+        _put(out, _Failed(e), stop)
+        return
+    _put(out, _DONE, stop)
+
+def _timed(items: Iterable, stage: str) -> Iterator[Any]:
+    """Record how long producing each item took (queue waits excluded)."""
+    it = iter(items)
+    while True:
+        t0 = time.perf_counter()
+        try:
+            item = next(it)
+        except StopIteration:
+            return
+        metrics.ingest_seconds.observe(time.perf_counter() - t0, stage)
+        yield item
+
+def _drain(q: queue.Queue, stop: threading.Event) -> Iterator[Any]:
+    while not stop.is_set():
+        try:
+            item = q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        if item is _DONE:
+            return
+        if isinstance(item, _Failed):
+            raise item.error
+        yield item
+
+def _batched(
+    chunks: Iterable[Tuple[str, Dict[str, Any]]], key: str, meta: Dict[str, Any], size: int,
+) -> Iterator[Batch]:
+    seen: Counter = Counter()
+    batch: Batch = []
+    for text, page_meta in chunks:
+        if not text.strip():
+            continue
+        n = seen[text]
+        seen[text] += 1
+        batch.append((chunk_id(key, text, n), text, {**meta, **page_meta}))
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _embed_new(batch: Batch, existing: Set[str]) -> List[List[float]]:
+    texts = [text for cid, text, _ in batch if cid not in existing]
+    if not texts:
+        return []
+    with metrics.span(metrics.ingest_seconds, "embed"):
+        return get_ingest_embeddings().embed_documents(texts)
+
+def _embedded(
+    batches: Iterable[Batch], existing: Set[str], workers: int,
+) -> Iterator[Tuple[Batch, List[List[float]]]]:
+    """Embed only unseen chunks, up to `workers` requests in flight; keeps order."""
+    with ThreadPoolExecutor(workers, thread_name_prefix="ingest-embed") as pool:
+        pending: deque = deque()
+        for batch in batches:
+            pending.append((batch, pool.submit(_embed_new, batch, existing)))
+            if len(pending) >= workers:
+                done, fut = pending.popleft()
+                yield done, fut.result()
+        while pending:
+            done, fut = pending.popleft()
+            yield done, fut.result()
+
+def _backfill_lexical(store, index, ids: List[str]) -> None:
+    """Chunks indexed before the lexical index existed get added on re-upload."""
+    missing = index.missing(ids)
+    if not missing:
+        return
+    got = store.get(ids=missing, include=["documents", "metadatas"])
+    index.add(got["ids"], got["documents"], [m or {} for m in got["metadatas"]])
+    index.save()
+    log.info("[INGEST] lexical backfill=%s", len(missing))
 
-    after  = store._collection.count()
-    wrote  = max(0, after - before)
-    log.info("[INGEST] chat=%s after=%s wrote=%s", chat_id, after, wrote)
-    return wrote
+# ─── ingest ──────────────────────────────────────────────────────────────────
+def store_pdf_path(pdf_path: Path, chat_id: int, file_name: str, progress: Progress = None) -> IngestResult:
+    """
+    SYNC: extract → embed → write as overlapping stages.
 
-async def store_pdf_async(tg_file: TgFile, chat_id: int, file_name: str) -> int:
-    """ASYNC: download (await) → offload heavy work to a thread."""
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-        temp_path = Path(tmp.name)
+    Idempotent per (chat, file name): an identical re-upload is a no-op, and an
+    edited version only embeds/upserts chunks whose stable ID is new and
+    deletes the ones that disappeared. Pages are read lazily and only
+    `ingest_queue_depth` batches may wait between stages, so memory stays flat
+    regardless of PDF size. With `shared_corpus` a document already uploaded
+    by any chat is only referenced, not embedded again. `progress` gets the
+    last page written after every batch.
+    """
+    with metrics.span(metrics.ingest_seconds, "total"):
+        if settings.shared_corpus:
+            return _store_shared(pdf_path, chat_id, file_name, progress)
+        return _store_private(pdf_path, chat_id, file_name, progress)
 
+def _run_pipeline(
+    pdf_path: Path, store, index, key: str, doc_meta: Dict[str, Any], existing: Set[str], chat_id: int,
+    progress: Progress = None,
+) -> IngestResult:
+    """Chunk `pdf_path` into `store` (IDs namespaced by `key`); stale `existing` IDs are deleted."""
+    depth = settings.ingest_queue_depth
+    stop  = threading.Event()
+    extracted: queue.Queue = queue.Queue(maxsize=depth)
+    embedded:  queue.Queue = queue.Queue(maxsize=depth)
+
+    stages = [
+        threading.Thread(
+            target=_pump,
+            args=(_timed(_batched(iter_chunks(pdf_path), key, doc_meta, settings.ingest_batch_size),
+                         "extract"),
+                  extracted, stop),
+            name="ingest-extract", daemon=True,
+        ),
+        threading.Thread(
+            target=_pump,
+            args=(_embedded(_drain(extracted, stop), existing, settings.ingest_embed_workers),
+                  embedded, stop),
+            name="ingest-embed", daemon=True,
+        ),
+    ]
+    for t in stages:
+        t.start()
+
+    result = IngestResult()
+    seen: Set[str] = set()
+    pages = 0
     try:
-        # PTB v22: async — must await
-        await tg_file.download_to_drive(custom_path=str(temp_path))
-        size = os.path.getsize(temp_path)
-        log.info("[INGEST] chat=%s downloaded=%s bytes", chat_id, size)
+        for batch, vectors in _drain(embedded, stop):
+            t0 = time.perf_counter()
+            fresh = [c for c in batch if c[0] not in existing]
+            known = [c for c in batch if c[0] in existing]
+            if fresh:
+                store.upsert(
+                    ids=[cid for cid, _, _ in fresh],
+                    embeddings=vectors,
+                    documents=[text for _, text, _ in fresh],
+                    metadatas=[meta for _, _, meta in fresh],
+                )
+            if known:
+                # text unchanged → keep the vector, refresh page/fingerprint only
+                store.update(
+                    ids=[cid for cid, _, _ in known],
+                    metadatas=[meta for _, _, meta in known],
+                )
+            index.add(*zip(*batch))
+            seen.update(cid for cid, _, _ in batch)
+            result.added += len(fresh)
+            result.kept  += len(known)
+            pages = max(pages, *(meta.get("page_end", 0) for _, _, meta in batch))
+            metrics.ingest_seconds.observe(time.perf_counter() - t0, "write")
+            if progress is not None:
+                progress(pages)
+            log.debug("[INGEST] chat=%s added=%s kept=%s", chat_id, result.added, result.kept)
 
-        wrote = await asyncio.to_thread(store_pdf_path, temp_path, chat_id, file_name)
-        return wrote
+        stale = list(existing - seen)
+        if stale and seen:
+            store.delete(ids=stale)
+            index.remove(stale)
+            result.removed = len(stale)
+        index.save()
+    except Exception as e:
+        log.exception("[INGEST] chat=%s pipeline failed: %s", chat_id, e)
+        return IngestResult(error=f"{type(e).__name__}: {e}")
     finally:
-        try:
-            os.unlink(temp_path)
-        except FileNotFoundError:
-            pass
+        stop.set()
+        for t in stages:
+            t.join(timeout=5)
+
+    metrics.ingest_pages.inc(pages)
+    for kind in ("added", "kept", "removed"):
+        metrics.ingest_chunks.inc(getattr(result, kind), kind)
+    return result
+
+def _done(chat_id: int, result: IngestResult) -> IngestResult:
+    if not result.chunks:
+        log.warning("[INGEST] chat=%s empty/extract_failed", chat_id)
+    if result.added or result.linked or result.removed or result.error:
+        # cached answers predate this material (a failed run may have written some)
+        answer_cache.invalidate(chat_id)
+    log.info(
+        "[INGEST] chat=%s added=%s linked=%s kept=%s removed=%s",
+        chat_id, result.added, result.linked, result.kept, result.removed,
+    )
+    return result
+
+def _store_private(pdf_path: Path, chat_id: int, file_name: str, progress: Progress = None) -> IngestResult:
+    store = get_user_store(chat_id)
+    fp    = file_fingerprint(pdf_path)
+
+    prior = store.get(where={"source": file_name}, include=["metadatas"])
+    existing: Set[str] = set(prior["ids"])
+    prior_fps = {(m or {}).get("doc_fp") for m in prior["metadatas"] or []}
+    log.info("[INGEST] chat=%s fp=%s existing=%s path=%s", chat_id, fp[:12], len(existing), pdf_path)
+
+    index = lexical.get(chat_id)
+    # chunks carrying this fp are not enough: a failed run leaves some behind
+    corpus = get_corpus()
+    if existing and prior_fps == {fp} and corpus.private_doc(chat_id, file_name) == (fp, len(existing)):
+        log.info("[INGEST] chat=%s unchanged file=%s", chat_id, file_name)
+        _backfill_lexical(store, index, list(existing))
+        return IngestResult(kept=len(existing), unchanged=True)
+
+    doc_meta = {"source": file_name, "doc_fp": fp}
+    result = _run_pipeline(pdf_path, store, index, file_name, doc_meta, existing, chat_id, progress)
+    if result.chunks and not result.error:
+        corpus.mark_private(chat_id, file_name, fp, result.chunks)
+    return _done(chat_id, result)
+
+def _store_shared(pdf_path: Path, chat_id: int, file_name: str, progress: Progress = None) -> IngestResult:
+    corpus = get_corpus()
+    shared = get_shared_store()
+    index  = lexical.get(chat_id)
+    fp     = file_fingerprint(pdf_path)
+    previous = corpus.ref(chat_id, file_name)
+
+    with corpus.doc_lock(fp):
+        chunks = corpus.chunks(fp)
+        log.info("[INGEST] chat=%s fp=%s shared_chunks=%s path=%s", chat_id, fp[:12], chunks, pdf_path)
+        if chunks is not None and previous == fp:
+            log.info("[INGEST] chat=%s unchanged file=%s", chat_id, file_name)
+            metrics.corpus_uploads.inc(1, "unchanged")
+            _backfill_lexical(shared, index, shared_ids(fp))
+            return IngestResult(kept=chunks, unchanged=True)
+
+        if chunks is None:
+            # first upload anywhere; chunks left by an interrupted run are reused
+            existing = set(shared_ids(fp))
+            result = _run_pipeline(pdf_path, shared, index, fp, {"doc_fp": fp}, existing, chat_id, progress)
+            if not result.chunks:
+                return _done(chat_id, result)
+            corpus.mark_indexed(fp, result.chunks)
+            metrics.corpus_uploads.inc(1, "embedded")
+        else:
+            # someone else's upload: copy its texts into this chat's BM25 index only
+            got = shared.get(where={"doc_fp": fp}, include=["documents", "metadatas"])
+            index.add(got["ids"], got["documents"], [m or {} for m in got["metadatas"]])
+            result = IngestResult(linked=len(got["ids"]))
+            metrics.corpus_uploads.inc(1, "linked")
+        corpus.add_ref(chat_id, file_name, fp)
+
+    # the file's previous version and any private copy from before the shared corpus
+    if previous and previous != fp:
+        old = shared_ids(previous)
+        index.remove(old)
+        result.removed += len(old)
+        collect([previous])
+    own = get_user_store(chat_id)
+    private = own.get(where={"source": file_name}, include=[])["ids"]
+    if private:
+        own.delete(private)
+        index.remove(private)
+        result.removed += len(private)
+    index.save()
+    return _done(chat_id, result)
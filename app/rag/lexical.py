@@ -0,0 +1,258 @@
+# app/rag/lexical.py
+from __future__ import annotations
+import gzip
+import json
+import math
+import os
+import re
+import threading
+import weakref
+from collections import Counter, OrderedDict, defaultdict
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from app.config import settings
+import logging
+log = logging.getLogger(__name__)
+
+# keep "2.3", "cs-101", "x_1" as single tokens: exact-term lookups are the point
+_TOKEN = re.compile(r"[a-z0-9]+(?:[._\-][a-z0-9]+)*")
+_STOP  = frozenset(
+    "a an and are as at be by for from how i in is it me my of on or that the this "
+    "to was what when where which who why with you your do does can please explain".split()
+)
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN.findall(text.lower()) if t not in _STOP]
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60) -> List[str]:
+    """Merge ranked ID lists: score(id) = Σ 1 / (k + rank)."""
+    scores: Dict[str, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] += 1.0 / (k + rank)
+    return sorted(scores, key=scores.__getitem__, reverse=True)
+
+
+class LexicalIndex:
+    """
+    BM25 over one tenant's chunks. Postings are rebuilt from the stored docs on load.
+
+    On disk it is a log: `save` appends what changed since the last save (a
+    removal is a `[id]` tombstone) and rewrites the file only once superseded
+    records outnumber the live ones.
+    """
+
+    K1 = 1.2
+    B  = 0.75
+    MIN_REWRITE = 256     # records; below this a log is never worth compacting
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.docs: Dict[str, Tuple[str, Dict[str, Any]]] = {}   # id → (text, meta)
+        self._lens: Dict[str, int] = {}
+        self._postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self._total = 0
+        self._journal: List[list] = []     # records not on disk yet
+        self._records = 0                  # records in the file, superseded ones included
+        self._lock  = threading.RLock()
+
+    # ── mutation ─────────────────────────────────────────────────────────────
+    def add(self, ids: Iterable[str], texts: Iterable[str], metas: Iterable[Dict[str, Any]]) -> None:
+        with self._lock:
+            for doc_id, text, meta in zip(ids, texts, metas):
+                self._drop(doc_id)
+                tf = Counter(tokenize(text))
+                for term, n in tf.items():
+                    self._postings[term][doc_id] = n
+                self.docs[doc_id]  = (text, dict(meta))
+                self._lens[doc_id] = sum(tf.values())
+                self._total += self._lens[doc_id]
+                self._journal.append([doc_id, text, self.docs[doc_id][1]])
+
+    def remove(self, ids: Iterable[str]) -> None:
+        with self._lock:
+            for doc_id in ids:
+                if doc_id in self.docs:
+                    self._drop(doc_id)
+                    self._journal.append([doc_id])
+
+    def _drop(self, doc_id: str) -> None:
+        if doc_id not in self.docs:
+            return
+        for term in set(tokenize(self.docs[doc_id][0])):
+            posting = self._postings.get(term)
+            if posting is not None:
+                posting.pop(doc_id, None)
+                if not posting:
+                    del self._postings[term]
+        self._total -= self._lens.pop(doc_id, 0)
+        del self.docs[doc_id]
+
+    # ── query ────────────────────────────────────────────────────────────────
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def missing(self, ids: Iterable[str]) -> List[str]:
+        with self._lock:
+            return [i for i in ids if i not in self.docs]
+
+    @staticmethod
+    def _idf(df: int, n: int) -> float:
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def best_match(self, query: str) -> float:
+        """
+        Top chunk's BM25 score relative to a chunk holding every query term once (0..1).
+
+        A relevance signal for routing: the query's terms have to occur together
+        in one chunk, weighted by rarity, not merely somewhere in the tenant.
+        """
+        terms = set(tokenize(query))
+        with self._lock:
+            n = len(self.docs)
+            if not terms or not n:
+                return 0.0
+            ceiling = sum(self._idf(len(self._postings.get(t, ())), n) for t in terms)
+        hits = self.search(query, 1)
+        return min(1.0, hits[0][1] / ceiling) if hits and ceiling > 0 else 0.0
+
+    def search(self, query: str, k: int = 4) -> List[Tuple[str, float]]:
+        with self._lock:
+            n = len(self.docs)
+            if not n:
+                return []
+            avg = self._total / n or 1.0
+            scores: Dict[str, float] = defaultdict(float)
+            for term in set(tokenize(query)):
+                posting = self._postings.get(term)
+                if not posting:
+                    continue
+                idf = self._idf(len(posting), n)
+                for doc_id, tf in posting.items():
+                    norm = tf + self.K1 * (1 - self.B + self.B * self._lens[doc_id] / avg)
+                    scores[doc_id] += idf * tf * (self.K1 + 1) / norm
+        return sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:k]
+
+    def text(self, doc_id: str) -> Optional[str]:
+        doc = self.docs.get(doc_id)
+        return doc[0] if doc else None
+
+    # ── persistence (gzip'd JSON lines: [id, text, meta] or [id]) ────────────
+    @staticmethod
+    def _write(f, records: Iterable[list]) -> None:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")))
+            f.write("\n")
+
+    def save(self) -> None:
+        with self._lock:
+            if not self._journal:
+                return
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            records = self._records + len(self._journal)
+            if self.path.exists() and records <= max(2 * len(self.docs), self.MIN_REWRITE):
+                with gzip.open(self.path, "at", encoding="utf-8") as f:   # one more gzip member
+                    self._write(f, self._journal)
+                self._records = records
+            else:
+                self._rewrite()
+            self._journal = []
+
+    def _rewrite(self) -> None:
+        # caller holds self._lock
+        tmp = self.path.with_suffix(".tmp")
+        with gzip.open(tmp, "wt", encoding="utf-8") as f:
+            self._write(f, ([i, text, meta] for i, (text, meta) in self.docs.items()))
+        os.replace(tmp, self.path)
+        self._records = len(self.docs)
+
+    @classmethod
+    def load(cls, path: Path) -> "LexicalIndex":
+        index = cls(path)
+        if path.exists():
+            docs: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+            records = 0
+            try:
+                with gzip.open(path, "rt", encoding="utf-8") as f:
+                    for line in f:
+                        record = json.loads(line)
+                        records += 1
+                        if len(record) == 1:
+                            docs.pop(record[0], None)
+                        else:
+                            docs[record[0]] = (record[1], record[2])
+                truncated = False
+            except (EOFError, ValueError, gzip.BadGzipFile) as e:    # append cut short by a crash
+                log.warning("[LEXICAL] %s truncated after %s records: %r", path.name, records, e)
+                truncated = True
+            index.add(list(docs), [t for t, _ in docs.values()], [m for _, m in docs.values()])
+            index._journal = []
+            index._records = records
+            if truncated:
+                index._rewrite()                   # nothing can be appended after a torn member
+        return index
+
+
+class LexicalStore:
+    """
+    Lazily loaded per-tenant indexes, LRU-bounded in memory.
+
+    An index pushed out of the LRU while someone still holds it (an ingest
+    run keeps its index across batches) is handed back as is, never loaded
+    a second time: two copies would each append to the same file.
+    """
+
+    def __init__(self, root: Path, max_loaded: int):
+        self.root = root
+        self.max_loaded = max_loaded
+        self._loaded: "OrderedDict[int, LexicalIndex]" = OrderedDict()
+        self._alive: "weakref.WeakValueDictionary[int, LexicalIndex]" = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+
+    def _path(self, chat_id: int) -> Path:
+        return self.root / f"user_{chat_id}.jsonl.gz"
+
+    def is_loaded(self, chat_id: int) -> bool:
+        return chat_id in self._loaded or chat_id in self._alive
+
+    def _cached(self, chat_id: int) -> Optional[LexicalIndex]:
+        # caller holds self._lock
+        index = self._loaded.get(chat_id)
+        return index if index is not None else self._alive.get(chat_id)
+
+    def get(self, chat_id: int) -> LexicalIndex:
+        with self._lock:
+            index = self._loaded.get(chat_id)
+            if index is not None:
+                self._loaded.move_to_end(chat_id)
+                return index
+            index = self._alive.get(chat_id)
+        if index is None:
+            index = LexicalIndex.load(self._path(chat_id))
+        with self._lock:
+            cached = self._cached(chat_id)     # another caller loaded it meanwhile
+            if cached is None:
+                self._alive[chat_id] = index
+            else:
+                index = cached
+            self._loaded[chat_id] = index
+            self._loaded.move_to_end(chat_id)
+            evicted = []
+            while len(self._loaded) > self.max_loaded:
+                evicted.append(self._loaded.popitem(last=False)[1])
+        for old in evicted:                     # outside the store lock: other tenants keep going
+            old.save()
+        return index
+
+    def drop(self, chat_id: int) -> None:
+        with self._lock:
+            self._loaded.pop(chat_id, None)
+            self._alive.pop(chat_id, None)
+        try:
+            os.unlink(self._path(chat_id))
+        except FileNotFoundError:
+            pass
+
+
+lexical = LexicalStore(Path(settings.lexical_dir), settings.lexical_cache_size)
@@ -1,19 +1,81 @@
 from langchain_core.tools import tool
+from bisect import bisect_right
 from pathlib import Path
-from typing import List
+from typing import Dict, Iterator, List, Tuple
 from pypdf import PdfReader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 
 CHUNK = 800
 OVERLAP = 200
 
-def extract_chunks(pdf: Path) -> List[str]:
-    reader = PdfReader(str(pdf))
-    text = "\n".join(page.extract_text() or "" for page in reader.pages)
-
-    splitter = RecursiveCharacterTextSplitter(
+def _splitter() -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter(
         chunk_size=CHUNK,
         chunk_overlap=OVERLAP,
         separators=["\n\n", "\n", " ", ""],
     )
-    return splitter.split_text(text)
+
+def page_count(pdf: Path) -> int:
+    return len(PdfReader(str(pdf)).pages)
+
+def iter_pages(pdf: Path) -> Iterator[Tuple[int, str]]:
+    """Yield (page_no, text) one page at a time (1-based page numbers)."""
+    reader = PdfReader(str(pdf))
+    for page_no, page in enumerate(reader.pages, start=1):
+        yield page_no, page.extract_text() or ""
+
+def iter_chunks(pdf: Path) -> Iterator[Tuple[str, Dict[str, int]]]:
+    """
+    Stream (chunk, {"page", "page_end"}) pairs without holding the whole text.
+
+    Only the unfinished tail of the previous page is carried forward, so chunks
+    (and their overlap) may still span page boundaries. Boundaries can differ
+    slightly from splitting the whole text in one piece, because the splitter
+    only ever sees the carried tail plus the next page.
+    """
+    splitter = _splitter()
+    buf = ""
+    starts: List[int] = []    # offset in buf where each page begins
+    pages:  List[int] = []    # page number for each entry in `starts`
+
+    def meta(lo: int, hi: int) -> Dict[str, int]:
+        first = pages[max(0, bisect_right(starts, lo) - 1)]
+        last  = pages[max(0, bisect_right(starts, max(lo, hi - 1)) - 1)]
+        return {"page": first, "page_end": last}
+
+    for page_no, text in iter_pages(pdf):
+        if buf:
+            buf += "\n"
+        starts.append(len(buf))
+        pages.append(page_no)
+        buf += text
+
+        pieces = splitter.split_text(buf)
+        if len(pieces) < 2:
+            continue  # not enough text yet for a finished chunk
+
+        # Everything but the last piece is final; the last one may still
+        # grow with the next page, so it becomes the head of the new buffer.
+        pos = 0
+        for piece in pieces[:-1]:
+            at = buf.find(piece, pos)
+            at = pos if at < 0 else at
+            yield piece, meta(at, at + len(piece))
+            pos = at + 1
+        cut = buf.find(pieces[-1], pos)
+        cut = pos if cut < 0 else cut
+
+        buf = buf[cut:]
+        keep = max(0, bisect_right(starts, cut) - 1)
+        starts = [max(0, s - cut) for s in starts[keep:]]
+        pages  = pages[keep:]
+
+    pos = 0
+    for piece in splitter.split_text(buf):
+        at = buf.find(piece, pos)
+        at = pos if at < 0 else at
+        yield piece, meta(at, at + len(piece))
+        pos = at + 1
+
+def extract_chunks(pdf: Path) -> List[str]:
+    return [chunk for chunk, _ in iter_chunks(pdf)]
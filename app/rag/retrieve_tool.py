@@ -1,16 +1,85 @@
 # app/rag/retrieve_tool.py
 from __future__ import annotations
+import asyncio
 from typing import List, Tuple
-from langchain_core.tools import tool
-from app.vector_store.chroma_client import get_user_collection
-
-@tool
-def retrieve(question: str, chat_id: int, k: int = 4) -> Tuple[str, List[str]]:
-    """Retrieve up to k relevant chunks from the user's collection (requires chat_id)."""
-    store = get_user_collection(chat_id)
-    retriever = store.as_retriever(search_kwargs={"k": k})
-    docs = retriever.invoke(question)
-    chunks = [d.page_content for d in docs]
+from langchain_core.tools import StructuredTool
+from app.agent.runtime import get_embeddings
+from app.config import settings
+from app.rag.corpus import asearch, search
+from app.rag.lexical import lexical, reciprocal_rank_fusion
+from app.vector_store.base import Hit
+import logging
+log = logging.getLogger(__name__)
+
+Hits = List[Tuple[str, str]]   # [(chunk_id, text), ...] best first
+
+def _result(question: str, chunks: List[str]) -> Tuple[str, List[str]]:
     # short header + raw chunks; ReAct will see this text in its scratchpad
     header = f"Retrieved {len(chunks)} chunks for question: {question}"
     return header, chunks
+
+def _hits(hits: List[Hit]) -> Hits:
+    return [(h.id, h.text) for h in hits if h.text]
+
+def _lexical_hits(chat_id: int, question: str, k: int) -> Hits:
+    index = lexical.get(chat_id)
+    return [(i, index.text(i) or "") for i, _ in index.search(question, k)]
+
+def _fuse(question: str, dense: Hits, sparse: Hits, k: int) -> Tuple[str, List[str]]:
+    if not settings.hybrid_retrieval:
+        return _result(question, [t for _, t in dense[:k]])
+    texts = dict(sparse)
+    texts.update(dense)
+    order = reciprocal_rank_fusion([[i for i, _ in dense], [i for i, _ in sparse]], k=settings.rrf_k)
+    return _result(question, [texts[i] for i in order[:k]])
+
+def _retrieve(question: str, chat_id: int, k: int = 4) -> Tuple[str, List[str]]:
+    """Retrieve up to k relevant chunks from the user's documents (requires chat_id)."""
+    n = k * 2 if settings.hybrid_retrieval else k
+    sparse = _lexical_hits(chat_id, question, n) if settings.hybrid_retrieval else []
+    try:
+        dense = _hits(search(chat_id, get_embeddings().embed_query(question), n))
+    except Exception as e:
+        if not sparse:
+            raise
+        log.warning("[RETRIEVE] chat=%s vector search failed, lexical only: %s", chat_id, e)
+        dense = []
+    return _fuse(question, dense, sparse, k)
+
+async def _dense(question: str, chat_id: int, n: int) -> Hits:
+    vec = await get_embeddings().aembed_query(question)
+    return _hits(await asearch(chat_id, vec, n))
+
+async def _aretrieve(question: str, chat_id: int, k: int = 4) -> Tuple[str, List[str]]:
+    """Async twin of `_retrieve`: batched embedding + the backend's async query."""
+    if not settings.hybrid_retrieval:
+        return _fuse(question, await _dense(question, chat_id, k), [], k)
+
+    n = k * 2
+    dense_task = asyncio.ensure_future(_dense(question, chat_id, n))
+    try:
+        # BM25 is sub-millisecond once loaded; only the first load touches disk
+        if lexical.is_loaded(chat_id):
+            sparse = _lexical_hits(chat_id, question, n)
+        else:
+            sparse = await asyncio.to_thread(_lexical_hits, chat_id, question, n)
+
+        try:
+            # lexical results double as a fallback if embedding/Chroma is slow or down
+            timeout = settings.retrieve_vector_timeout if sparse else None
+            dense = await asyncio.wait_for(dense_task, timeout=timeout)
+        except Exception as e:
+            if not sparse:
+                raise
+            log.warning("[RETRIEVE] chat=%s vector search unavailable, lexical only: %r", chat_id, e)
+            dense = []
+    finally:
+        dense_task.cancel()         # no-op once done; stops it if lexical failed or we were cancelled
+    return _fuse(question, dense, sparse, k)
+
+# sync callers use retrieve.func, the graph awaits retrieve.coroutine
+retrieve = StructuredTool.from_function(
+    func=_retrieve,
+    coroutine=_aretrieve,
+    name="retrieve",
+)
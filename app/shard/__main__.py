@@ -0,0 +1,87 @@
+# app/shard/__main__.py
+# ─────────────────────────────────────────────────────────────────────────────
+# python -m app.shard [--workers N] [--port 8000]
+#
+# Starts N `app.main:app` workers on unix sockets plus the dispatcher on the
+# public port. A worker that exits is restarted with the same name, so its
+# chats come back to it.
+#
+# Every chat's tenant has exactly one writer, its worker. The shared corpus
+# tenant does not: with the Chroma server it is coordinated by per-document
+# file locks (app.rag.corpus), but the mmap backend keeps one private copy of
+# it per process, so workers get SHARED_CORPUS=False there.
+from __future__ import annotations
+import argparse
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+import uvicorn
+
+from app.config import settings
+from app.shard.dispatcher import create_app, socket_path, worker_names
+
+log = logging.getLogger("app.shard")
+
+
+def _worker_env(node: str) -> Dict[str, str]:
+    env = {**os.environ, "SHARD_NODE": node}    # a restarted worker resumes its own ingest jobs
+    if settings.shared_corpus and settings.vector_backend == "mmap":
+        env["SHARED_CORPUS"] = "False"
+    return env
+
+def _spawn(node: str, socket_dir: str) -> subprocess.Popen:
+    path = socket_path(socket_dir, node)
+    if os.path.exists(path):
+        os.unlink(path)
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--uds", path, "--log-level", "warning"],
+        env=_worker_env(node),
+    )
+
+
+def _supervise(procs: Dict[str, subprocess.Popen], socket_dir: str, stop: threading.Event) -> None:
+    while not stop.wait(1.0):
+        for node, proc in list(procs.items()):
+            if proc.poll() is not None:
+                log.warning("[SHARD] %s exited with %s, restarting", node, proc.returncode)
+                procs[node] = _spawn(node, socket_dir)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    ap = argparse.ArgumentParser(prog="python -m app.shard")
+    ap.add_argument("--workers", type=int, default=settings.shard_workers or os.cpu_count() or 1)
+    ap.add_argument("--host", default="0.0.0.0")
+    ap.add_argument("--port", type=int, default=8000)
+    ap.add_argument("--socket-dir", default=settings.shard_socket_dir)
+    args = ap.parse_args(argv)
+
+    logging.basicConfig(level=settings.log_level, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    os.makedirs(args.socket_dir, exist_ok=True)
+
+    if settings.shared_corpus and settings.vector_backend == "mmap":
+        log.warning("[SHARD] shared corpus disabled: the mmap backend cannot share a tenant across workers")
+    nodes = worker_names(args.workers)
+    procs = {node: _spawn(node, args.socket_dir) for node in nodes}
+    stop = threading.Event()
+    threading.Thread(target=_supervise, args=(procs, args.socket_dir, stop), daemon=True).start()
+    try:
+        uvicorn.run(create_app(nodes, args.socket_dir), host=args.host, port=args.port)
+    finally:
+        stop.set()
+        for proc in procs.values():
+            proc.terminate()
+        deadline = time.monotonic() + 10
+        for proc in procs.values():
+            try:
+                proc.wait(timeout=max(0.0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+# app/shard/dispatcher.py
+# ─────────────────────────────────────────────────────────────────────────────
+# Front process of the sharded mode: receives Telegram's webhook and forwards
+# each body unchanged to the worker that owns the chat (HTTP over a unix
+# socket). Workers are ordinary `app.main:app` processes, so every chat's
+# history, checkpoints and lexical index live in exactly one process.
+from __future__ import annotations
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import httpx
+from fastapi import FastAPI, Request, Response
+
+from app.bot.ingress import loads
+from app.config import settings
+from app.shard.ring import HashRing
+import logging
+log = logging.getLogger(__name__)
+
+
+def socket_path(socket_dir: str, node: str) -> str:
+    return str(Path(socket_dir) / f"{node}.sock")
+
+def worker_names(n: int) -> List[str]:
+    return [f"worker-{i}" for i in range(n)]
+
+
+def shard_key(update: Dict[str, Any]) -> Optional[int]:
+    """The chat an update belongs to (falls back to the sender for chat-less updates)."""
+    for key, value in update.items():
+        if key == "update_id" or not isinstance(value, dict):
+            continue
+        chat = value.get("chat") or (value.get("message") or {}).get("chat")
+        if isinstance(chat, dict) and "id" in chat:
+            return chat["id"]
+        sender = value.get("from")
+        if isinstance(sender, dict) and "id" in sender:
+            return sender["id"]
+    return None
+
+
+class Dispatcher:
+    def __init__(self, nodes: List[str], socket_dir: str, vnodes: int, timeout: float = 10.0):
+        self.ring = HashRing(nodes, vnodes=vnodes)
+        self.socket_dir = socket_dir
+        self.timeout = timeout
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+
+    def _client(self, node: str) -> httpx.AsyncClient:
+        client = self._clients.get(node)
+        if client is None:
+            client = self._clients[node] = httpx.AsyncClient(
+                transport=httpx.AsyncHTTPTransport(uds=socket_path(self.socket_dir, node)),
+                base_url="http://worker",
+                timeout=self.timeout,
+            )
+        return client
+
+    async def forward(self, body: bytes) -> Response:
+        try:
+            update = loads(body)
+        except ValueError:
+            return Response(status_code=400)
+        if not isinstance(update, dict) or "update_id" not in update:
+            return Response(status_code=400)   # same answer the worker's ingress gives
+        key = shard_key(update)
+        node = self.ring.node_for(key if key is not None else update.get("update_id"))
+        try:
+            r = await self._client(node).post(
+                "/webhook", content=body, headers={"content-type": "application/json"},
+            )
+        except httpx.HTTPError as e:
+            # worker restarting: have Telegram redeliver later
+            log.warning("[SHARD] forward to %s failed update_id=%s err=%r", node, update.get("update_id"), e)
+            return Response(status_code=503, headers={"Retry-After": "5"})
+        return Response(content=r.content, status_code=r.status_code,
+                        headers={k: v for k, v in r.headers.items() if k.lower() == "retry-after"},
+                        media_type=r.headers.get("content-type"))
+
+    async def aclose(self) -> None:
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients.clear()
+
+
+def create_app(nodes: List[str], socket_dir: str) -> FastAPI:
+    dispatcher = Dispatcher(nodes, socket_dir, settings.shard_vnodes)
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        log.info("[SHARD] dispatching to %s", ", ".join(dispatcher.ring.nodes))
+        try:
+            yield
+        finally:
+            await dispatcher.aclose()
+
+    app = FastAPI(lifespan=lifespan)
+    app.state.dispatcher = dispatcher
+
+    @app.get("/")
+    async def root():
+        return {"message": "Welcome to LearnBot", "shards": dispatcher.ring.nodes}
+
+    @app.post("/webhook")
+    async def telegram_webhook(req: Request):
+        return await dispatcher.forward(await req.body())
+
+    return app
@@ -0,0 +1,47 @@
+# app/shard/ring.py
+from __future__ import annotations
+import bisect
+import hashlib
+from typing import Dict, Iterable, List
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """
+    Consistent hashing with virtual nodes.
+
+    Adding or removing one of N nodes only remaps ~1/N of the keys, so a
+    reshard moves few chats away from the worker that holds their state.
+    """
+
+    def __init__(self, nodes: Iterable[str] = (), vnodes: int = 128):
+        self.vnodes = vnodes
+        self._points: List[int] = []
+        self._owner: Dict[int, str] = {}
+        for node in nodes:
+            self.add(node)
+
+    @property
+    def nodes(self) -> List[str]:
+        return sorted(set(self._owner.values()))
+
+    def add(self, node: str) -> None:
+        for i in range(self.vnodes):
+            point = _hash(f"{node}#{i}")
+            if point not in self._owner:
+                bisect.insort(self._points, point)
+                self._owner[point] = node
+
+    def remove(self, node: str) -> None:
+        for point in [p for p, n in self._owner.items() if n == node]:
+            del self._owner[point]
+            self._points.pop(bisect.bisect_left(self._points, point))
+
+    def node_for(self, key: object) -> str:
+        if not self._points:
+            raise LookupError("hash ring is empty")
+        i = bisect.bisect(self._points, _hash(str(key))) % len(self._points)
+        return self._owner[self._points[i]]
@@ -0,0 +1,81 @@
+# app/vector_store/base.py
+# ─────────────────────────────────────────────────────────────────────────────
+# One tenant's vector collection, independent of where it is stored.
+#
+# Backends: "chroma" (HTTP server, chroma_client.py) and "mmap" (in-process,
+# memory-mapped matrices, mmap_store.py), chosen by `settings.vector_backend`.
+from __future__ import annotations
+import asyncio
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence
+
+from app.config import settings
+
+Where = Optional[Dict[str, Any]]      # metadata equality filter: {"source": "a.pdf"}
+
+SHARED_TENANT = "shared"              # content-addressed corpus (app.rag.corpus): user_shared
+
+
+class Hit(NamedTuple):
+    id: str
+    text: str
+    score: float                      # cosine similarity, higher is closer
+
+
+class VectorStore(ABC):
+    """
+    Chroma-flavoured API over one chat's chunks.
+
+    `get` returns {"ids": [...], "documents": [...], "metadatas": [...]} like
+    Chroma's GetResult, so callers don't care which backend they talk to.
+    """
+
+    @abstractmethod
+    def count(self) -> int: ...
+
+    @abstractmethod
+    def get(self, ids: Optional[Sequence[str]] = None, where: Where = None,
+            include: Sequence[str] = ("documents", "metadatas")) -> Dict[str, List[Any]]: ...
+
+    @abstractmethod
+    def upsert(self, ids: Sequence[str], embeddings: Sequence[Sequence[float]],
+               documents: Sequence[str], metadatas: Sequence[Dict[str, Any]]) -> None: ...
+
+    @abstractmethod
+    def update(self, ids: Sequence[str], metadatas: Sequence[Dict[str, Any]]) -> None: ...
+
+    @abstractmethod
+    def delete(self, ids: Sequence[str]) -> None: ...
+
+    @abstractmethod
+    def query(self, embedding: Sequence[float], n: int, where: Where = None) -> List[Hit]: ...
+
+    # async twins: backends override these when they have a native async path
+    async def acount(self) -> int:
+        return await asyncio.to_thread(self.count)
+
+    async def aquery(self, embedding: Sequence[float], n: int, where: Where = None) -> List[Hit]:
+        return await asyncio.to_thread(self.query, embedding, n, where)
+
+
+def get_user_store(chat_id: int) -> VectorStore:
+    """The chat's collection on the configured backend (cheap; handles are cached)."""
+    if settings.vector_backend == "mmap":
+        from app.vector_store.mmap_store import mmap_stores
+        return mmap_stores.get(chat_id)
+    from app.vector_store.chroma_client import ChromaStore
+    return ChromaStore(chat_id)
+
+
+def get_shared_store() -> VectorStore:
+    """The collection holding chunks of documents shared between chats."""
+    return get_user_store(SHARED_TENANT)
+
+
+def drop_user_store(chat_id: int) -> None:
+    """Delete all of a chat's vectors on the configured backend."""
+    if settings.vector_backend == "mmap":
+        from app.vector_store.mmap_store import mmap_stores
+        return mmap_stores.drop(chat_id)
+    from app.vector_store.chroma_client import collections
+    collections.delete_user_data(chat_id)
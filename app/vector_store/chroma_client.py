@@ -1,48 +1,256 @@
 # app/vector_store/chroma_client.py
 from __future__ import annotations
 
+import asyncio
+import copy
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
 import chromadb
+from chromadb.api import AsyncClientAPI, ClientAPI
+from chromadb.api.models.AsyncCollection import AsyncCollection
 from langchain_community.vectorstores import Chroma
-from langchain_openai import OpenAIEmbeddings
+from app import metrics
+from app.agent.runtime import get_embeddings
 from app.config import settings
+from app.vector_store.base import Hit, VectorStore
+import logging
+log = logging.getLogger(__name__)
+
+DATABASE   = "learnbot"
+COLLECTION = "docs"
+
+def tenant_for(chat_id: int) -> str:
+    return f"user_{chat_id}"  # Unique tenant per user
+
+
+class CollectionManager:
+    """
+    Owns every connection to the Chroma server.
+
+    * one shared client → one pooled httpx session for all tenants
+    * tenants/databases are provisioned once and remembered
+    * per-chat `Chroma` handles live in an LRU with idle eviction + size cap
+    * `aget` is the asyncio twin: native async collections on one AsyncHttpClient
+
+    The warm path (`get`/`aget` on a cached chat) makes no HTTP calls at all.
+    """
+
+    def __init__(self, max_handles: int, idle_ttl: float):
+        self.max_handles = max_handles
+        self.idle_ttl    = idle_ttl
+        self._client: Optional[ClientAPI] = None
+        self._aclient: Optional[AsyncClientAPI] = None
+        self._provisioned: set[str] = set()
+        self._handles: "OrderedDict[str, Tuple[Chroma, float]]" = OrderedDict()
+        self._ahandles: "OrderedDict[str, Tuple[AsyncCollection, float]]" = OrderedDict()
+        self._lock = threading.Lock()            # guards _handles / _provisioned
+        self._provision_lock = threading.RLock() # serialises cold-path round trips
+
+    # ── connection ───────────────────────────────────────────────────────────
+    def client(self) -> ClientAPI:
+        """The single HttpClient (default tenant); created on first use."""
+        if self._client is None:
+            with self._provision_lock:
+                if self._client is None:
+                    self._client = chromadb.HttpClient(
+                        host=settings.chroma_host,
+                        port=settings.chroma_port,
+                    )
+        return self._client
+
+    async def aclient(self) -> AsyncClientAPI:
+        """The single AsyncHttpClient; only ever touched from the event loop."""
+        if self._aclient is None:
+            self._aclient = await chromadb.AsyncHttpClient(
+                host=settings.chroma_host,
+                port=settings.chroma_port,
+            )
+        return self._aclient
+
+    @staticmethod
+    def _scoped(client, tenant: str):
+        # A shallow copy shares the underlying system (and its httpx session);
+        # only the tenant/database the collection calls are scoped to changes.
+        # Setting them directly skips the validation round trips of set_tenant().
+        client = copy.copy(client)
+        client.tenant   = tenant
+        client.database = DATABASE
+        return client
+
+    def _tenant_client(self, tenant: str) -> ClientAPI:
+        return self._scoped(self.client(), tenant)
+
+    def _ensure_tenant(self, tenant: str) -> None:
+        if tenant in self._provisioned:
+            return
+        with self._provision_lock:
+            if tenant in self._provisioned:
+                return
+            admin_client = self.client()._admin_client   # low-level admin API
+            try:
+                admin_client.get_tenant(name=tenant)
+            except chromadb.errors.NotFoundError:
+                admin_client.create_tenant(name=tenant)
+
+            try:
+                admin_client.get_database(name=DATABASE, tenant=tenant)
+            except chromadb.errors.NotFoundError:
+                admin_client.create_database(name=DATABASE, tenant=tenant)
+
+            with self._lock:
+                self._provisioned.add(tenant)
+            log.info("[CHROMA] provisioned tenant=%s", tenant)
+
+    # ── handles ──────────────────────────────────────────────────────────────
+    def get(self, chat_id: int) -> Chroma:
+        tenant = tenant_for(chat_id)
+        now    = time.monotonic()
+
+        with self._lock:
+            hit = self._handles.get(tenant)
+            if hit is not None and now - hit[1] <= self.idle_ttl:
+                self._handles[tenant] = (hit[0], now)
+                self._handles.move_to_end(tenant)
+                return hit[0]
+
+        # cold path: provision (once) and bind the LangChain wrapper
+        self._ensure_tenant(tenant)
+        store = Chroma(
+            client=self._tenant_client(tenant),
+            collection_name=COLLECTION,
+            embedding_function=get_embeddings(),
+        )  # autocreates collection if missing
+
+        with self._lock:
+            self._handles[tenant] = (store, now)
+            self._handles.move_to_end(tenant)
+            self._evict(self._handles, now)
+        return store
+
+    async def aget(self, chat_id: int) -> AsyncCollection:
+        tenant = tenant_for(chat_id)
+        now    = time.monotonic()
+
+        hit = self._ahandles.get(tenant)
+        if hit is not None and now - hit[1] <= self.idle_ttl:
+            self._ahandles[tenant] = (hit[0], now)
+            self._ahandles.move_to_end(tenant)
+            return hit[0]
 
-embed_fn = OpenAIEmbeddings(
-    model=settings.embed_model,
-    openai_api_key=settings.openai_key,
+        if tenant not in self._provisioned:
+            await asyncio.to_thread(self._ensure_tenant, tenant)
+        client = self._scoped(await self.aclient(), tenant)
+        coll = await client.get_or_create_collection(COLLECTION, embedding_function=None)
+
+        with self._lock:
+            self._ahandles[tenant] = (coll, now)
+            self._ahandles.move_to_end(tenant)
+            self._evict(self._ahandles, now)
+        return coll
+
+    def _evict(self, handles: OrderedDict, now: float) -> None:
+        # caller holds self._lock; oldest entries sit at the front
+        while handles:
+            _, last_used = next(iter(handles.values()))
+            if len(handles) > self.max_handles or now - last_used > self.idle_ttl:
+                handles.popitem(last=False)
+            else:
+                break
+
+    def invalidate(self, chat_id: int) -> None:
+        """Forget everything cached for a chat (call after deleting its tenant/db)."""
+        tenant = tenant_for(chat_id)
+        with self._lock:
+            self._handles.pop(tenant, None)
+            self._ahandles.pop(tenant, None)
+            self._provisioned.discard(tenant)
+
+    def delete_user_data(self, chat_id: int) -> None:
+        """Drop the chat's database on the server and invalidate local state."""
+        tenant = tenant_for(chat_id)
+        try:
+            self.client()._admin_client.delete_database(name=DATABASE, tenant=tenant)
+        except chromadb.errors.NotFoundError:
+            pass
+        finally:
+            self.invalidate(chat_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._handles.clear()
+            self._ahandles.clear()
+            self._provisioned.clear()
+
+
+collections = CollectionManager(
+    max_handles=settings.chroma_cache_size,
+    idle_ttl=settings.chroma_idle_ttl,
 )
 
 def get_user_collection(chat_id: int) -> Chroma:
-    tenant   = f"user_{chat_id}" # Unique tenant per user
-    database = "learnbot"
-
-    # ── 1️⃣  CONNECT AS ADMIN (no tenant/database) ─────────────────────
-    admin_client = chromadb.HttpClient(
-        host=settings.chroma_host,
-        port=settings.chroma_port,
-    )._admin_client   # low-level admin API
-
-    # ── 2️⃣  ENSURE TENANT & DATABASE EXIST ───────────────────────────
-    try:
-        admin_client.get_tenant(name=tenant)
-    except chromadb.errors.NotFoundError:
-        admin_client.create_tenant(name=tenant)
-
-    try:
-        admin_client.get_database(name=database, tenant=tenant)
-    except chromadb.errors.NotFoundError:
-        admin_client.create_database(name=database, tenant=tenant)
-
-    # ── 3️⃣  NOW CONNECT AS THAT TENANT ───────────────────────────────
-    user_client = chromadb.HttpClient(
-        host=settings.chroma_host,
-        port=settings.chroma_port,
-        tenant=tenant,
-        database=database,
-    )
-
-    # LangChain wrapper (autocreates collection if missing)
-    return Chroma(
-        client=user_client,
-        collection_name="docs",
-        embedding_function=embed_fn,
-    )
+    return collections.get(chat_id)
+
+async def aget_user_collection(chat_id: int) -> AsyncCollection:
+    return await collections.aget(chat_id)
+
+
+class ChromaStore(VectorStore):
+    """`VectorStore` over the chat's Chroma collection (handles come from `collections`)."""
+
+    def __init__(self, chat_id: int):
+        self.chat_id = chat_id
+
+    def _coll(self):
+        return collections.get(self.chat_id)._collection
+
+    @staticmethod
+    def _hits(res: Dict[str, Any]) -> List[Hit]:
+        ids   = (res.get("ids") or [[]])[0]
+        docs  = (res.get("documents") or [[]])[0]
+        dists = (res.get("distances") or [[]])[0]
+        # default space is squared L2 on unit vectors: d = 2 - 2·cos
+        return [Hit(i, d, 1.0 - dist / 2.0) for i, d, dist in zip(ids, docs, dists) if d]
+
+    @metrics.timed(metrics.vector_seconds, "chroma", "count")
+    def count(self) -> int:
+        return self._coll().count()
+
+    @metrics.timed(metrics.vector_seconds, "chroma", "get")
+    def get(self, ids=None, where=None, include=("documents", "metadatas")):
+        res = self._coll().get(ids=list(ids) if ids is not None else None, where=where, include=list(include))
+        return {"ids": res["ids"], "documents": res.get("documents"), "metadatas": res.get("metadatas")}
+
+    @metrics.timed(metrics.vector_seconds, "chroma", "upsert")
+    def upsert(self, ids, embeddings, documents, metadatas) -> None:
+        self._coll().upsert(ids=list(ids), embeddings=list(embeddings),
+                            documents=list(documents), metadatas=list(metadatas))
+
+    @metrics.timed(metrics.vector_seconds, "chroma", "update")
+    def update(self, ids, metadatas) -> None:
+        self._coll().update(ids=list(ids), metadatas=list(metadatas))
+
+    @metrics.timed(metrics.vector_seconds, "chroma", "delete")
+    def delete(self, ids) -> None:
+        self._coll().delete(ids=list(ids))
+
+    @metrics.timed(metrics.vector_seconds, "chroma", "query")
+    def query(self, embedding, n, where=None) -> List[Hit]:
+        return self._hits(self._coll().query(
+            query_embeddings=[list(embedding)], n_results=n, where=where,
+            include=["documents", "distances"],
+        ))
+
+    @metrics.timed(metrics.vector_seconds, "chroma", "count")
+    async def acount(self) -> int:
+        return await (await collections.aget(self.chat_id)).count()
+
+    @metrics.timed(metrics.vector_seconds, "chroma", "query")
+    async def aquery(self, embedding, n, where=None) -> List[Hit]:
+        coll = await collections.aget(self.chat_id)
+        return self._hits(await coll.query(
+            query_embeddings=[list(embedding)], n_results=n, where=where,
+            include=["documents", "distances"],
+        ))
@@ -0,0 +1,168 @@
+# app/vector_store/embed_batcher.py
+from __future__ import annotations
+
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from app import metrics
+import logging
+log = logging.getLogger(__name__)
+
+
+def _approx_tokens(text: str) -> int:
+    # ~4 chars/token for English; only used to keep batches under the API cap
+    return len(text) // 4 + 1
+
+
+@dataclass
+class _Pending:
+    texts: List[str]
+    tokens: int
+    future: Future = field(default_factory=Future)
+
+
+class BatchingEmbeddings(Embeddings):
+    """
+    Coalesces concurrent embed calls into one upstream request.
+
+    Every `embed_query` / `embed_documents` call (from any thread or event loop)
+    is queued; a dispatcher thread waits `window_ms` after the first arrival,
+    packs as many pending requests as fit under `max_inputs` / `max_tokens`,
+    and sends them to the wrapped embedder in a single `embed_documents` call.
+    At most `max_in_flight` batches are outstanding at once; while all slots
+    are busy new requests keep accumulating, so batches grow under load.
+    Each caller gets back exactly the vectors for the texts it sent.
+    """
+
+    def __init__(
+        self,
+        inner: Embeddings,
+        *,
+        window_ms: float = 5.0,
+        max_inputs: int = 256,
+        max_tokens: int = 250_000,
+        max_in_flight: int = 4,
+    ):
+        self.inner         = inner
+        self.window        = window_ms / 1000.0
+        self.max_inputs    = max_inputs
+        self.max_tokens    = max_tokens
+        self.max_in_flight = max_in_flight
+
+        self._queue: "queue.Queue[_Pending]" = queue.Queue()
+        self._carry: Optional[_Pending] = None
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._pool  = ThreadPoolExecutor(max_in_flight, thread_name_prefix="embed-batch")
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    # ── public Embeddings API ────────────────────────────────────────────────
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._gather([p.future.result() for p in self._submit(texts)])
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        parts = await asyncio.gather(
+            *(asyncio.wrap_future(p.future) for p in self._submit(texts))
+        )
+        return self._gather(parts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+    @property
+    def pending(self) -> int:
+        """Requests waiting for a batch slot."""
+        return self._queue.qsize() + (self._carry is not None)
+
+    # ── submission ───────────────────────────────────────────────────────────
+    def _submit(self, texts: List[str]) -> List[_Pending]:
+        self._ensure_started()
+        pieces: List[_Pending] = []
+        # large ingest calls are split so no single request exceeds the caps
+        start = 0
+        while start < len(texts):
+            end, tokens = start, 0
+            while end < len(texts) and end - start < self.max_inputs:
+                t = _approx_tokens(texts[end])
+                if end > start and tokens + t > self.max_tokens:
+                    break
+                tokens += t
+                end += 1
+            piece = _Pending(texts=list(texts[start:end]), tokens=tokens)
+            self._queue.put(piece)
+            pieces.append(piece)
+            start = end
+        return pieces
+
+    @staticmethod
+    def _gather(parts: List[List[List[float]]]) -> List[List[float]]:
+        return [vec for part in parts for vec in part]
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="embed-batcher", daemon=True
+                )
+                self._thread.start()
+
+    # ── dispatcher ───────────────────────────────────────────────────────────
+    def _next_batch(self) -> List[_Pending]:
+        first = self._carry or self._queue.get()
+        self._carry = None
+        batch, n, tokens = [first], len(first.texts), first.tokens
+
+        deadline = time.monotonic() + self.window
+        while n < self.max_inputs:
+            remaining = deadline - time.monotonic()
+            try:
+                nxt = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if n + len(nxt.texts) > self.max_inputs or tokens + nxt.tokens > self.max_tokens:
+                self._carry = nxt   # first in line for the next batch
+                break
+            batch.append(nxt)
+            n      += len(nxt.texts)
+            tokens += nxt.tokens
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            self._slots.acquire()
+            self._pool.submit(self._send, self._next_batch())
+
+    def _send(self, batch: List[_Pending]) -> None:
+        texts = [t for p in batch for t in p.texts]
+        metrics.embed_inputs.inc(len(texts))
+        metrics.embed_batches.observe(len(texts))
+        try:
+            with metrics.span(metrics.embed_seconds):
+                vectors = self.inner.embed_documents(texts)
+        except Exception as e:
+            log.warning("[EMBED] batch of %s inputs failed: %s", len(texts), e)
+            for p in batch:
+                if not p.future.done():   # caller may have been cancelled
+                    p.future.set_exception(e)
+            return
+        finally:
+            self._slots.release()
+
+        log.debug("[EMBED] batch requests=%s inputs=%s", len(batch), len(texts))
+        offset = 0
+        for p in batch:
+            if not p.future.done():
+                p.future.set_result(vectors[offset: offset + len(p.texts)])
+            offset += len(p.texts)
@@ -0,0 +1,407 @@
+# app/vector_store/mmap_store.py
+# ─────────────────────────────────────────────────────────────────────────────
+# In-process vector backend: one directory per tenant holding
+#
+#   meta.json            {"dim", "dtype", "gen"}
+#   vectors.<gen>.bin    unit-normalised rows (float16, or int8 scaled by 127)
+#   rows.<gen>.jsonl     append-only log: ["add", id, text, meta] |
+#                        ["meta", id, meta] | ["del", id]
+#
+# Writes only ever append; an upsert of a known id appends a new row and
+# retires the old one. Once retired rows pass `compact_ratio` the live rows
+# are rewritten into generation gen+1 and meta.json is switched atomically.
+# Search is a brute-force float32 matrix-vector product. NumPy widens float16
+# slowly (~15 ms for 3k×1536), so a loaded tenant keeps a float32 working
+# copy built once from the mapping; the manager bounds those copies by bytes.
+# For per-chat collections of a few thousand chunks a query then takes ~1 ms,
+# far below an HTTP round trip.
+from __future__ import annotations
+import asyncio
+import json
+import os
+import shutil
+import threading
+import weakref
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from app import metrics
+from app.config import settings
+from app.vector_store.base import Hit, VectorStore, Where
+import logging
+log = logging.getLogger(__name__)
+
+_DTYPES = {"float16": np.float16, "int8": np.int8}
+_INT8_SCALE = 127.0
+_BLOCK = 4096          # rows widened to float32 at a time
+
+
+def _matches(meta: Dict[str, Any], where: Where) -> bool:
+    """Subset of Chroma's `where`: equality, $eq, $ne, $in, $nin, $and, $or."""
+    if not where:
+        return True
+    for key, cond in where.items():
+        if key == "$and":
+            if not all(_matches(meta, c) for c in cond):
+                return False
+        elif key == "$or":
+            if not any(_matches(meta, c) for c in cond):
+                return False
+        elif isinstance(cond, dict):
+            value = meta.get(key)
+            for op, arg in cond.items():
+                ok = {
+                    "$eq":  lambda: value == arg,
+                    "$ne":  lambda: value != arg,
+                    "$in":  lambda: value in arg,
+                    "$nin": lambda: value not in arg,
+                }.get(op)
+                if ok is None:
+                    raise ValueError(f"unsupported where operator {op!r}")
+                if not ok():
+                    return False
+        elif meta.get(key) != cond:
+            return False
+    return True
+
+
+class MmapCollection(VectorStore):
+    def __init__(self, root: Path, dtype: str, compact_ratio: float):
+        self.root = root
+        self.compact_ratio = compact_ratio
+        self._dtype_name = dtype
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._reset()
+
+    # ── load / files ─────────────────────────────────────────────────────────
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def _vec_path(self, gen: int) -> Path:
+        return self.root / f"vectors.{gen}.bin"
+
+    def _log_path(self, gen: int) -> Path:
+        return self.root / f"rows.{gen}.jsonl"
+
+    def _reset(self) -> None:
+        self.dim: Optional[int] = None
+        self.gen = 0
+        self._ids: List[Optional[str]] = []      # row → id (None once retired)
+        self._texts: List[str] = []
+        self._metas: List[Dict[str, Any]] = []
+        self._row: Dict[str, int] = {}           # id → live row
+        self._mat: Optional[np.ndarray] = None
+        self._hot: Optional[np.ndarray] = None   # float32 copy of _mat for search
+        self._alive: Optional[np.ndarray] = None
+
+    def _load(self) -> None:
+        if self._loaded:
+            return
+        self._reset()
+        meta_path = self.root / "meta.json"
+        if meta_path.exists():
+            meta = json.loads(meta_path.read_text())
+            self.dim, self._dtype_name, self.gen = meta["dim"], meta["dtype"], meta["gen"]
+            log_path = self._log_path(self.gen)
+            if log_path.exists():
+                with open(log_path, encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            self._apply(json.loads(line))
+                        except ValueError:      # torn last line after a crash
+                            break
+            self._truncate_to_log()
+        self._loaded = True
+
+    def _apply(self, op: List[Any]) -> None:
+        kind, doc_id = op[0], op[1]
+        if kind == "add":
+            self._retire(doc_id)
+            self._row[doc_id] = len(self._ids)
+            self._ids.append(doc_id)
+            self._texts.append(op[2])
+            self._metas.append(op[3])
+        elif kind == "meta" and doc_id in self._row:
+            self._metas[self._row[doc_id]] = op[2]
+        elif kind == "del":
+            self._retire(doc_id)
+
+    def _retire(self, doc_id: str) -> None:
+        row = self._row.pop(doc_id, None)
+        if row is not None:
+            self._ids[row] = None
+            self._texts[row] = ""
+            self._metas[row] = {}
+
+    def _truncate_to_log(self) -> None:
+        # vectors are written before their log lines: drop rows the log never saw
+        path = self._vec_path(self.gen)
+        if self.dim is None or not path.exists():
+            return
+        want = len(self._ids) * self.dim * np.dtype(self._dtype).itemsize
+        if path.stat().st_size > want:
+            os.truncate(path, want)
+        elif path.stat().st_size < want:       # log ahead of vectors: unusable tail
+            rows = path.stat().st_size // (self.dim * np.dtype(self._dtype).itemsize)
+            for doc_id in self._ids[rows:]:
+                if doc_id is not None:
+                    self._row.pop(doc_id, None)
+            del self._ids[rows:], self._texts[rows:], self._metas[rows:]
+
+    @property
+    def _dtype(self):
+        return _DTYPES[self._dtype_name]
+
+    def _write_meta(self) -> None:
+        tmp = self.root / "meta.json.tmp"
+        tmp.write_text(json.dumps({"dim": self.dim, "dtype": self._dtype_name, "gen": self.gen}))
+        os.replace(tmp, self.root / "meta.json")
+
+    def _log(self, ops: List[List[Any]]) -> None:
+        with open(self._log_path(self.gen), "a", encoding="utf-8") as f:
+            for op in ops:
+                f.write(json.dumps(op, ensure_ascii=False, separators=(",", ":")))
+                f.write("\n")
+
+    def _encode(self, vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1.0, norms)
+        if self._dtype_name == "int8":
+            return np.round(vectors * _INT8_SCALE).astype(np.int8)
+        return vectors.astype(np.float16)
+
+    def _matrix(self) -> Optional[np.ndarray]:
+        if self._mat is None and self._ids:
+            self._mat = np.memmap(self._vec_path(self.gen), dtype=self._dtype, mode="r",
+                                  shape=(len(self._ids), self.dim))
+        return self._mat
+
+    def _hot_matrix(self) -> Optional[np.ndarray]:
+        if self._hot is None:
+            mat = self._matrix()
+            if mat is None:
+                return None
+            hot = np.empty(mat.shape, dtype=np.float32)
+            for start in range(0, len(mat), _BLOCK):
+                hot[start:start + _BLOCK] = mat[start:start + _BLOCK]
+            if self._dtype_name == "int8":
+                hot /= _INT8_SCALE
+            self._hot = hot
+        return self._hot
+
+    @property
+    def hot_bytes(self) -> int:
+        hot = self._hot
+        return hot.nbytes if hot is not None else 0
+
+    def _alive_mask(self) -> np.ndarray:
+        if self._alive is None:
+            self._alive = np.fromiter((i is not None for i in self._ids), dtype=bool, count=len(self._ids))
+        return self._alive
+
+    def _dirty(self) -> None:
+        self._mat = None
+        self._hot = None      # rebuilt by the next query, not per ingest batch
+        self._alive = None
+
+    # ── VectorStore ──────────────────────────────────────────────────────────
+    @metrics.timed(metrics.vector_seconds, "mmap", "count")
+    def count(self) -> int:
+        with self._lock:
+            self._load()
+            return len(self._row)
+
+    @metrics.timed(metrics.vector_seconds, "mmap", "get")
+    def get(self, ids=None, where=None, include=("documents", "metadatas")):
+        with self._lock:
+            self._load()
+            rows = [self._row[i] for i in ids if i in self._row] if ids is not None else list(self._row.values())
+            rows = [r for r in rows if _matches(self._metas[r], where)]
+            return {
+                "ids":       [self._ids[r] for r in rows],
+                "documents": [self._texts[r] for r in rows] if "documents" in include else None,
+                "metadatas": [dict(self._metas[r]) for r in rows] if "metadatas" in include else None,
+            }
+
+    @metrics.timed(metrics.vector_seconds, "mmap", "upsert")
+    def upsert(self, ids, embeddings, documents, metadatas) -> None:
+        if not len(ids):
+            return
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        with self._lock:
+            self._load()
+            if self.dim is None:
+                self.root.mkdir(parents=True, exist_ok=True)
+                self.dim = int(vectors.shape[1])
+                self._write_meta()
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"embedding dim {vectors.shape[1]} != collection dim {self.dim}")
+            with open(self._vec_path(self.gen), "ab") as f:
+                f.write(self._encode(vectors).tobytes())
+            ops = [["add", i, t, dict(m or {})] for i, t, m in zip(ids, documents, metadatas)]
+            self._log(ops)
+            for op in ops:
+                self._apply(op)
+            self._dirty()
+            self._maybe_compact()
+
+    @metrics.timed(metrics.vector_seconds, "mmap", "update")
+    def update(self, ids, metadatas) -> None:
+        with self._lock:
+            self._load()
+            ops = [["meta", i, dict(m or {})] for i, m in zip(ids, metadatas) if i in self._row]
+            if ops:
+                self._log(ops)
+                for op in ops:
+                    self._apply(op)
+
+    @metrics.timed(metrics.vector_seconds, "mmap", "delete")
+    def delete(self, ids) -> None:
+        with self._lock:
+            self._load()
+            ops = [["del", i] for i in ids if i in self._row]
+            if ops:
+                self._log(ops)
+                for op in ops:
+                    self._apply(op)
+                self._dirty()
+                self._maybe_compact()
+
+    @metrics.timed(metrics.vector_seconds, "mmap", "query")
+    def query(self, embedding, n, where=None) -> List[Hit]:
+        q = np.asarray(embedding, dtype=np.float32)
+        q = q / (np.linalg.norm(q) or 1.0)
+        with self._lock:
+            self._load()
+            mat = self._hot_matrix()
+            if mat is None or not self._row:
+                return []
+            ids, texts = self._ids, self._texts
+            mask = self._alive_mask()
+            if where:
+                mask = mask & np.fromiter(
+                    (i is not None and _matches(m, where) for i, m in zip(ids, self._metas)),
+                    dtype=bool, count=len(ids),
+                )
+        scores = mat @ q
+        scores[~mask] = -np.inf
+
+        k = min(n, int(mask.sum()))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        # a concurrent delete may have retired a row after the mask was taken
+        return [Hit(ids[r], texts[r], float(scores[r])) for r in top if ids[r] is not None]
+
+    async def acount(self) -> int:
+        return self.count() if self._loaded else await asyncio.to_thread(self.count)
+
+    async def aquery(self, embedding, n, where=None) -> List[Hit]:
+        if self._loaded:
+            return self.query(embedding, n, where)
+        return await asyncio.to_thread(self.query, embedding, n, where)
+
+    # ── compaction ───────────────────────────────────────────────────────────
+    def _maybe_compact(self) -> None:
+        retired = len(self._ids) - len(self._row)
+        if retired and retired >= self.compact_ratio * len(self._ids):
+            self.compact()
+
+    @metrics.timed(metrics.vector_seconds, "mmap", "compact")
+    def compact(self) -> None:
+        """Rewrite live rows into the next generation; readers keep the old mapping."""
+        with self._lock:
+            self._load()
+            if self.dim is None or len(self._row) == len(self._ids):
+                return
+            rows = sorted(self._row.values())
+            old, new = self.gen, self.gen + 1
+            mat = self._matrix()
+            for path in (self._vec_path(new), self._log_path(new)):   # leftovers of a crash
+                if path.exists():
+                    path.unlink()
+            with open(self._vec_path(new), "wb") as f:
+                for start in range(0, len(rows), _BLOCK):
+                    f.write(np.ascontiguousarray(mat[rows[start:start + _BLOCK]]).tobytes())
+            ops = [["add", self._ids[r], self._texts[r], self._metas[r]] for r in rows]
+            self.gen = new
+            self._log(ops)
+            self._write_meta()                 # the switch-over point
+            before = len(self._ids)
+            self._reset_rows(ops)
+            for path in (self._vec_path(old), self._log_path(old)):
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+            log.info("[MMAP] compacted %s rows=%s→%s gen=%s", self.root.name, before, len(rows), new)
+
+    def _reset_rows(self, ops: List[List[Any]]) -> None:
+        self._ids, self._texts, self._metas, self._row = [], [], [], {}
+        for op in ops:
+            self._apply(op)
+        self._dirty()
+
+    def close(self) -> None:
+        with self._lock:
+            self._loaded = False
+            self._reset()
+
+
+class MmapStoreManager:
+    """Per-chat `MmapCollection`s, loaded on first use, LRU-evicted by count and hot bytes."""
+
+    def __init__(self, root: Path, dtype: str, max_loaded: int, compact_ratio: float, hot_bytes: int):
+        if dtype not in _DTYPES:
+            raise ValueError(f"vector_dtype must be one of {sorted(_DTYPES)}")
+        self.root = root
+        self.dtype = dtype
+        self.max_loaded = max_loaded
+        self.compact_ratio = compact_ratio
+        self.hot_bytes = hot_bytes
+        self._open: "OrderedDict[int, MmapCollection]" = OrderedDict()
+        # evicted collections still referenced elsewhere (e.g. a running
+        # ingest) are handed out again: two instances would both append
+        self._alive: "weakref.WeakValueDictionary[int, MmapCollection]" = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+
+    def _path(self, chat_id: int) -> Path:
+        return self.root / f"user_{chat_id}"
+
+    def get(self, chat_id: int) -> MmapCollection:
+        with self._lock:
+            coll = self._open.get(chat_id) or self._alive.get(chat_id)
+            if coll is None:
+                coll = MmapCollection(self._path(chat_id), self.dtype, self.compact_ratio)
+                self._alive[chat_id] = coll
+            self._open[chat_id] = coll
+            self._open.move_to_end(chat_id)
+            while len(self._open) > 1 and (
+                len(self._open) > self.max_loaded
+                or sum(c.hot_bytes for c in self._open.values()) > self.hot_bytes
+            ):
+                _, evicted = self._open.popitem(last=False)
+                evicted.close()
+            return coll
+
+    def drop(self, chat_id: int) -> None:
+        with self._lock:
+            coll = self._open.pop(chat_id, None) or self._alive.pop(chat_id, None)
+        if coll is not None:
+            coll.close()
+        shutil.rmtree(self._path(chat_id), ignore_errors=True)
+
+
+mmap_stores = MmapStoreManager(
+    Path(settings.vector_dir),
+    settings.vector_dtype,
+    max_loaded=settings.vector_cache_size,
+    compact_ratio=settings.vector_compact_ratio,
+    hot_bytes=settings.vector_hot_mb << 20,
+)
@@ -0,0 +1,136 @@
+# app/warmup.py
+# ─────────────────────────────────────────────────────────────────────────────
+# Startup warm-up, run in the background once the server is listening.
+#
+# `import app.main` only loads FastAPI, PTB and config; the graph, LLM and
+# embedding clients, vector backend and ingest pipeline sit behind lazy
+# accessors. This loads them (one thread: imports hold the GIL, so running
+# them side by side gains nothing) while PTB initializes and the network
+# connections are opened concurrently. PTB only starts processing updates
+# once the modules are loaded: handlers call `get_graph()`, and doing that
+# on the loop while this thread is still inside it could build it twice.
+# `/ready` turns 200 once every required step has succeeded; optional steps
+# only prime caches.
+from __future__ import annotations
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from app.config import settings
+import logging
+log = logging.getLogger(__name__)
+
+
+def _load_modules() -> None:
+    from app.agent.runtime import get_embeddings
+    from app.graph.graph_builder import get_graph, _llm_with_tools
+    import app.agent.history      # noqa: F401
+    import app.rag.answer_cache   # noqa: F401
+    import app.rag.ingest         # noqa: F401  (pypdf)
+    if settings.vector_backend == "mmap":
+        import app.vector_store.mmap_store     # noqa: F401
+    else:
+        import app.vector_store.chroma_client  # noqa: F401
+    get_graph()            # compiles the graph and opens the checkpointer
+    _llm_with_tools()
+    get_embeddings()
+
+def _prime_tokenizer() -> None:
+    from app.graph.graph_builder import MODEL
+    from app.rag.context_packer import count_tokens
+    count_tokens("warm-up", MODEL)      # loads (or downloads) the BPE table
+
+async def _open_openai() -> None:
+    from app.agent.runtime import open_connections
+    await open_connections()
+
+async def _open_chroma() -> None:
+    from app.vector_store.chroma_client import collections
+    await (await collections.aclient()).heartbeat()
+    await asyncio.to_thread(lambda: collections.client().heartbeat())
+
+
+class Warmup:
+    """One background warm-up per process; `ready` once every required step passed."""
+
+    def __init__(self):
+        self.ready = False
+        self.finished = False
+        self.steps: Dict[str, Dict[str, Any]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._done: Optional[asyncio.Event] = None
+
+    async def _step(self, name: str, fn: Callable[[], Awaitable[Any]], required: bool,
+                    timeout: Optional[float] = None) -> bool:
+        t0 = time.perf_counter()
+        try:
+            await asyncio.wait_for(fn(), timeout)
+        except Exception as e:
+            self.steps[name] = {"ok": False, "required": required, "error": repr(e)}
+            log.log(logging.ERROR if required else logging.WARNING, "[WARMUP] %s failed: %r", name, e)
+            return False
+        dt = time.perf_counter() - t0
+        self.steps[name] = {"ok": True, "required": required, "seconds": round(dt, 3)}
+        log.info("[WARMUP] %s %.2fs", name, dt)
+        return True
+
+    async def _run(self, init_telegram: Callable[[], Awaitable[Any]],
+                   start_telegram: Callable[[], Awaitable[Any]]) -> None:
+        t0 = time.perf_counter()
+        connect = settings.warmup_connect
+        timeout = settings.warmup_timeout
+        loaded: asyncio.Future = asyncio.get_running_loop().create_future()
+
+        async def load_then_prime() -> None:
+            ok = await self._step("modules", lambda: asyncio.to_thread(_load_modules), True)
+            loaded.set_result(ok)
+            if not ok:
+                return
+            await asyncio.gather(
+                self._step("tokenizer", lambda: asyncio.to_thread(_prime_tokenizer), False),
+                *([self._step("chroma", _open_chroma, False, timeout)]
+                  if connect and settings.vector_backend == "chroma" else []),
+            )
+
+        async def telegram() -> None:
+            await init_telegram()
+            if not await asyncio.shield(loaded):
+                raise RuntimeError("modules failed to load; not starting PTB")
+            await start_telegram()
+
+        try:
+            await asyncio.gather(
+                load_then_prime(),
+                self._step("telegram", telegram, True),
+                *([self._step("openai", _open_openai, False, timeout)] if connect else []),
+            )
+            self.ready = all(s["ok"] for s in self.steps.values() if s["required"])
+        finally:
+            self.finished = True
+            self._done.set()
+        log.info("[WARMUP] done ready=%s %.2fs", self.ready, time.perf_counter() - t0)
+
+    def start(self, init_telegram: Callable[[], Awaitable[Any]],
+              start_telegram: Callable[[], Awaitable[Any]]) -> None:
+        """`init_telegram` runs right away, `start_telegram` once the modules are loaded."""
+        self._done = asyncio.Event()
+        self._task = asyncio.ensure_future(self._run(init_telegram, start_telegram))
+
+    async def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until warm-up finished; returns `ready`."""
+        await asyncio.wait_for(self._done.wait(), timeout)
+        return self.ready
+
+    async def stop(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def status(self) -> Dict[str, Any]:
+        return {"ready": self.ready, "finished": self.finished, "steps": self.steps}
+
+
+warmup = Warmup()
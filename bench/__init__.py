@@ -0,0 +1 @@
+# ...existing code...
\ No newline at end of file
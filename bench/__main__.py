@@ -0,0 +1,297 @@
+# bench/__main__.py
+# ─────────────────────────────────────────────────────────────────────────────
+# Offline benchmark: python -m bench [--quick] [--baseline bench/baseline.json]
+#
+# Everything the bot talks to is faked (OpenAI chat + embeddings, Telegram)
+# or in-process (mmap vector backend, temp data dirs), so numbers only move
+# when our code does. Scenarios:
+#   ingest   store_pdf_path over synthetic PDFs of several sizes → pages/s
+#   turns    many concurrent chats through admission + _run_turn → latency
+#   memory   sequential turns under tracemalloc → peak/retained per turn
+#   webhook  same through /webhook, PTB's queue and the handlers → latency
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Dict, List
+
+from bench.pdfs import make_pdf, question
+
+
+def _configure(tmp: Path, args: argparse.Namespace) -> None:
+    """Settings are read at import time, so this runs before any `app` import."""
+    os.environ.update({
+        "OPENAI_API_KEY":       "sk-bench",
+        "TELEGRAM_BOT_TOKEN":   "123456:bench",
+        "ANONYMIZED_TELEMETRY": "False",
+        "VECTOR_BACKEND":       args.backend,
+        "VECTOR_DIR":           str(tmp / "vectors"),
+        "LEXICAL_DIR":          str(tmp / "lexical"),
+        "CHECKPOINT_PATH":      str(tmp / "checkpoints.sqlite"),
+        "HISTORY_SPILL_DIR":    str(tmp / "history"),
+        "SHARED_CORPUS_PATH":   str(tmp / "corpus.sqlite"),
+        "INGEST_JOBS_PATH":     str(tmp / "ingest_jobs.sqlite"),
+        "INGEST_SPOOL_DIR":     str(tmp / "uploads"),
+        "ANSWER_CACHE_ENABLED": str(args.cache),
+        "STREAM_REPLIES":       "False",
+        "LOG_LEVEL":            "WARNING",
+        "WARMUP_CONNECT":       "False",
+    })
+
+
+def _install_fakes(args: argparse.Namespace):
+    from bench.fakes import FakeChatModel, FakeEmbeddings, FakeTelegram
+    import app.agent.runtime as runtime
+    llm = FakeChatModel(latency=args.llm_latency)
+    runtime.get_llm = lambda model, temperature=0.2: llm     # before graph_builder binds it
+
+    embeddings = FakeEmbeddings(latency=args.embed_latency)
+    runtime.get_embeddings().inner = embeddings
+    runtime.get_ingest_embeddings().inner = embeddings
+
+    telegram = FakeTelegram()
+    telegram.install()
+    return embeddings, telegram
+
+
+def _pct(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {}
+    qs = statistics.quantiles(samples, n=100, method="inclusive") if len(samples) > 1 else samples * 99
+    return {
+        "p50_ms": round(qs[49] * 1000, 2),
+        "p95_ms": round(qs[94] * 1000, 2),
+        "p99_ms": round(qs[98] * 1000, 2),
+        "max_ms": round(max(samples) * 1000, 2),
+    }
+
+
+# ─── scenarios ───────────────────────────────────────────────────────────────
+def bench_ingest(tmp: Path, sizes: List[int]) -> Dict[str, Any]:
+    from app.rag.ingest import store_pdf_path
+    out: Dict[str, Any] = {}
+    total_pages = total_s = 0.0
+    for pages in sizes:
+        pdf = make_pdf(tmp / f"ingest_{pages}.pdf", pages, seed=pages)
+        t0 = time.perf_counter()
+        res = store_pdf_path(pdf, 10_000 + pages, pdf.name)
+        dt = time.perf_counter() - t0
+        out[f"pages_{pages}"] = {"chunks": res.chunks, "seconds": round(dt, 3),
+                                 "pages_per_s": round(pages / dt, 1)}
+        total_pages += pages
+        total_s += dt
+    out["pages_per_s"] = round(total_pages / total_s, 1)
+    return out
+
+
+def _seed_chats(tmp: Path, chats: List[int], embeddings) -> None:
+    from app.rag.ingest import store_pdf_path
+    pdf = make_pdf(tmp / "chat_notes.pdf", 5, seed=1)
+    latency, embeddings.latency = embeddings.latency, 0.0    # setup isn't measured
+    try:
+        for chat_id in chats:
+            store_pdf_path(pdf, chat_id, "notes.pdf")
+    finally:
+        embeddings.latency = latency
+
+
+async def bench_turns(chats: List[int], turns: int, doc_share: float) -> Dict[str, Any]:
+    from app.bot.admission import admission, Busy
+    from app.bot.handlers import _run_turn
+    latencies: List[float] = []
+    busy = 0
+
+    async def chat(chat_id: int) -> None:
+        nonlocal busy
+        for t in range(turns):
+            q = question(chat_id * 1000 + t, doc=(t % 10) < doc_share * 10)
+            t0 = time.perf_counter()
+            try:
+                async with admission.turn(chat_id):
+                    await _run_turn(chat_id, q)
+            except Busy:
+                busy += 1
+                continue
+            latencies.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(chat(c) for c in chats))
+    wall = time.perf_counter() - t0
+    return {**_pct(latencies), "turns": len(latencies), "busy": busy,
+            "turns_per_s": round(len(latencies) / wall, 1)}
+
+
+async def bench_webhook(chats: List[int], turns: int, doc_share: float, telegram) -> Dict[str, Any]:
+    import httpx
+    from bench.fakes import update_json
+    from app.main import app
+    acks: List[float] = []
+    replies: List[float] = []
+    update_id = 0
+
+    async with app.router.lifespan_context(app):
+        from app.warmup import warmup
+        assert await warmup.wait(timeout=60), warmup.status()
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            async def chat(chat_id: int) -> None:
+                nonlocal update_id
+                for t in range(turns):
+                    update_id += 1
+                    body = update_json(update_id, chat_id,
+                                       question(chat_id * 7919 + t, doc=(t % 10) < doc_share * 10))
+                    done = telegram.expect(chat_id)
+                    t0 = time.perf_counter()
+                    r = await client.post("/webhook", json=body)
+                    acks.append(time.perf_counter() - t0)
+                    if r.status_code != 200:
+                        continue
+                    replies.append(await asyncio.wait_for(done, timeout=60) - t0)
+
+            t0 = time.perf_counter()
+            await asyncio.gather(*(chat(c) for c in chats))
+            wall = time.perf_counter() - t0
+
+    return {"ack": _pct(acks), "reply": _pct(replies), "turns": len(replies),
+            "turns_per_s": round(len(replies) / wall, 1)}
+
+
+async def bench_memory(chat_id: int, turns: int) -> Dict[str, Any]:
+    from app.bot.handlers import _run_turn
+    await _run_turn(chat_id, question(1))                     # warm imports/caches
+    tracemalloc.start()
+    try:
+        base, _ = tracemalloc.get_traced_memory()
+        peak_turn = 0
+        for t in range(turns):
+            tracemalloc.reset_peak()
+            start, _ = tracemalloc.get_traced_memory()
+            await _run_turn(chat_id, question(chat_id * 31 + t))
+            _, peak = tracemalloc.get_traced_memory()
+            peak_turn = max(peak_turn, peak - start)
+        current, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"turn_peak_kib": round(peak_turn / 1024, 1),
+            "retained_kib_per_turn": round((current - base) / turns / 1024, 2)}
+
+
+# ─── baseline comparison ─────────────────────────────────────────────────────
+def _flatten(d: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    flat: Dict[str, float] = {}
+    for k, v in d.items():
+        key = f"{prefix}{k}"
+        if isinstance(v, dict):
+            flat.update(_flatten(v, key + "."))
+        elif isinstance(v, (int, float)) and not isinstance(v, bool):
+            flat[key] = float(v)
+    return flat
+
+
+def _higher_is_better(key: str) -> bool:
+    return key.endswith("_per_s")
+
+def _tracked(key: str) -> bool:
+    return key.endswith(("_per_s", "_ms", "_kib", "_kib_per_turn", "_mib"))
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Regressions worse than `tolerance` (relative) on tracked metrics."""
+    cur, base = _flatten(current), _flatten(baseline)
+    problems = []
+    for key, old in base.items():
+        if not _tracked(key) or key not in cur or old == 0:
+            continue
+        new = cur[key]
+        change = (new - old) / abs(old)
+        worse = -change if _higher_is_better(key) else change
+        if worse > tolerance:
+            problems.append(f"{key}: {old:g} → {new:g} ({change:+.0%})")
+    return problems
+
+
+# ─── main ────────────────────────────────────────────────────────────────────
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m bench")
+    ap.add_argument("--quick", action="store_true", help="small run for CI / smoke checks")
+    ap.add_argument("--chats", type=int, default=50)
+    ap.add_argument("--turns", type=int, default=5)
+    ap.add_argument("--pages", default="5,50,200", help="ingest PDF sizes")
+    ap.add_argument("--doc-share", type=float, default=0.7, help="share of document questions")
+    ap.add_argument("--llm-latency", type=float, default=0.25)
+    ap.add_argument("--embed-latency", type=float, default=0.05)
+    ap.add_argument("--backend", default="mmap", choices=["mmap", "chroma"],
+                    help="chroma needs a server at CHROMA_HOST:CHROMA_PORT")
+    ap.add_argument("--cache", action="store_true", help="leave the semantic answer cache on")
+    ap.add_argument("--skip", default="", help="comma list of scenarios to skip")
+    ap.add_argument("--out", type=Path, help="write results JSON here")
+    ap.add_argument("--baseline", type=Path, help="compare against this results JSON")
+    ap.add_argument("--save-baseline", type=Path, help="write results as the new baseline")
+    ap.add_argument("--tolerance", type=float, default=0.2)
+    args = ap.parse_args(argv)
+    if args.quick:
+        args.chats, args.turns, args.pages = 8, 3, "5,20"
+
+    skip = set(filter(None, args.skip.split(",")))
+    tmp = Path(tempfile.mkdtemp(prefix="learnbot-bench-"))
+    _configure(tmp, args)
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    embeddings, telegram = _install_fakes(args)
+
+    results: Dict[str, Any] = {"config": {
+        "chats": args.chats, "turns": args.turns, "llm_latency": args.llm_latency,
+        "embed_latency": args.embed_latency, "backend": args.backend,
+        "pages": args.pages, "doc_share": args.doc_share, "cache": args.cache,
+    }}
+    if "ingest" not in skip:
+        results["ingest"] = bench_ingest(tmp, [int(p) for p in args.pages.split(",")])
+        print("ingest ", json.dumps(results["ingest"]))
+
+    chats = list(range(1, args.chats + 1))
+    _seed_chats(tmp, chats, embeddings)
+
+    async def conversations() -> None:
+        # one loop for all of them: app singletons bind to the loop they first run on
+        if "turns" not in skip:
+            results["turns"] = await bench_turns(chats, args.turns, args.doc_share)
+            print("turns  ", json.dumps(results["turns"]))
+        if "memory" not in skip:
+            results["memory"] = await bench_memory(chats[0], max(10, args.turns))
+            print("memory ", json.dumps(results["memory"]))
+        # last: leaving the app's lifespan closes the checkpointer
+        if "webhook" not in skip:
+            results["webhook"] = await bench_webhook(chats, args.turns, args.doc_share, telegram)
+            print("webhook", json.dumps(results["webhook"]))
+
+    asyncio.run(conversations())
+    results["rss_peak_mib"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    print("rss_peak_mib", results["rss_peak_mib"])
+
+    if args.out:
+        args.out.write_text(json.dumps(results, indent=2))
+    if args.save_baseline:
+        args.save_baseline.write_text(json.dumps(results, indent=2))
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text())
+        if baseline.get("config") != results["config"]:
+            print(f"baseline {args.baseline} was recorded with {baseline.get('config')}; not comparable")
+            return 2
+        problems = compare(results, baseline, args.tolerance)
+        for p in problems:
+            print("REGRESSION", p)
+        if problems:
+            return 1
+        print(f"no regressions beyond {args.tolerance:.0%} vs {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,141 @@
+# bench/fakes.py
+# ─────────────────────────────────────────────────────────────────────────────
+# Deterministic offline stand-ins for the OpenAI chat model, the embedding
+# model and the Telegram Bot API, each with a configurable latency.
+from __future__ import annotations
+import asyncio
+import hashlib
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+_WORDS = "the answer follows from the definition and the worked example in your notes".split()
+
+
+def _seed(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "big")
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Stand-in for ChatOpenAI. With tools bound (the `decide` step) it calls
+    `retrieve` for questions ending in "?" and answers anything else; without
+    tools it returns `answer_tokens` words. Same prompt → same reply.
+    """
+
+    latency: float = 0.25          # seconds per call
+    answer_tokens: int = 60
+    tools_bound: bool = False
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> "FakeChatModel":
+        return self.model_copy(update={"tools_bound": True})
+
+    def _reply(self, messages: List[BaseMessage]) -> AIMessage:
+        question = next((str(m.content) for m in reversed(messages) if m.type == "human"), "")
+        prompt_tokens = sum(len(str(m.content)) for m in messages) // 4 + 1
+        usage = {"input_tokens": prompt_tokens, "output_tokens": 0, "total_tokens": prompt_tokens}
+        if self.tools_bound and question.rstrip().endswith("?"):
+            return AIMessage(content="", usage_metadata=usage, tool_calls=[{
+                "name": "retrieve", "args": {"question": question, "k": 4},
+                "id": f"call_{_seed(question) & 0xFFFFFF:06x}",
+            }])
+        rnd = np.random.default_rng(_seed(question))
+        words = [_WORDS[i] for i in rnd.integers(0, len(_WORDS), self.answer_tokens)]
+        usage = {**usage, "output_tokens": len(words), "total_tokens": prompt_tokens + len(words)}
+        return AIMessage(content=" ".join(words), usage_metadata=usage)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._reply(messages))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._reply(messages))])
+
+
+class FakeEmbeddings(Embeddings):
+    """Hash-seeded unit vectors; one `latency` per request, like one API round trip."""
+
+    def __init__(self, dim: int = 256, latency: float = 0.05):
+        self.dim = dim
+        self.latency = latency
+        self.requests = 0
+
+    def _vec(self, text: str) -> List[float]:
+        v = np.random.default_rng(_seed(text)).standard_normal(self.dim)
+        return (v / np.linalg.norm(v)).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.requests += 1
+        time.sleep(self.latency)
+        return [self._vec(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+class FakeTelegram:
+    """
+    Replaces `Bot._do_post`: answers Bot API calls locally and records when
+    each chat last got a message or an edit.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self._next_id = 1
+        self.waiters: Dict[int, asyncio.Future] = {}
+        self.calls: Dict[str, int] = {}
+
+    def expect(self, chat_id: int) -> asyncio.Future:
+        fut = asyncio.get_running_loop().create_future()
+        self.waiters[chat_id] = fut
+        return fut
+
+    def _message(self, chat_id: int, text: str) -> Dict[str, Any]:
+        self._next_id += 1
+        return {"message_id": self._next_id, "date": int(time.time()), "text": text,
+                "chat": {"id": chat_id, "type": "private"}}
+
+    async def do_post(self, bot, endpoint: str, data: Dict[str, Any], **kwargs) -> Any:
+        self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if endpoint == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+        if endpoint in ("sendMessage", "editMessageText"):
+            chat_id = int(data.get("chat_id", 0))
+            text = str(data.get("text", ""))
+            fut = self.waiters.get(chat_id)
+            if fut is not None and not fut.done() and text.strip("…▍ "):
+                fut.set_result(time.perf_counter())
+            return self._message(chat_id, text)
+        return True
+
+    def install(self) -> None:
+        from telegram import Bot
+        fake = self
+
+        async def _do_post(bot, endpoint, data, **kwargs):
+            return await fake.do_post(bot, endpoint, data, **kwargs)
+
+        Bot._do_post = _do_post
+
+
+def update_json(update_id: int, chat_id: int, text: Optional[str] = None) -> Dict[str, Any]:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": int(time.time()), "text": text,
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": f"user{chat_id}"},
+        },
+    }
@@ -0,0 +1,53 @@
+# bench/pdfs.py
+# Minimal text PDFs without a PDF library: one Helvetica text block per page.
+from __future__ import annotations
+import random
+from pathlib import Path
+from typing import List
+
+VOCAB = (
+    "theorem lemma proof matrix vector integral limit series entropy graph node "
+    "edge cell energy force mass derivative eigenvalue kernel gradient"
+).split()
+
+
+def _page_text(rnd: random.Random, words: int) -> List[str]:
+    return [" ".join(rnd.choice(VOCAB) for _ in range(10)) for _ in range(words // 10)]
+
+
+def make_pdf(path: Path, pages: int, words_per_page: int = 400, seed: int = 0) -> Path:
+    rnd = random.Random(seed)
+    contents = [
+        "BT /F1 10 Tf 40 800 Td 12 TL " + " ".join(f"({line}) '" for line in _page_text(rnd, words_per_page)) + " ET"
+        for _ in range(pages)
+    ]
+    out: List[str] = ["%PDF-1.4\n"]
+    offsets: List[int] = []
+
+    def obj(s: str) -> None:
+        offsets.append(sum(len(x) for x in out))
+        out.append(s)
+
+    page_ids = [4 + 2 * i for i in range(pages)]
+    obj("1 0 obj << /Type /Catalog /Pages 2 0 R >> endobj\n")
+    obj(f"2 0 obj << /Type /Pages /Kids [{' '.join(f'{i} 0 R' for i in page_ids)}] /Count {pages} >> endobj\n")
+    obj("3 0 obj << /Type /Font /Subtype /Type1 /BaseFont /Helvetica >> endobj\n")
+    for pid, content in zip(page_ids, contents):
+        obj(f"{pid} 0 obj << /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {pid + 1} 0 R >> endobj\n")
+        obj(f"{pid + 1} 0 obj << /Length {len(content)} >> stream\n{content}\nendstream endobj\n")
+    xref = sum(len(x) for x in out)
+    out.append(
+        f"xref\n0 {len(offsets) + 1}\n0000000000 65535 f \n"
+        + "".join(f"{o:010d} 00000 n \n" for o in offsets)
+        + f"trailer << /Size {len(offsets) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n"
+    )
+    path.write_text("".join(out))
+    return path
+
+
+def question(seed: int, doc: bool = True) -> str:
+    rnd = random.Random(seed)
+    if doc:
+        return f"explain the {rnd.choice(VOCAB)} {rnd.choice(VOCAB)} {rnd.choice(VOCAB)} part {seed}?"
+    return f"tell me something fun about the number {seed}"
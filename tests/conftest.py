@@ -0,0 +1,6 @@
+import os
+
+# app.config requires these at import time; tests never call the real APIs
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "1:test")
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+
+from app.bot.admission import AdmissionController, Busy
+
+
+async def _hold(admission, chat_id, release, log):
+    async with admission.turn(chat_id):
+        log.append(("start", chat_id))
+        await release.wait()
+        log.append(("end", chat_id))
+
+
+def test_global_limit_and_one_turn_per_chat():
+    async def run():
+        admission = AdmissionController(max_concurrent=2, max_queued=10, max_per_chat_queue=5)
+        release, log = asyncio.Event(), []
+        tasks = [asyncio.create_task(_hold(admission, c, release, log)) for c in (1, 1, 2, 3)]
+        await asyncio.sleep(0.01)
+        assert admission.running == 2 and admission.waiting == 2
+        assert [c for _, c in log] == [1, 2]         # chat 1's second turn waits for its first
+        release.set()
+        await asyncio.gather(*tasks)
+        return log
+
+    log = asyncio.run(run())
+    ones = [e for e, c in log if c == 1]
+    assert ones == ["start", "end", "start", "end"]  # never two turns of one chat at once
+
+
+def test_overflow_raises_busy():
+    async def run():
+        admission = AdmissionController(max_concurrent=1, max_queued=2, max_per_chat_queue=1)
+        release, log = asyncio.Event(), []
+        tasks = [asyncio.create_task(_hold(admission, c, release, log)) for c in (1, 1)]
+        await asyncio.sleep(0.01)
+        with pytest.raises(Busy):                     # chat 1: one running, one queued
+            async with admission.turn(1):
+                pass
+        tasks.append(asyncio.create_task(_hold(admission, 2, release, log)))
+        await asyncio.sleep(0.01)
+        with pytest.raises(Busy):                     # two waiting overall
+            async with admission.turn(3):
+                pass
+        release.set()
+        await asyncio.gather(*tasks)
+        assert admission.running == admission.waiting == 0
+
+    asyncio.run(run())
+
+
+def test_cancelling_a_queued_turn_frees_its_place():
+    async def run():
+        admission = AdmissionController(max_concurrent=1, max_queued=1, max_per_chat_queue=1)
+        release, log = asyncio.Event(), []
+        running = asyncio.create_task(_hold(admission, 1, release, log))
+        await asyncio.sleep(0.01)
+        queued = asyncio.create_task(_hold(admission, 2, release, log))
+        await asyncio.sleep(0.01)
+        queued.cancel()
+        await asyncio.gather(queued, return_exceptions=True)
+        assert admission.waiting == 0 and 2 not in admission._per_chat
+
+        late = asyncio.create_task(_hold(admission, 2, release, log))   # not Busy any more
+        release.set()
+        await asyncio.gather(running, late)
+        assert admission.running == 0 and not admission._chat_locks
+
+    asyncio.run(run())
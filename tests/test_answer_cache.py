@@ -0,0 +1,40 @@
+import asyncio
+
+from bench.fakes import FakeEmbeddings
+from app.rag import answer_cache as cache_module
+from app.rag.answer_cache import SemanticAnswerCache, standalone
+
+
+def test_follow_ups_bypass_the_cache(monkeypatch):
+    embeddings = FakeEmbeddings(latency=0)
+    monkeypatch.setattr(cache_module, "get_embeddings", lambda: embeddings)
+    cache = SemanticAnswerCache(threshold=0.92, ttl=60, max_per_chat=8, max_chats=8)
+
+    async def ask(question, answer):
+        hit, vec, gen = await cache.lookup(1, question)
+        if hit is None:
+            cache.store(1, question, vec, answer, gen)
+        return hit
+
+    assert standalone("What is the second law of thermodynamics?")
+    assert not standalone("why?") and not standalone("Can you explain that in more detail")
+    assert asyncio.run(ask("What is the second law of thermodynamics?", "Entropy...")) is None
+    assert asyncio.run(ask("What is the second law of thermodynamics", "")) == "Entropy..."
+    assert asyncio.run(ask("give an example", "A melting ice cube.")) is None
+    assert asyncio.run(ask("give an example", "A falling rock.")) is None   # never stored
+    assert embeddings.requests == 1                                         # follow-ups skip the embed
+
+
+def test_an_answer_computed_across_an_invalidation_is_not_stored(monkeypatch):
+    monkeypatch.setattr(cache_module, "get_embeddings", lambda: FakeEmbeddings(latency=0))
+    cache = SemanticAnswerCache(threshold=0.92, ttl=60, max_per_chat=8, max_chats=8)
+    question = "What is the second law of thermodynamics?"
+
+    hit, vec, gen = asyncio.run(cache.lookup(1, question))
+    cache.invalidate(1)                                  # an upload finished mid-turn
+    cache.store(1, question, vec, "I don't know.", gen)
+    assert asyncio.run(cache.lookup(1, question))[0] is None
+
+    hit, vec, gen = asyncio.run(cache.lookup(1, question))
+    cache.store(1, question, vec, "Entropy...", gen)
+    assert asyncio.run(cache.lookup(1, question))[0] == "Entropy..."
@@ -0,0 +1,79 @@
+import operator
+from typing import Annotated, List, TypedDict
+
+from langgraph.graph import StateGraph, END
+
+from app.graph.checkpoint import SqliteCheckpointSaver
+
+
+class State(TypedDict):
+    items: Annotated[List[str], operator.add]
+
+
+def _graph(saver):
+    sg = StateGraph(State)
+    sg.add_node("step", lambda s: {"items": [f"n{len(s['items'])}"]})
+    sg.set_entry_point("step")
+    sg.add_edge("step", END)
+    return sg.compile(checkpointer=saver)
+
+
+def _saver(path, **kw):
+    return SqliteCheckpointSaver(str(path), compact_interval=0, **kw)
+
+
+def test_state_survives_a_restart(tmp_path):
+    cfg = {"configurable": {"thread_id": "t1"}}
+    saver = _saver(tmp_path / "cp.sqlite")
+    _graph(saver).invoke({"items": ["a"]}, cfg)
+    saver.close()
+
+    saver = _saver(tmp_path / "cp.sqlite")              # fresh process, nothing cached
+    out = _graph(saver).invoke({"items": ["b"]}, cfg)
+    assert out["items"] == ["a", "n1", "b", "n3"]
+    saver.close()
+
+
+def test_compaction_keeps_last_n_and_expires_idle_threads(tmp_path):
+    saver = _saver(tmp_path / "cp.sqlite", keep_last=2)
+    graph = _graph(saver)
+    for i in range(5):
+        graph.invoke({"items": [str(i)]}, {"configurable": {"thread_id": "t1"}})
+    assert len(list(saver.list({"configurable": {"thread_id": "t1"}}))) > 2
+
+    saver.compact()
+    assert len(list(saver.list({"configurable": {"thread_id": "t1"}}))) == 2
+    assert len(graph.get_state({"configurable": {"thread_id": "t1"}}).values["items"]) == 10
+
+    saver.ttl = 1e-9                                     # everything is idle now
+    assert saver.compact()["expired"] == 1
+    assert saver.get_tuple({"configurable": {"thread_id": "t1"}}) is None
+    saver.close()
+
+
+def test_failed_write_is_rolled_back(tmp_path):
+    saver = _saver(tmp_path / "cp.sqlite")
+    saver._db().execute(
+        "CREATE TRIGGER fail BEFORE INSERT ON threads WHEN NEW.thread_id = 'bad' "
+        "BEGIN SELECT RAISE(ABORT, 'disk full'); END"
+    )
+    try:
+        _graph(saver).invoke({"items": ["a"]}, {"configurable": {"thread_id": "bad"}})
+    except Exception:
+        pass
+    assert saver._db().execute("SELECT COUNT(*) FROM checkpoints WHERE thread_id='bad'").fetchone() == (0,)
+    out = _graph(saver).invoke({"items": ["a"]}, {"configurable": {"thread_id": "ok"}})
+    assert out["items"] == ["a", "n1"]                   # connection not left inside a transaction
+    saver.close()
+
+
+def test_workers_only_expire_their_own_threads(tmp_path):
+    one = _saver(tmp_path / "cp.sqlite", owner="w0", ttl=1e-9)
+    two = _saver(tmp_path / "cp.sqlite", owner="w1", ttl=1e-9)
+    _graph(one).invoke({"items": ["a"]}, {"configurable": {"thread_id": "t1"}})
+    _graph(two).invoke({"items": ["b"]}, {"configurable": {"thread_id": "t2"}})
+
+    assert one.compact()["expired"] == 1
+    assert two.get_tuple({"configurable": {"thread_id": "t2"}}) is not None
+    one.close()
+    two.close()
@@ -0,0 +1,33 @@
+from app.rag.context_packer import SEPARATOR, merge_overlapping, pack_context
+
+TEXT = " ".join(f"word{i}" for i in range(400))
+
+
+def _split(text, size=600, overlap=150):
+    return [text[i:i + size] for i in range(0, len(text), size - overlap)]
+
+
+def test_overlapping_neighbours_are_stitched_back_together():
+    chunks = _split(TEXT)
+    assert len(chunks) > 2
+    assert merge_overlapping(list(reversed(chunks))) == [TEXT]
+
+
+def test_duplicates_collapse_and_unrelated_chunks_stay_separate():
+    a, b = "alpha " * 20, "omega " * 20
+    assert merge_overlapping([a, b, a.strip()]) == [a.strip(), b.strip()]
+
+
+def test_pack_keeps_whole_chunks_within_budget():
+    chunks = ["a" * 40, "b" * 100, "c" * 30]
+    packed = pack_context(chunks, "test-model", budget=80, count=len)
+    assert packed.text == "a" * 40 + SEPARATOR + "c" * 30
+    assert packed.tokens == 40 + len(SEPARATOR) + 30
+    assert (packed.used, packed.dropped) == (2, 1)
+
+
+def test_a_merged_span_over_budget_falls_back_to_its_chunks():
+    chunks = _split(TEXT)[:3]                        # stitches into one 1500-char span
+    packed = pack_context(chunks, "test-model", budget=700, count=len)
+    assert packed.text == chunks[0]                  # best-ranked piece instead of nothing
+    assert (packed.used, packed.dropped) == (1, 2)
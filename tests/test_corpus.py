@@ -0,0 +1,108 @@
+import threading
+from collections import OrderedDict
+
+import pytest
+
+from bench.fakes import FakeEmbeddings
+from bench.pdfs import make_pdf
+from app.config import settings
+from app.rag import corpus, ingest, retrieve_tool
+from app.rag.lexical import lexical
+from app.vector_store.base import get_shared_store, get_user_store
+from app.vector_store import mmap_store
+
+
+@pytest.fixture
+def env(tmp_path, monkeypatch):
+    embeddings = FakeEmbeddings(latency=0)
+    monkeypatch.setattr(settings, "vector_backend", "mmap")
+    monkeypatch.setattr(settings, "shared_corpus", True)
+    monkeypatch.setattr(settings, "shared_corpus_path", str(tmp_path / "corpus.sqlite"))
+    monkeypatch.setattr(mmap_store, "mmap_stores", mmap_store.MmapStoreManager(
+        tmp_path / "vectors", "float16", max_loaded=8, compact_ratio=0.3, hot_bytes=1 << 24))
+    monkeypatch.setattr(lexical, "root", tmp_path / "lexical")
+    monkeypatch.setattr(lexical, "_loaded", OrderedDict())
+    monkeypatch.setattr(ingest, "get_ingest_embeddings", lambda: embeddings)
+    monkeypatch.setattr(retrieve_tool, "get_embeddings", lambda: embeddings)
+    corpus.get_corpus.cache_clear()
+    yield embeddings
+    corpus.get_corpus().close()
+    corpus.get_corpus.cache_clear()
+
+
+def test_same_pdf_is_embedded_once_and_searchable_by_every_uploader(env, tmp_path):
+    pdf = make_pdf(tmp_path / "lecture.pdf", 3, seed=7)
+
+    first = ingest.store_pdf_path(pdf, 1, "lecture.pdf")
+    requests = env.requests
+    second = ingest.store_pdf_path(pdf, 2, "week1.pdf")
+    assert first.added > 0 and second.linked == first.added and second.added == 0
+    assert env.requests == requests                        # nothing embedded again
+    assert ingest.store_pdf_path(pdf, 2, "week1.pdf").unchanged
+
+    _, chunks = retrieve_tool._retrieve("lecture", 2, k=3)
+    assert chunks
+    _, none = retrieve_tool._retrieve("lecture", 3, k=3)   # never uploaded it
+    assert none == []
+
+
+def test_dropping_the_last_reference_collects_the_document(env, tmp_path):
+    pdf = make_pdf(tmp_path / "lecture.pdf", 2, seed=3)
+    ingest.store_pdf_path(pdf, 1, "a.pdf")
+    ingest.store_pdf_path(pdf, 2, "b.pdf")
+    shared = get_shared_store().count()
+
+    corpus.drop_tenant(1)
+    assert get_shared_store().count() == shared            # chat 2 still refers to it
+    corpus.drop_tenant(2)
+    assert get_shared_store().count() == 0
+    assert corpus.get_corpus().stats() == {"docs": 0, "chunks": 0, "refs": 0}
+
+
+class _FailsOnce(FakeEmbeddings):
+    """Fails its `fail_on`-th request, once."""
+
+    def __init__(self, fail_on):
+        super().__init__(latency=0)
+        self.fail_on = fail_on
+
+    def embed_documents(self, texts):
+        if self.requests + 1 == self.fail_on:
+            self.fail_on = None
+            self.requests += 1
+            raise RuntimeError("embedding API unavailable")
+        return super().embed_documents(texts)
+
+
+def test_partial_private_ingest_is_completed_by_the_retry(env, tmp_path, monkeypatch):
+    flaky = _FailsOnce(fail_on=3)
+    monkeypatch.setattr(settings, "shared_corpus", False)
+    monkeypatch.setattr(settings, "ingest_batch_size", 4)
+    monkeypatch.setattr(settings, "ingest_embed_workers", 1)
+    monkeypatch.setattr(ingest, "get_ingest_embeddings", lambda: flaky)
+    pdf = make_pdf(tmp_path / "notes.pdf", 4, seed=5)
+
+    first = ingest.store_pdf_path(pdf, 1, "notes.pdf")
+    partial = get_user_store(1).count()
+    retry = ingest.store_pdf_path(pdf, 1, "notes.pdf")
+    assert first.error and 0 < partial and not retry.unchanged
+    assert retry.chunks == get_user_store(1).count() > partial
+    assert ingest.store_pdf_path(pdf, 1, "notes.pdf").unchanged
+
+
+def test_doc_lock_excludes_other_processes(tmp_path):
+    # two registries on one file open the lock separately, like two shard workers
+    path = str(tmp_path / "corpus.sqlite")
+    a, b = corpus.CorpusRegistry(path), corpus.CorpusRegistry(path)
+    entered = threading.Event()
+
+    def other():
+        with b.doc_lock("ab12"):
+            entered.set()
+
+    with a.doc_lock("ab12"):
+        t = threading.Thread(target=other)
+        t.start()
+        assert not entered.wait(0.2)
+    assert entered.wait(2)
+    t.join()
@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from app.vector_store.embed_batcher import BatchingEmbeddings
+
+
+class RecordingEmbeddings(Embeddings):
+    """Vector = (text length, first char); fails any request containing "boom"."""
+
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        if "boom" in texts:
+            raise RuntimeError("upstream 500")
+        return [[float(len(t)), float(ord(t[0]))] for t in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def test_concurrent_callers_share_one_request_and_get_their_own_vectors():
+    inner = RecordingEmbeddings()
+    emb = BatchingEmbeddings(inner, window_ms=50)
+
+    async def run():
+        return await asyncio.gather(
+            emb.aembed_documents(["a", "bb"]),
+            emb.aembed_query("ccc"),
+            emb.aembed_documents(["dddd"]),
+        )
+
+    docs_1, query, docs_2 = asyncio.run(run())
+    assert inner.calls == [["a", "bb", "ccc", "dddd"]]
+    assert docs_1 == [[1.0, ord("a")], [2.0, ord("b")]]
+    assert query == [3.0, ord("c")]
+    assert docs_2 == [[4.0, ord("d")]]
+
+
+def test_a_failing_batch_only_fails_its_own_callers():
+    inner = RecordingEmbeddings()
+    emb = BatchingEmbeddings(inner, window_ms=50, max_inputs=2)
+
+    async def run():
+        return await asyncio.gather(
+            emb.aembed_query("boom"), emb.aembed_query("x"),   # first batch
+            emb.aembed_query("yy"), emb.aembed_query("zzz"),   # second batch
+            return_exceptions=True,
+        )
+
+    boom, x, yy, zzz = asyncio.run(run())
+    assert sorted(inner.calls) == [["boom", "x"], ["yy", "zzz"]]
+    assert isinstance(boom, RuntimeError) and isinstance(x, RuntimeError)
+    assert yy == [2.0, ord("y")] and zzz == [3.0, ord("z")]
+    with pytest.raises(RuntimeError):                         # later calls aren't poisoned
+        emb.embed_query("boom")
+    assert emb.embed_query("ok") == [2.0, ord("o")]
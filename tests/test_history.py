@@ -0,0 +1,92 @@
+import asyncio
+import threading
+import time
+
+from langchain_core.messages import AIMessage
+
+from app.agent import history
+from app.agent.history import SUMMARY_PREFIX, HistoryStore, SummarizingHistory
+
+
+class _Summarizer:
+    def __init__(self):
+        self.prompts = []
+
+    def invoke(self, prompt):
+        self.prompts.append(prompt)
+        return AIMessage(content=f"summary #{len(self.prompts)}")
+
+
+def _wait_folded(hist):
+    for _ in range(100):
+        if not hist._folding:
+            return
+        time.sleep(0.01)
+
+
+def test_window_stays_within_budget_and_older_turns_are_summarised(monkeypatch):
+    llm = _Summarizer()
+    monkeypatch.setattr("app.agent.runtime.get_llm", lambda model, temperature=0.2: llm)
+    hist = SummarizingHistory("tg:1", token_budget=200, summary_tokens=50, model="gpt-4.1-nano")
+
+    sizes = []
+    for i in range(30):
+        hist.add_user_message(f"question {i} " + "word " * 30)
+        hist.add_ai_message(f"answer {i} " + "word " * 30)
+        _wait_folded(hist)
+        sizes.append(hist._window_tokens)
+
+    msgs = hist.messages
+    assert max(sizes) <= 200 and len(sizes) == 30
+    assert msgs[0].type == "system" and msgs[0].content.startswith(SUMMARY_PREFIX)
+    assert msgs[1].type == "human" and "answer 29" in msgs[-1].content
+    assert llm.prompts and "question 0" in llm.prompts[0]
+    assert not hist._pending
+
+
+def test_idle_sessions_spill_to_disk_and_come_back(tmp_path, monkeypatch):
+    monkeypatch.setattr(history.settings, "history_token_budget", 1000)
+    store = HistoryStore(max_sessions=1, ttl=3600, spill_dir=str(tmp_path))
+    store.get("tg:1").add_user_message("what is entropy?")
+    store.get("tg:2")
+    assert store.sweep() == 1                        # tg:1 was pushed out of the LRU
+    assert len(store) == 1 and list(tmp_path.iterdir())
+
+    again = store.get("tg:1")
+    assert [m.content for m in again.messages] == ["what is entropy?"]
+
+
+def test_a_session_in_use_is_not_spilled(tmp_path, monkeypatch):
+    monkeypatch.setattr(history.settings, "history_token_budget", 1000)
+    store = HistoryStore(max_sessions=1, ttl=3600, spill_dir=str(tmp_path))
+    restored_on = []
+    restore = store._restore
+    monkeypatch.setattr(store, "_restore", lambda sid: restored_on.append(threading.current_thread()) or restore(sid))
+
+    async def turn():
+        async with store.session("tg:1") as hist:
+            hist.add_user_message("what is entropy?")
+            store.get("tg:2")
+            store.sweep()                            # over the bound, but tg:1 is mid-turn
+            hist.add_ai_message("a measure of disorder")
+        return hist
+
+    hist = asyncio.run(turn())
+    assert restored_on[0] is not threading.main_thread()   # disk work off the event loop
+    assert store.get("tg:1") is hist
+    assert [m.content for m in store.get("tg:1").messages] == ["what is entropy?", "a measure of disorder"]
+
+
+def test_a_session_being_spilled_is_handed_back(tmp_path, monkeypatch):
+    monkeypatch.setattr(history.settings, "history_token_budget", 1000)
+    store = HistoryStore(max_sessions=1, ttl=3600, spill_dir=str(tmp_path))
+    store.get("tg:1").add_user_message("what is entropy?")
+    with store._lock:
+        hist, gen = store._evict("tg:1")             # evicted, file not written yet
+    again = store.get("tg:1")
+    assert again is hist                             # not a fresh, empty restore
+    again.add_ai_message("a measure of disorder")
+    store._spill(hist, gen)                          # the stale spill is a no-op
+    assert not list(tmp_path.iterdir())
+    store.flush()
+    assert len(store.get("tg:1").messages) == 2
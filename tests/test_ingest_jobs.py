@@ -0,0 +1,139 @@
+import asyncio
+import json
+import shutil
+from collections import OrderedDict
+from types import SimpleNamespace
+
+import pytest
+
+from bench.fakes import FakeEmbeddings
+from bench.pdfs import make_pdf
+from app.bot.ingest_jobs import DONE, QUEUED, RUNNING, IngestJobs
+from app.config import settings
+from app.rag import corpus, ingest
+from app.rag.lexical import lexical
+from app.vector_store import mmap_store
+from app.vector_store.base import get_shared_store, get_user_store
+
+
+def _bot(pdf, sent):
+    async def get_file(file_id):
+        async def download_to_drive(custom_path):
+            shutil.copy(pdf, custom_path)
+        return SimpleNamespace(download_to_drive=download_to_drive)
+
+    async def edit_message_text(text, chat_id, message_id):
+        sent.append(text)
+
+    return SimpleNamespace(get_file=get_file, edit_message_text=edit_message_text)
+
+
+async def _until_done(jobs, job_id):
+    for _ in range(300):
+        if jobs.get(job_id).status == DONE:
+            break
+        await asyncio.sleep(0.02)
+    await jobs.stop()
+    return jobs.get(job_id)
+
+
+def test_claims_round_robin_across_chats_smallest_first(tmp_path):
+    jobs = IngestJobs(str(tmp_path / "jobs.sqlite"), str(tmp_path / "spool"), workers=2, small_bytes=1000)
+    big   = jobs.submit(1, "f1", "big.pdf", 50_000)
+    small = jobs.submit(1, "f2", "small.pdf", 500)
+    other = jobs.submit(2, "f3", "other.pdf", 800)
+
+    assert jobs.claim().id == small.id          # chat 1 first, its smallest file
+    assert jobs.claim().id == other.id          # chat 1 is busy → chat 2
+    assert jobs.claim() is None                 # one upload per chat at a time
+
+    jobs._release(jobs.get(small.id))
+    assert jobs.claim(large_ok=False) is None   # the small-file worker leaves big.pdf alone
+    assert jobs.claim().id == big.id
+
+    jobs._release(jobs.get(big.id))
+    jobs._release(jobs.get(other.id))
+    assert jobs._served == {}                   # nothing queued → nothing to remember
+
+
+def test_restart_requeues_interrupted_jobs(tmp_path):
+    path = str(tmp_path / "jobs.sqlite")
+    jobs = IngestJobs(path, str(tmp_path / "spool"))
+    job = jobs.submit(1, "f1", "a.pdf", 100)
+    assert jobs.claim().status == RUNNING
+
+    again = IngestJobs(path, str(tmp_path / "spool"))
+    assert again.recover() == 1
+    assert again.get(job.id).status == QUEUED
+    assert again.claim().id == job.id
+
+
+def test_failed_ingest_is_retried_and_user_notified(tmp_path, monkeypatch):
+    pdf = make_pdf(tmp_path / "a.pdf", 2, seed=1)
+    sent = []
+
+    calls = []
+    def store_pdf_path(path, chat_id, file_name, progress=None):
+        calls.append(path)
+        if len(calls) == 1:
+            return ingest.IngestResult(error="RateLimitError: slow down")
+        return ingest.IngestResult(added=7)
+    monkeypatch.setattr(ingest, "store_pdf_path", store_pdf_path)
+
+    async def run():
+        jobs = IngestJobs(str(tmp_path / "jobs.sqlite"), str(tmp_path / "spool"), workers=1, backoff=0.05)
+        job = jobs.submit(5, "file-1", "a.pdf", pdf.stat().st_size, message_id=42)
+        jobs.start(_bot(pdf, sent))
+        return await _until_done(jobs, job.id)
+
+    job = asyncio.run(run())
+    assert job.status == DONE and job.attempts == 2
+    assert len(calls) == 2
+    assert any("retrying" in t for t in sent)
+    assert sent[-1] == "Indexed 7 chunks from “a.pdf”. Ask away!"
+    assert not list((tmp_path / "spool").iterdir())   # spooled PDF removed once done
+
+
+class _FailsOnce(FakeEmbeddings):
+    def __init__(self, fail_on):
+        super().__init__(latency=0)
+        self.fail_on = fail_on
+
+    def embed_documents(self, texts):
+        self.requests += 1
+        if self.requests == self.fail_on:
+            raise RuntimeError("embedding API unavailable")
+        return [self._vec(t) for t in texts]
+
+
+@pytest.mark.parametrize("shared", [False, True])
+def test_retry_after_a_partial_ingest_indexes_every_chunk(tmp_path, monkeypatch, shared):
+    monkeypatch.setattr(settings, "vector_backend", "mmap")
+    monkeypatch.setattr(settings, "shared_corpus", shared)
+    monkeypatch.setattr(settings, "shared_corpus_path", str(tmp_path / "corpus.sqlite"))
+    monkeypatch.setattr(settings, "ingest_batch_size", 4)
+    monkeypatch.setattr(settings, "ingest_embed_workers", 1)
+    monkeypatch.setattr(mmap_store, "mmap_stores", mmap_store.MmapStoreManager(
+        tmp_path / "vectors", "float16", max_loaded=8, compact_ratio=0.3, hot_bytes=1 << 24))
+    monkeypatch.setattr(lexical, "root", tmp_path / "lexical")
+    monkeypatch.setattr(lexical, "_loaded", OrderedDict())
+    flaky = _FailsOnce(fail_on=3)
+    monkeypatch.setattr(ingest, "get_ingest_embeddings", lambda: flaky)
+    corpus.get_corpus.cache_clear()
+    pdf = make_pdf(tmp_path / "notes.pdf", 4, seed=5)
+    expected = len([c for c in ingest.iter_chunks(pdf) if c[0].strip()])
+
+    async def run():
+        jobs = IngestJobs(str(tmp_path / "jobs.sqlite"), str(tmp_path / "spool"), workers=1, backoff=0.05)
+        job = jobs.submit(9, "file-1", "notes.pdf", pdf.stat().st_size, message_id=1)
+        jobs.start(_bot(pdf, []))
+        return await _until_done(jobs, job.id)
+
+    try:
+        job = asyncio.run(run())
+    finally:
+        corpus.get_corpus().close()
+        corpus.get_corpus.cache_clear()
+    assert job.status == DONE and job.attempts == 2
+    stored = (get_shared_store() if shared else get_user_store(9)).count()
+    assert json.loads(job.result)["chunks"] == stored == expected
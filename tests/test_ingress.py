@@ -0,0 +1,78 @@
+import asyncio
+import json
+
+from telegram import Bot, Update
+from telegram.ext import Application, TypeHandler
+
+from bench.fakes import FakeTelegram, update_json
+from app.bot.ingress import (
+    TrackingUpdateProcessor, WebhookIngress, QUEUED, DUPLICATE, DROPPED, REJECTED, INVALID,
+)
+
+
+def _body(update_id):
+    return json.dumps({"update_id": update_id}).encode()
+
+
+def test_redeliveries_are_dropped_and_garbage_is_invalid():
+    ingress = WebhookIngress(asyncio.Queue(), None, "reject", dedup_size=100, max_pending=10)
+    assert ingress.accept(_body(1)) == QUEUED
+    assert ingress.accept(_body(1)) == DUPLICATE
+    assert ingress.accept(b"{not json") == INVALID
+    assert ingress.accept(json.dumps({"update_id": 2, "message": {"chat": 5}}).encode()) == INVALID
+    assert ingress.queue.qsize() == 1
+
+
+def test_overflow_policies():
+    reject = WebhookIngress(asyncio.Queue(), None, "reject", dedup_size=100, max_pending=1)
+    reject.accept(_body(1))
+    assert reject.accept(_body(2)) == REJECTED
+    reject._done(reject.queue.get_nowait())
+    assert reject.accept(_body(2)) == QUEUED          # Telegram's retry is accepted
+
+    drop_new = WebhookIngress(asyncio.Queue(), None, "drop_new", dedup_size=100, max_pending=1)
+    drop_new.accept(_body(1))
+    assert drop_new.accept(_body(2)) == DROPPED
+    assert drop_new.queue.get_nowait().update_id == 1
+
+    drop_oldest = WebhookIngress(asyncio.Queue(), None, "drop_oldest", dedup_size=100, max_pending=1)
+    drop_oldest.accept(_body(1))
+    assert drop_oldest.accept(_body(2)) == QUEUED
+    assert drop_oldest.queue.get_nowait().update_id == 2
+    assert drop_oldest.accept(_body(3)) == REJECTED   # update 2 is "running": nothing to evict
+
+
+def test_running_updates_count_against_the_bound(monkeypatch):
+    telegram = FakeTelegram()
+    monkeypatch.setattr(Bot, "_do_post", lambda bot, endpoint, data, **kw: telegram.do_post(bot, endpoint, data, **kw))
+
+    async def run():
+        release = asyncio.Event()
+        started = []
+
+        async def handler(update, _):
+            started.append(update.update_id)
+            await release.wait()
+
+        tg = (Application.builder().token("123:test").updater(None)
+              .concurrent_updates(TrackingUpdateProcessor(64)).build())
+        tg.add_handler(TypeHandler(Update, handler))
+        ingress = WebhookIngress(tg.update_queue, tg.bot, "reject", dedup_size=100,
+                                 max_pending=2, processor=tg.update_processor)
+        async with tg:
+            await tg.start()
+            outcomes = [ingress.accept(json.dumps(update_json(i, 7, "hi")).encode()) for i in (1, 2, 3)]
+            await asyncio.sleep(0.05)
+            assert tg.update_queue.qsize() == 0 and started == [1, 2]   # PTB drained the queue...
+            assert outcomes == [QUEUED, QUEUED, REJECTED]                # ...the ingress still held
+            assert ingress.accept(json.dumps(update_json(3, 7, "hi")).encode()) == REJECTED
+
+            release.set()
+            await asyncio.sleep(0.05)
+            assert ingress.pending == 0
+            assert ingress.accept(json.dumps(update_json(3, 7, "hi")).encode()) == QUEUED
+            await asyncio.sleep(0.05)
+            await tg.stop()
+        return started
+
+    assert asyncio.run(run()) == [1, 2, 3]
@@ -0,0 +1,68 @@
+from app.rag.lexical import LexicalIndex, LexicalStore, reciprocal_rank_fusion, tokenize
+
+
+def test_tokenize_keeps_exact_terms():
+    assert tokenize("Explain Theorem 2.3 from CS-101") == ["theorem", "2.3", "cs-101"]
+
+
+def test_bm25_ranks_exact_term_and_survives_reload(tmp_path):
+    path = tmp_path / "user_1.jsonl.gz"
+    index = LexicalIndex(path)
+    index.add(
+        ["a", "b", "c"],
+        ["Theorem 2.3 states the limit exists.", "Lemma 4.1 about series.", "Definition of a limit."],
+        [{"page": 1}, {"page": 2}, {"page": 3}],
+    )
+    assert index.search("theorem 2.3", k=1)[0][0] == "a"
+
+    index.remove(["a"])
+    index.save()
+    reloaded = LexicalIndex.load(path)
+    assert len(reloaded) == 2
+    assert [i for i, _ in reloaded.search("limit", k=3)] == ["c"]
+
+
+def test_reciprocal_rank_fusion_prefers_agreement():
+    assert reciprocal_rank_fusion([["x", "y", "z"], ["y", "w"]])[0] == "y"
+
+
+def test_save_appends_changes_and_compacts_a_stale_log(tmp_path, monkeypatch):
+    monkeypatch.setattr(LexicalIndex, "MIN_REWRITE", 4)
+    path = tmp_path / "user_1.jsonl.gz"
+    index = LexicalIndex(path)
+    index.add(["a", "b"], ["alpha", "beta"], [{}, {}])
+    index.save()
+    size = path.stat().st_size
+    index.add(["c"], ["gamma"], [{}])
+    index.remove(["a"])
+    index.save()                                          # 4 records: appended
+    assert path.stat().st_size > size and index._records == 4
+    assert sorted(LexicalIndex.load(path).docs) == ["b", "c"]
+
+    index.remove(["b"])
+    index.save()                                          # 5 > 2 × 1 live: rewritten
+    assert index._records == 1
+    assert list(LexicalIndex.load(path).docs) == ["c"]
+
+
+def test_a_torn_append_keeps_what_was_saved(tmp_path):
+    path = tmp_path / "user_1.jsonl.gz"
+    index = LexicalIndex(path)
+    index.add(["a"], ["alpha"], [{}])
+    index.save()
+    with open(path, "ab") as f:
+        f.write(b"\x1f\x8b\x08\x00garbage")               # crash mid-append
+    reloaded = LexicalIndex.load(path)
+    assert list(reloaded.docs) == ["a"]
+    reloaded.add(["b"], ["beta"], [{}])
+    reloaded.save()
+    assert sorted(LexicalIndex.load(path).docs) == ["a", "b"]
+
+
+def test_an_index_still_in_use_is_handed_back_after_eviction(tmp_path):
+    store = LexicalStore(tmp_path, max_loaded=1)
+    held = store.get(1)                                   # e.g. an ingest run between batches
+    store.get(2)                                          # pushes tenant 1 out of the LRU
+    held.add(["a"], ["alpha"], [{}])
+    assert store.get(1) is held                           # not a second copy from disk
+    assert store.get(1).search("alpha")[0][0] == "a"
@@ -0,0 +1,42 @@
+import asyncio
+
+from app.metrics import Counter, Gauge, Histogram, Registry, span, timed
+
+
+def test_prometheus_text_format():
+    registry = Registry()
+    hits = registry.register(Counter("t_hits_total", "Hits.", ["result"]))
+    depth = registry.register(Gauge("t_depth", "Depth.", fn=lambda: {(): 3}))
+    lat = registry.register(Histogram("t_seconds", "Latency.", ["op"], buckets=(0.1, 1.0)))
+
+    hits.inc(1, "hit")
+    hits.inc(2, "miss")
+    lat.observe(0.05, "query")
+    lat.observe(0.5, "query")
+    lat.observe(5.0, "query")
+
+    text = registry.render()
+    assert "# TYPE t_hits_total counter" in text
+    assert 't_hits_total{result="miss"} 2' in text
+    assert "t_depth 3" in text
+    assert 't_seconds_bucket{op="query",le="0.1"} 1' in text
+    assert 't_seconds_bucket{op="query",le="1"} 2' in text
+    assert 't_seconds_bucket{op="query",le="+Inf"} 3' in text
+    assert 't_seconds_count{op="query"} 3' in text
+    assert depth.kind == "gauge"
+
+
+def test_span_and_timed_record_even_on_error():
+    lat = Histogram("t_span_seconds", "Latency.", ["node"])
+
+    @timed(lat, "async")
+    async def node():
+        return 1
+
+    assert asyncio.run(node()) == 1
+    try:
+        with span(lat, "sync"):
+            raise ValueError
+    except ValueError:
+        pass
+    assert lat.count("async") == 1 and lat.count("sync") == 1
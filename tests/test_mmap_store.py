@@ -0,0 +1,45 @@
+import numpy as np
+
+from app.vector_store.mmap_store import MmapCollection
+
+DIM = 16
+
+
+def _vecs(n, seed=0):
+    return np.random.default_rng(seed).normal(size=(n, DIM)).astype(np.float32)
+
+
+def _store(tmp_path, dtype="float16"):
+    return MmapCollection(tmp_path / "user_1", dtype, compact_ratio=0.5)
+
+
+def test_query_ranks_nearest_first_and_filters(tmp_path):
+    for dtype in ("float16", "int8"):
+        store = _store(tmp_path / dtype, dtype)
+        vecs = _vecs(50)
+        ids = [f"c{i}" for i in range(50)]
+        store.upsert(ids, vecs, [f"text {i}" for i in ids],
+                     [{"source": "a.pdf" if i % 2 else "b.pdf"} for i in range(50)])
+        hits = store.query(vecs[7], 3)
+        assert hits[0].id == "c7" and hits[0].score > 0.99
+        assert [h.score for h in hits] == sorted((h.score for h in hits), reverse=True)
+        filtered = store.query(vecs[8], 5, where={"source": "a.pdf"})
+        assert len(filtered) == 5 and all(int(h.id[1:]) % 2 for h in filtered)
+
+
+def test_upserts_deletes_and_compaction_survive_reload(tmp_path):
+    store = _store(tmp_path)
+    vecs = _vecs(10)
+    store.upsert([f"c{i}" for i in range(10)], vecs, [str(i) for i in range(10)], [{}] * 10)
+    store.upsert(["c0"], _vecs(1, seed=1), ["zero v2"], [{"v": 2}])
+    store.update(["c1"], [{"page": 3}])
+    store.delete([f"c{i}" for i in range(5, 10)])          # crosses compact_ratio
+    assert store.gen == 1
+
+    store = _store(tmp_path)                                # fresh load from disk
+    assert store.count() == 5
+    got = store.get(ids=["c0", "c1", "c9"])
+    assert got["ids"] == ["c0", "c1"]
+    assert got["documents"][0] == "zero v2"
+    assert got["metadatas"][1] == {"page": 3}
+    assert store.query(vecs[2], 1)[0].id == "c2"
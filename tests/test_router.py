@@ -0,0 +1,35 @@
+import asyncio
+
+from app.config import settings
+from app.graph import router
+from app.rag.lexical import LexicalIndex
+
+
+def _index(tmp_path):
+    index = LexicalIndex(tmp_path / "user_1.jsonl.gz")
+    texts = [
+        "The Carnot cycle bounds the efficiency of any heat engine by its reservoir temperatures.",
+        "Early airplanes were built from wood and fabric.",
+        "Objects stay at rest unless a force acts on them.",
+        "Hot air rises because it is less dense than the surrounding air.",
+        "Entropy of an isolated system never decreases.",
+    ] + [f"Filler paragraph {i} about units and measurement." for i in range(20)]
+    index.add([str(i) for i in range(len(texts))], texts, [{}] * len(texts))
+    return index
+
+
+def test_routes_on_relevance_not_vocabulary(tmp_path, monkeypatch):
+    index = _index(tmp_path)
+    monkeypatch.setattr(settings, "router_vector_probe", False)
+    monkeypatch.setattr(router.lexical, "is_loaded", lambda chat_id: True)
+    monkeypatch.setattr(router.lexical, "get", lambda chat_id: index)
+
+    def target(q):
+        return asyncio.run(router.route(1, q)).target
+
+    # every term occurs somewhere in the "book", but in different chunks
+    assert index.best_match("how do airplanes stay in the air") < settings.router_lexical_match
+    assert target("how do airplanes stay in the air") == router.DECIDE
+    assert target("what bounds carnot heat engine efficiency") == router.TOOLS
+    assert target("what does the book say about gravity") == router.DECIDE   # no longer a keyword hit
+    assert target("explain theorem 2.3") == router.TOOLS
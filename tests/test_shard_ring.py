@@ -0,0 +1,28 @@
+import asyncio
+
+from app.shard.dispatcher import Dispatcher, shard_key, worker_names
+from app.shard.ring import HashRing
+
+
+def test_adding_a_worker_only_remaps_its_share():
+    chats = range(20_000)
+    before = HashRing(worker_names(4))
+    after  = HashRing(worker_names(5))
+    moved = [c for c in chats if before.node_for(c) != after.node_for(c)]
+    assert all(after.node_for(c) == "worker-4" for c in moved)
+    assert 0.12 < len(moved) / len(chats) < 0.28          # ~1/5
+
+    after.remove("worker-4")
+    assert all(before.node_for(c) == after.node_for(c) for c in chats)
+
+
+def test_updates_shard_by_chat():
+    msg = {"update_id": 1, "message": {"chat": {"id": 42}, "from": {"id": 7}}}
+    cbq = {"update_id": 2, "callback_query": {"from": {"id": 7}, "message": {"chat": {"id": 42}}}}
+    assert shard_key(msg) == shard_key(cbq) == 42
+
+
+def test_non_object_bodies_are_rejected_before_forwarding():
+    dispatcher = Dispatcher(worker_names(2), "/nonexistent", vnodes=8)
+    for body in (b"[]", b"1", b'"x"', b"{}", b"{not json"):
+        assert asyncio.run(dispatcher.forward(body)).status_code == 400
@@ -0,0 +1,102 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+from app.graph import graph_builder
+from app.graph.speculation import SpeculativeRetrievals
+
+QUESTION = "Explain theorem 2.3 from my notes"
+
+
+class _Retriever:
+    def __init__(self, fail_first=False):
+        self.calls, self.cancelled = [], []
+        self.fail_first = fail_first
+
+    async def __call__(self, question, chat_id, k=graph_builder.DEFAULT_K):
+        self.calls.append(question)
+        try:
+            await asyncio.sleep(0.02)
+        except asyncio.CancelledError:
+            self.cancelled.append(question)
+            raise
+        if self.fail_first and len(self.calls) == 1:
+            raise RuntimeError("vector store timeout")
+        return "header", [f"chunk about {question}"]
+
+
+@pytest.fixture
+def spec(monkeypatch):
+    monkeypatch.setattr(graph_builder.settings, "speculative_retrieval", True)
+    tracker = SpeculativeRetrievals()
+    monkeypatch.setattr(graph_builder, "speculation", tracker)
+    return tracker
+
+
+def _turn(monkeypatch, retriever, decide):
+    monkeypatch.setattr(graph_builder, "retrieve", SimpleNamespace(coroutine=retriever))
+
+    class _LLM:
+        async def ainvoke(self, msgs):
+            await asyncio.sleep(0.01)
+            return decide()
+    monkeypatch.setattr(graph_builder, "_llm_with_tools", lambda: _LLM())
+
+    async def run():
+        state = {"messages": [HumanMessage(content=QUESTION)], "chat_id": 7, "question": QUESTION}
+        out = await graph_builder.query_or_respond(state)
+        state["messages"] += out["messages"]
+        tools = await graph_builder.run_tools(state)
+        await asyncio.sleep(0.05)                        # let cancelled tasks settle
+        return tools["messages"]
+    return asyncio.run(run())
+
+
+def _call(question, k=graph_builder.DEFAULT_K):
+    return AIMessage(content="", tool_calls=[
+        {"name": "retrieve", "args": {"question": question, "k": k}, "id": "c1"}])
+
+
+def test_matching_tool_call_reuses_the_speculative_task(monkeypatch, spec):
+    retriever = _Retriever()
+    out = _turn(monkeypatch, retriever, lambda: _call(QUESTION))
+    assert retriever.calls == [QUESTION]                 # one retrieval, started before decide returned
+    assert out[0].content == f"chunk about {QUESTION}"
+    assert spec.stats() == {"started": 1, "hit": 1, "miss": 0, "cancelled": 0,
+                            "in_flight": 0, "hit_rate": 1.0}
+
+
+def test_different_tool_args_cancel_it_and_retrieve_for_real(monkeypatch, spec):
+    retriever = _Retriever()
+    out = _turn(monkeypatch, retriever, lambda: _call("theorem 2.3 proof", k=8))
+    assert retriever.calls == [QUESTION, "theorem 2.3 proof"]
+    assert retriever.cancelled == [QUESTION]
+    assert out[0].content == "chunk about theorem 2.3 proof"
+    assert (spec.counts["miss"], spec.hit_rate) == (1, 0.0)
+
+
+def test_a_direct_answer_cancels_it(monkeypatch, spec):
+    retriever = _Retriever()
+    out = _turn(monkeypatch, retriever, lambda: AIMessage(content="It says limits exist."))
+    assert out == [] and retriever.cancelled == [QUESTION]
+    assert spec.counts["cancelled"] == 1 and spec.stats()["in_flight"] == 0
+
+
+def test_a_failing_decide_cancels_it(monkeypatch, spec):
+    retriever = _Retriever()
+
+    def decide():
+        raise RuntimeError("LLM unavailable")
+    with pytest.raises(RuntimeError):
+        _turn(monkeypatch, retriever, decide)
+    assert spec.counts["cancelled"] == 1 and spec.stats()["in_flight"] == 0
+
+
+def test_a_failed_speculative_retrieve_falls_back_to_a_real_one(monkeypatch, spec):
+    retriever = _Retriever(fail_first=True)
+    out = _turn(monkeypatch, retriever, lambda: _call(QUESTION))
+    assert retriever.calls == [QUESTION, QUESTION]
+    assert out[0].content == f"chunk about {QUESTION}"
+    assert spec.counts["hit"] == 1
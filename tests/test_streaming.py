@@ -0,0 +1,68 @@
+import asyncio
+
+from app.bot.streaming import ReplyStreamer, TG_MAX_CHARS
+
+
+class FakeMessage:
+    def __init__(self, sent):
+        self.sent = sent
+        self.text = ""
+
+    async def reply_text(self, text):
+        msg = FakeMessage(self.sent)
+        msg.text = text
+        self.sent.append(msg)
+        return msg
+
+    async def edit_text(self, text):
+        self.text = text
+
+    async def delete(self):
+        self.sent.remove(self)
+
+
+def test_edits_are_coalesced_and_final_text_is_exact():
+    sent = []
+    st = ReplyStreamer(FakeMessage(sent), interval=3600, min_chars=1)
+
+    async def run():
+        await st.start()
+        for tok in ["Hel", "lo ", "world"]:
+            await st.push(tok)
+        await st.finish()
+
+    asyncio.run(run())
+    assert len(sent) == 1
+    assert sent[0].text == "Hello world"   # first push edits, the rest wait for finish
+
+
+def test_long_answer_rolls_over_into_new_messages():
+    sent = []
+    st = ReplyStreamer(FakeMessage(sent), interval=0, min_chars=1)
+    answer = "x" * (TG_MAX_CHARS * 2 + 10)
+
+    async def run():
+        await st.start()
+        for i in range(0, len(answer), 500):
+            await st.push(answer[i:i + 500])
+        await st.finish()
+
+    asyncio.run(run())
+    assert [len(m.text) for m in sent] == [TG_MAX_CHARS, TG_MAX_CHARS, 10]
+    assert "".join(m.text for m in sent) == answer
+
+
+def test_answer_after_a_reset_replaces_the_preamble_right_away():
+    sent = []
+    st = ReplyStreamer(FakeMessage(sent), interval=0, min_chars=5)
+
+    async def run():
+        await st.start()
+        await st.push("Let me look that up in your notes for you.")
+        st.reset()                                   # decide's preamble is discarded
+        await st.push("Entropy")
+        assert sent[0].text.startswith("Entropy")    # not held back until it outgrows the preamble
+        await st.finish()
+
+    asyncio.run(run())
+    assert sent[0].text == "Entropy" and st.text == "Entropy"
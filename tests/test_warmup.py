@@ -0,0 +1,42 @@
+import asyncio
+import time
+
+from app import warmup as warmup_mod
+from app.warmup import Warmup
+
+
+def _run(monkeypatch, load, events):
+    monkeypatch.setattr(warmup_mod.settings, "warmup_connect", False)
+    monkeypatch.setattr(warmup_mod, "_load_modules", load)
+    monkeypatch.setattr(warmup_mod, "_prime_tokenizer", lambda: None)
+
+    async def init():
+        events.append("init")
+
+    async def start():
+        events.append("start")
+
+    async def go():
+        w = Warmup()
+        w.start(init, start)
+        return await w.wait(5), w
+
+    return asyncio.run(go())
+
+
+def test_ptb_starts_only_after_the_modules_loaded(monkeypatch):
+    events = []
+    def load():
+        time.sleep(0.05)
+        events.append("modules")
+    ready, _ = _run(monkeypatch, load, events)
+    assert ready and events == ["init", "modules", "start"]
+
+
+def test_ptb_stays_stopped_when_the_modules_fail(monkeypatch):
+    events = []
+    def load():
+        raise ImportError("no pypdf")
+    ready, w = _run(monkeypatch, load, events)
+    assert not ready and events == ["init"]
+    assert not w.steps["telegram"]["ok"]